@@ -0,0 +1,171 @@
+"""Допуск команд при наплыве зрителей: рейды, хайп-трейны.
+
+Перед выполнением команда проходит три проверки:
+- ведро токенов автора — один зритель не может заспамить бота, лишние команды молча отбрасываются;
+- общий лимит одновременно выполняемых команд — остальные ждут в очереди по приоритету:
+  команды, меняющие состояние (WRITE), раньше команд только для чтения (READ);
+- очередь ограничена: когда она полна, новая команда вытесняет самую свежую команду
+  более низкого класса, а если вытеснять некого — отбрасывается сама.
+Одинаковые команды чтения, которые уже ждут в очереди (например, десяток !топ), склеиваются
+в одну: ответ увидят все.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+from outbound import TokenBucket
+
+WRITE, READ = 0, 1  # классы приоритета: чем меньше, тем раньше
+
+
+class Ticket:
+    """Команда, ожидающая места в очереди."""
+
+    __slots__ = ('priority', 'seq', 'key', 'future', 'created')
+
+    def __init__(self, priority, seq, key):
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.future = asyncio.get_running_loop().create_future()
+        self.created = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionMetrics:
+    """Счётчики допуска: выполненные, отброшенные по лимиту зрителя и по перегрузке, склеенные."""
+
+    def __init__(self):
+        self.admitted = 0
+        self.throttled = 0
+        self.shed = 0
+        self.coalesced = 0
+        self.max_waiting = 0
+        self.wait_max = 0.0
+
+
+class Admission:
+    """Допуск команд: ведро на зрителя, лимит одновременных команд и очередь с приоритетами."""
+
+    def __init__(self, user_rate=0.5, user_burst=3, max_running=8, max_waiting=50):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_running = max_running
+        self.max_waiting = max_waiting
+        self.buckets = {}  # зритель -> TokenBucket
+        self.prune_at = 1024
+        self.running = 0
+        self.waiting = []  # куча Ticket
+        self.coalescing = {}  # ключ склейки -> ожидающий Ticket
+        self.seq = itertools.count()
+        self.metrics = AdmissionMetrics()
+
+    def take_user_token(self, user):
+        """Списать токен зрителя; False — зритель шлёт команды чаще, чем разрешено."""
+        bucket = self.buckets.get(user)
+        if bucket is None:
+            if len(self.buckets) >= self.prune_at:
+                self.prune()
+            bucket = self.buckets[user] = TokenBucket(self.user_burst, self.user_rate)
+        if bucket.delay():
+            return False
+        bucket.take()
+        return True
+
+    def prune(self):
+        """Забыть зрителей с полным ведром: для них новое ведро ничем не отличается от старого."""
+        for user, bucket in list(self.buckets.items()):
+            bucket.refill()
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[user]
+        self.prune_at = max(1024, len(self.buckets) * 2)
+
+    async def run(self, user, priority, key, handler):
+        """Выполнить handler(), если команда допущена. key — ключ склейки команды чтения или None."""
+        m = self.metrics
+        if not self.take_user_token(user):
+            m.throttled += 1
+            return
+        if key is not None and key in self.coalescing:
+            m.coalesced += 1
+            return
+        if self.running < self.max_running and not self.waiting:
+            self.running += 1
+        elif not await self.wait(priority, key):
+            return
+        m.admitted += 1
+        try:
+            await handler()
+        finally:
+            self.running -= 1
+            self.release()
+
+    async def wait(self, priority, key):
+        """Встать в очередь. True — место получено и уже учтено в self.running."""
+        m = self.metrics
+        if len(self.waiting) >= self.max_waiting and not self.evict(priority):
+            m.shed += 1
+            return False
+        ticket = Ticket(priority, next(self.seq), key)
+        heapq.heappush(self.waiting, ticket)
+        if key is not None:
+            self.coalescing[key] = ticket
+        m.max_waiting = max(m.max_waiting, len(self.waiting))
+        try:
+            admitted = await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled() and ticket.future.result():
+                # Место уже выдано, но команда отменена — вернуть его следующему
+                self.running -= 1
+                self.release()
+            else:
+                self.forget(ticket)
+            raise
+        if admitted:
+            m.wait_max = max(m.wait_max, time.monotonic() - ticket.created)
+        return admitted
+
+    def evict(self, priority):
+        """Вытеснить самую свежую ожидающую команду класса ниже priority. False — вытеснять некого."""
+        worst = max(self.waiting)
+        if worst.priority <= priority:
+            return False
+        self.forget(worst)
+        worst.future.set_result(False)
+        self.metrics.shed += 1
+        return True
+
+    def forget(self, ticket):
+        if ticket in self.waiting:
+            self.waiting.remove(ticket)
+            heapq.heapify(self.waiting)
+        if ticket.key is not None and self.coalescing.get(ticket.key) is ticket:
+            del self.coalescing[ticket.key]
+
+    def release(self):
+        """Отдать свободные места первым в очереди."""
+        while self.running < self.max_running and self.waiting:
+            ticket = heapq.heappop(self.waiting)
+            if ticket.key is not None and self.coalescing.get(ticket.key) is ticket:
+                del self.coalescing[ticket.key]
+            if ticket.future.done():
+                continue
+            self.running += 1
+            ticket.future.set_result(True)
+
+    def stats(self):
+        """Счётчики для логов и мониторинга."""
+        m = self.metrics
+        return {
+            'admitted': m.admitted,
+            'throttled': m.throttled,
+            'shed': m.shed,
+            'coalesced': m.coalesced,
+            'running': self.running,
+            'waiting': len(self.waiting),
+            'max_waiting': m.max_waiting,
+            'wait_max': m.wait_max,
+        }
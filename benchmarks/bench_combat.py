@@ -0,0 +1,89 @@
+"""Бой с монстром: пошаговый цикл, как было в cmd_fight, против resolve_fight из combat.py.
+
+Для нескольких типичных боёв сравниваются распределения исходов (победа, число раундов,
+оставшееся HP) обеих реализаций и время одного боя. Короткие бои resolve_fight сам
+проводит циклом (combat.LOOP_ROUNDS), пакетный бросок работает только в долгих. Распределения сравниваются критерием
+хи-квадрат; при заметном расхождении скрипт завершается с ошибкой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_combat [число боёв]
+По умолчанию — 200 000 боёв на сценарий.
+"""
+import math
+import random
+import sys
+from collections import Counter
+
+from benchmarks.bench_snapshot import timed
+from combat import Damage, calculate_damage, resolve_fight
+
+# (название, уровень, бонус атаки, множитель, HP игрока, HP монстра, атака монстра)
+SCENARIOS = [
+    ('новичок против волка', 1, (0, 0), 1.0, 30, 40, 8),
+    ('равный бой', 5, (2, 5), 1.0, 60, 70, 12),
+    ('с баффом таверны', 8, (3, 8), 1.1, 85, 110, 15),
+    ('высокий уровень против слизи', 40, (10, 20), 1.0, 250, 900, 3),
+    ('затяжной бой', 20, (0, 2), 1.0, 400, 3000, 5),
+]
+
+
+def loop_fight(rng, level, bonus, multiplier, current_hp, monster_hp, monster_attack):
+    """Бой так, как его считал цикл в cmd_fight."""
+    rounds = 0
+    while monster_hp > 0 and current_hp > 0:
+        rounds += 1
+        monster_hp -= int((calculate_damage(level, rng) + rng.randint(*bonus)) * multiplier)
+        if monster_hp <= 0:
+            break
+        current_hp -= monster_attack
+    return current_hp > 0, rounds, current_hp
+
+
+def batched_fight(rng, level, bonus, multiplier, current_hp, monster_hp, monster_attack):
+    result = resolve_fight(current_hp, Damage.for_attack(level, *bonus, multiplier),
+                           monster_hp, Damage.constant(monster_attack), rng)
+    return result.a_won, result.rounds, result.hp_a
+
+
+def chi_square(observed, expected):
+    """Статистика хи-квадрат однородности двух выборок одинакового размера и число степеней свободы."""
+    outcomes = set(observed) | set(expected)
+    statistic = sum((observed[o] - expected[o]) ** 2 / (observed[o] + expected[o]) for o in outcomes)
+    return statistic, max(len(outcomes) - 1, 1)
+
+
+def critical_value(df):
+    """Приближённый 99.9%-й квантиль хи-квадрат (Уилсон — Хилферти)."""
+    z = 3.09
+    return df * (1 - 2 / (9 * df) + z * math.sqrt(2 / (9 * df))) ** 3
+
+
+def run(scenario, fights):
+    name, *args = scenario
+    outcomes = []
+    for fight in (loop_fight, batched_fight):
+        rng = random.Random(fight.__name__)
+        seconds, results = timed(lambda: Counter(fight(rng, *args) for _ in range(fights)))
+        outcomes.append((seconds, results))
+    (loop_s, loop_results), (batched_s, batched_results) = outcomes
+    statistic, df = chi_square(batched_results, loop_results)
+    wins = sum(count for (won, _, _), count in batched_results.items() if won) / fights
+    return name, wins, loop_s / fights, batched_s / fights, statistic, df
+
+
+def main():
+    fights = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f'{"сценарий":<30} {"побед":>6} {"цикл, мкс":>10} {"resolve_fight, мкс":>18} {"хи-квадрат / df":>18}')
+    failed = False
+    for scenario in SCENARIOS:
+        name, wins, loop_s, batched_s, statistic, df = run(scenario, fights)
+        ok = statistic <= critical_value(df)
+        failed |= not ok
+        print(f'{name:<30} {wins:>6.1%} {loop_s * 1e6:>10.1f} {batched_s * 1e6:>18.1f} '
+              f'{f"{statistic:.0f} / {df}":>18}{"" if ok else "  РАСХОЖДЕНИЕ"}')
+    if failed:
+        sys.exit('Распределения исходов боя расходятся')
+
+
+if __name__ == '__main__':
+    main()
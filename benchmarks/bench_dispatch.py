@@ -0,0 +1,107 @@
+"""Пропускная способность разбора сообщений: всё через twitchio против отсева dispatch.is_command.
+
+Поток чата смешанный: обычные сообщения, известные команды с аргументами и команды, которых
+у бота нет. Для каждой доли команд печатается, сколько сообщений в секунду проходит через
+event_message без отсева (как было) и с ним.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_dispatch [число сообщений]
+По умолчанию — 200 000 сообщений на каждую смесь.
+"""
+import asyncio
+import contextlib
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from twitchio.ext import commands
+from twitchio.message import Message
+
+from dispatch import PREFIX, Nick, Text, Word, command, is_command
+
+VIEWERS = 500
+CHAT = ['привет', 'gg', 'KEKW', 'ахаха', 'стример, сыграй ещё', 'lol', 'это был лучший бой', '@viewer_1 ну ты даёшь']
+COMMANDS = ['!бой', '!бой волк', '!статус', '!статус @viewer_7', '!кража @viewer_3 Железный шлем', '!снять weapon']
+UNKNOWN = ['!привет', '!лурк', '!so @viewer_2']
+# (доля известных команд, доля неизвестных команд)
+MIXES = [(0.02, 0.01), (0.10, 0.03), (0.30, 0.05)]
+
+
+class BenchBot(commands.Bot):
+    """Бот с командами на dispatch.command, обработчики которых ничего не делают."""
+
+    def __init__(self, prefilter):
+        super().__init__(token='bench', prefix=PREFIX, initial_channels=[])
+        self.prefilter = prefilter
+        self.players = {f'viewer_{i}': None for i in range(VIEWERS)}
+        self.handled = 0
+
+    async def event_message(self, message):
+        if message.echo or self.prefilter and not is_command(message, self.commands):
+            return
+        await self.handle_commands(message)
+
+    async def event_command_error(self, context, error):
+        pass  # без отсева сюда попадает каждая неизвестная команда
+
+    async def load_players_for(self, ctx, *names):
+        pass
+
+    def transaction(self, *users):
+        return contextlib.nullcontext()
+
+    @command('бой', Word('монстр', optional=True), requires_character=True)
+    async def cmd_fight(self, ctx, monster_name):
+        self.handled += 1
+
+    @command('статус', Nick('ник', optional=True))
+    async def cmd_status(self, ctx, target):
+        self.handled += 1
+
+    @command('кража', Nick('ник'), Text('предмет'), requires_character=True)
+    async def cmd_steal(self, ctx, target, item_name):
+        self.handled += 1
+
+    @command('снять', Word('слот'), requires_character=True)
+    async def cmd_unequip(self, ctx, slot):
+        self.handled += 1
+
+
+def make_messages(count, known, unknown, rng):
+    """Синтетический поток чата с заданными долями известных и неизвестных команд."""
+    channel = SimpleNamespace(name='bench')
+    authors = [SimpleNamespace(name=f'viewer_{i}', _ws=None) for i in range(VIEWERS)]
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        pool = COMMANDS if roll < known else UNKNOWN if roll < known + unknown else CHAT
+        messages.append(Message(content=rng.choice(pool), author=rng.choice(authors), channel=channel, tags={}))
+    return messages
+
+
+async def run(count, known, unknown):
+    messages = make_messages(count, known, unknown, random.Random(count))
+    rates = []
+    for prefilter in (False, True):
+        bot = BenchBot(prefilter)
+        started = time.perf_counter()
+        for message in messages:
+            await bot.event_message(message)
+        seconds = time.perf_counter() - started
+        await asyncio.sleep(0)  # дать отработать задачам событий twitchio
+        rates.append((count / seconds, bot.handled))
+    return rates
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f'{"команд":>7} {"неизв.":>7} {"twitchio, сообщ/с":>18} {"с отсевом, сообщ/с":>19} {"ускорение":>10}')
+    for known, unknown in MIXES:
+        (plain, plain_handled), (filtered, filtered_handled) = await run(count, known, unknown)
+        assert plain_handled == filtered_handled, 'отсев потерял команды'
+        print(f'{known:>7.0%} {unknown:>7.0%} {plain:>18,.0f} {filtered:>19,.0f} {filtered / plain:>9.1f}×')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Рейтинг: полная сортировка на каждый !топ против инкрементального Leaderboard.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_leaderboard [число игроков ...]
+По умолчанию — 10 000, 100 000 и 1 000 000 игроков.
+"""
+import random
+import sys
+
+from benchmarks.bench_snapshot import timed
+from leaderboard import Leaderboard
+
+QUERIES = 1000
+
+
+def run(count):
+    rng = random.Random(count)
+    players = {}
+    for i in range(count):
+        level = rng.randint(1, 40)
+        players[f'viewer_{i}'] = (level, rng.randint(0, level * 100 - 1))
+    names = rng.sample(list(players), min(QUERIES, count))
+
+    sort_top, _ = timed(lambda: sorted(((name, level, xp) for name, (level, xp) in players.items()),
+                                       key=lambda i: (i[1], i[2]), reverse=True)[:10])
+    build, board = timed(Leaderboard, ((name, level, xp) for name, (level, xp) in players.items()))
+    top, _ = timed(lambda: [board.top(10) for _ in range(QUERIES)])
+    rank, _ = timed(lambda: [board.rank(name) for name in names])
+
+    def updates():
+        for name in names:
+            level, xp = players[name]
+            board.update(name, level, xp + rng.randint(1, 50))
+
+    update, _ = timed(updates)
+    return {
+        'players': count,
+        'sort_top_s': sort_top,
+        'build_s': build,
+        'top_s': top / QUERIES,
+        'rank_s': rank / len(names),
+        'update_s': update / len(names),
+    }
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f'{"игроков":>10} {"сортировка, мс":>15} {"построение, с":>14} '
+          f'{"топ-10, мкс":>12} {"ранг, мкс":>10} {"обновление, мкс":>16}')
+    for count in counts:
+        r = run(count)
+        print(f'{r["players"]:>10} {r["sort_top_s"] * 1e3:>15.1f} {r["build_s"]:>14.2f} '
+              f'{r["top_s"] * 1e6:>12.1f} {r["rank_s"] * 1e6:>10.1f} {r["update_s"] * 1e6:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
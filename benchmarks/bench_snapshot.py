@@ -0,0 +1,114 @@
+"""Сравнение players.json и двоичного снимка: размер файла, полная загрузка и чтение одного игрока.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_snapshot [число игроков ...]
+По умолчанию — 10 000, 100 000 и 1 000 000 игроков.
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import snapshot
+
+LOOKUPS = 1000
+ITEM_NAMES = ['Деревянный меч', 'Слизь', 'Зелье лечения', 'Кость', 'Кожаный шлем', 'Кольчуга']
+
+
+def make_players(count, rng):
+    """Синтетические игроки в формате players.json."""
+    players = {}
+    for i in range(count):
+        level = rng.randint(1, 40)
+        players[f'viewer_{i}'] = {
+            'level': level,
+            'xp': rng.randint(0, level * 100 - 1),
+            'gold': rng.randint(0, 5000),
+            'inventory': rng.choices(ITEM_NAMES, k=rng.randint(0, 8)),
+            'equipment': {'weapon': rng.choice([None, 'Железный меч']), 'armor': rng.choice([None, 'Кольчуга']),
+                          'helmet': None, 'pet': rng.choice([None, 'Слизь']), 'amulet': None},
+            'last_xp_time': 1.7e9 + rng.random() * 1e6,
+            'last_fight_time': 1.7e9 + rng.random() * 1e6,
+            'last_pvp_time': 0,
+            'pvp_wins': rng.randint(0, 50),
+            'pvp_losses': rng.randint(0, 50),
+            'prison': False,
+            'prison_until': 0,
+            'race': rng.choice([None, 'человек', 'эльф', 'орк']),
+            'class': rng.choice([None, 'воин', 'маг', 'вор']),
+            'current_hp': 30 + level * 5,
+        }
+    return players
+
+
+def timed(func, *args):
+    """Время одного вызова в секундах и его результат."""
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def load_json(path):
+    """Загрузка players.json так же, как это делает бот."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.loads(f.read())
+
+
+def lookup_json(path, names):
+    """Без индекса ради одного игрока приходится разбирать весь файл."""
+    players = load_json(path)
+    return [players[name] for name in names]
+
+
+def lookup_binary(path, names):
+    """Открыть снимок и прочитать игроков через mmap-индекс."""
+    reader = snapshot.SnapshotReader(path)
+    try:
+        return [reader.get(name) for name in names]
+    finally:
+        reader.close()
+
+
+def run(count, directory):
+    rng = random.Random(count)
+    players = make_players(count, rng)
+    json_path = os.path.join(directory, f'players_{count}.json')
+    binary_path = os.path.join(directory, f'players_{count}.snap')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(players, f, ensure_ascii=False, indent=2)
+    snapshot.write_snapshot(binary_path, players)
+    names = rng.sample(list(players), min(LOOKUPS, count))
+    del players
+
+    json_load, _ = timed(load_json, json_path)
+    binary_load, _ = timed(snapshot.read_snapshot, binary_path)
+    # Для JSON одиночное чтение — это всегда полная загрузка, поэтому меряем один ник
+    json_lookup, _ = timed(lookup_json, json_path, names[:1])
+    binary_lookup, _ = timed(lookup_binary, binary_path, names)
+    return {
+        'players': count,
+        'json_bytes': os.path.getsize(json_path),
+        'binary_bytes': os.path.getsize(binary_path),
+        'json_load_s': json_load,
+        'binary_load_s': binary_load,
+        'json_lookup_s': json_lookup,
+        'binary_lookup_s': binary_lookup / len(names),
+    }
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f'{"игроков":>10} {"JSON, МБ":>9} {"bin, МБ":>8} {"JSON, с":>8} {"bin, с":>7} '
+          f'{"1 игрок JSON, мс":>17} {"1 игрок bin, мкс":>17}')
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            r = run(count, directory)
+            print(f'{r["players"]:>10} {r["json_bytes"] / 2**20:>9.1f} {r["binary_bytes"] / 2**20:>8.1f} '
+                  f'{r["json_load_s"]:>8.2f} {r["binary_load_s"]:>7.2f} '
+                  f'{r["json_lookup_s"] * 1e3:>17.1f} {r["binary_lookup_s"] * 1e6:>17.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Запись и воспроизведение сходятся с сохранением бота.
+
+Бот без подключения к Twitch (offline.py) выполняет синтетический чат, записывая его так же,
+как с RECORD_FILE, и сохраняет игроков в players.json. Затем запись воспроизводится на
+чистом боте, и его итоговое состояние сравнивается с этим сохранением через
+replay.load_state — ровно так, как это делает `python replay.py ... --compare players.json`.
+При любом различии скрипт печатает его и завершается с ошибкой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.check_replay [число сообщений] [число игроков]
+По умолчанию — 3000 сообщений от 20 игроков.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+from offline import create_bot, invoke
+from replay import Recorder, ReplayClock, diff_states, load_state, player_state, read_session, replay
+
+STARTED = 1_700_000_000.0
+COMMANDS = ['!бой', '!опыт', '!милостыня', '!статус', '!таверна', '!лечиться', '!отдых', '!черныйрынок', '!купить 1']
+
+
+def chat(names, count, rng):
+    """Сообщения [время, ник, текст]: сначала все создают персонажей, потом играют."""
+    now = STARTED
+    messages = []
+    for name in names:
+        now += rng.uniform(0.5, 5)
+        messages.append([now, name, '!старт'])
+    while len(messages) < count:
+        now += rng.uniform(0.5, 30)
+        user, other = rng.sample(names, 2)
+        roll = rng.random()
+        if roll < 0.1:
+            messages.append([now, user, f'!подарить @{other} Золото {rng.randint(1, 20)}'])
+        elif roll < 0.2:
+            messages.append([now, user, f'!дуэль @{other} {rng.randint(0, 10)}'])
+            now += rng.uniform(1, 20)
+            messages.append([now, other, f'!принять @{user}'])
+        else:
+            messages.append([now, user, rng.choice(COMMANDS)])
+    return messages
+
+
+def settings(directory, name):
+    return {
+        'SAVE_FILE': os.path.join(directory, name),
+        'LOG_FILE': os.path.join(directory, 'bot.log'),
+        'PROFILE_DIR': os.path.join(directory, 'profiles'),
+    }
+
+
+async def live(directory, messages, seed):
+    """Выполнить чат, как его выполнил бы бот с RECORD_FILE. Путь записи и сохранения."""
+    clock = ReplayClock(STARTED)
+    bot = create_bot(settings(directory, 'players.json'), clock=clock, rng=random.Random(seed))
+    recorder = Recorder(os.path.join(directory, 'session.jsonl.gz'), seed, STARTED)
+    bot.restore_timers()  # как в event_ready
+    for when, user, content in messages:
+        clock.set(when)
+        bot.scheduler.run_due()
+        recorder.record(when, user, content)
+        try:
+            await invoke(bot, user, content)
+        except Exception:
+            pass  # упавшая команда упадёт и при воспроизведении
+        await asyncio.sleep(0)
+    recorder.close()
+    await bot.store.flush()
+    bot.store.close()
+    return recorder.path, bot.storage.path
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    players = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rng = random.Random(count)
+    messages = chat([f'viewer_{i}' for i in range(players)], count, rng)
+    with tempfile.TemporaryDirectory(prefix='rpg-replay-check-') as directory:
+        session, save = await live(directory, messages, rng.randrange(2 ** 63))
+        header, recorded = read_session(session)
+        clock = ReplayClock(header['started'])
+        bot = create_bot(settings(directory, 'replayed.json'), clock=clock, rng=random.Random(header['seed']))
+        done, errors = await replay(bot, clock, recorded)
+        state = player_state(bot)
+        bot.store.close()
+        lines = diff_states(load_state(save), state)
+    print(f'Команд: {done} из {len(recorded)}, ошибок: {errors}, игроков: {len(state)}')
+    if lines:
+        print('\n'.join(lines))
+        sys.exit('Воспроизведение разошлось с сохранением бота')
+    print('Состояние игроков совпадает с сохранением')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
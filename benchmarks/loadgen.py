@@ -0,0 +1,216 @@
+"""Нагрузочный прогон настоящего RPGbot на синтетическом чате.
+
+Бот собирается через offline.py без подключения к Twitch, хранилище и журнал лежат во
+временном каталоге. Перед замером создаются --players синтетических игроков (от тысячи до
+миллиона) и записываются в хранилище, затем в течение --duration секунд с частотой --rate
+операций в секунду (0 — одна за другой без пауз) выполняется смесь команд --mix.
+Дуэль — это две команды: !дуэль от одного игрока и !принять от другого.
+
+При заданной частоте операции запускаются по расписанию независимо от того, успели ли
+предыдущие, и задержка первой команды операции считается от запланированного момента:
+если бот не успевает, это видно по p99, а не прячется в меньшей частоте.
+
+Печатаются пропускная способность, p50/p99 по каждой команде, RSS и байты, записанные
+процессом на одну команду (сохранение игроков и журнал). С --results итог дописывается
+строкой JSON в файл, чтобы сравнивать прогоны между коммитами.
+
+Запуск из корня репозитория:
+    python -m benchmarks.loadgen [--players 10000] [--rate 0] [--duration 10]
+                                 [--mix бой=30,опыт=20,статус=20,топ=10,дуэль=10,подарить=10]
+                                 [--backend json|journal|sqlite] [--cache 0] [--results results.jsonl]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from combat import calculate_hp
+from leaderboard import Leaderboard
+from offline import create_bot, invoke
+from player import Player
+
+MIX = {'бой': 30, 'опыт': 20, 'статус': 20, 'топ': 10, 'дуэль': 10, 'подарить': 10}
+
+
+def parse_mix(text):
+    """'бой=30,топ=10' -> {'бой': 30, 'топ': 10}."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in MIX:
+            raise argparse.ArgumentTypeError(f'неизвестная операция {name!r}, есть: {", ".join(MIX)}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def populate(bot, count, rng):
+    """Создать count игроков разных уровней и пометить их для записи."""
+    names = [f'viewer_{i}' for i in range(count)]
+    for name in names:
+        level = rng.randint(1, 40)
+        bot.players[name] = Player(current_hp=calculate_hp(level), level=level, xp=rng.randrange(level * 100),
+                                   gold=rng.randint(0, 5000))
+    bot.store.mark_dirty(*names)
+    return names
+
+
+def scenario(kind, names, rng):
+    """Сообщения одной операции: [(ник, текст)]."""
+    user, other = rng.sample(names, 2)
+    if kind == 'статус':
+        return [(user, f'!статус @{other}' if rng.random() < 0.3 else '!статус')]
+    if kind == 'дуэль':
+        return [(user, f'!дуэль @{other} 10'), (other, f'!принять @{user}')]
+    if kind == 'подарить':
+        return [(user, f'!подарить @{other} Золото 5')]
+    return [(user, f'!{kind}')]
+
+
+async def operation(bot, messages, result, scheduled):
+    started = scheduled
+    for user, content in messages:
+        try:
+            await invoke(bot, user, content)
+        except Exception:
+            result['errors'] += 1
+        finished = time.perf_counter()
+        result['latencies'][content.split(None, 1)[0]].append(finished - started)
+        started = finished
+
+
+async def drive(bot, names, mix, rate, duration, rng):
+    """Выполнять операции duration секунд. Задержки по командам, число ошибок и фактическое время."""
+    kinds, weights = list(mix), list(mix.values())
+    result = {'latencies': defaultdict(list), 'errors': 0}
+    tasks = set()
+    start = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - start < duration:
+        messages = scenario(rng.choices(kinds, weights)[0], names, rng)
+        if rate:
+            scheduled = start + sent / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                scheduled = time.perf_counter()  # не считать боту неточность таймера asyncio.sleep
+            task = asyncio.create_task(operation(bot, messages, result, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        else:
+            await operation(bot, messages, result, time.perf_counter())
+        sent += 1
+    await asyncio.gather(*tasks)
+    return result, time.perf_counter() - start
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def written_bytes():
+    """Байты, записанные процессом (Linux, /proc/self/io); None, если узнать нельзя."""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def rss_mb():
+    """Текущий RSS (Linux) или пиковый, если текущий узнать нельзя."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        import resource  # нет на Windows, а там нет и /proc
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix='rpg-loadgen-') as directory:
+        save_file = os.path.join(directory, 'players.db' if args.backend == 'sqlite' else 'players.json')
+        bot = create_bot({
+            'SAVE_FILE': save_file,
+            'STORAGE_BACKEND': args.backend,
+            'PLAYER_CACHE_SIZE': args.cache,
+            'LOG_FILE': os.path.join(directory, 'bot.log'),
+            'PROFILE_DIR': os.path.join(directory, 'profiles'),
+        })
+        started = time.perf_counter()
+        names = populate(bot, args.players, rng)
+        await bot.store.flush()
+        bot.leaderboard = Leaderboard(bot.store.rank_entries())
+        print(f'{args.players} игроков созданы и записаны за {time.perf_counter() - started:.1f} с')
+
+        written = written_bytes()
+        result, seconds = await drive(bot, names, args.mix, args.rate, args.duration, rng)
+        await bot.store.flush()
+        written = None if written is None else written_bytes() - written
+        bot.store.close()
+
+    latencies = result['latencies']
+    total = sum(len(values) for values in latencies.values())
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'players': args.players,
+        'backend': args.backend,
+        'cache': args.cache,
+        'rate': args.rate,
+        'mix': args.mix,
+        'seconds': round(seconds, 3),
+        'commands': total,
+        'errors': result['errors'],
+        'throughput': round(total / seconds, 1),
+        'rss_mb': round(rss_mb(), 1),
+        'bytes_per_command': None if written is None or not total else round(written / total),
+        'latency_ms': {},
+    }
+    print(f'{"команда":<12} {"число":>8} {"p50, мс":>9} {"p99, мс":>9}')
+    for name, values in sorted(latencies.items(), key=lambda item: -len(item[1])) + [('всего', None)]:
+        values = sorted(values if values is not None else (v for vs in latencies.values() for v in vs))
+        if not values:
+            continue
+        p50, p99 = percentile(values, 0.5) * 1000, percentile(values, 0.99) * 1000
+        report['latency_ms'][name] = {'count': len(values), 'p50': round(p50, 3), 'p99': round(p99, 3)}
+        print(f'{name:<12} {len(values):>8} {p50:>9.3f} {p99:>9.3f}')
+    print(f'{report["throughput"]:,.0f} команд/с, ошибок {report["errors"]}, RSS {report["rss_mb"]} МБ, '
+          f'записано на команду: {report["bytes_per_command"]} байт')
+    if args.results:
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report, ensure_ascii=False) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон RPGbot на синтетическом чате')
+    parser.add_argument('--players', type=int, default=10_000, help='число синтетических игроков')
+    parser.add_argument('--rate', type=float, default=0, help='операций в секунду, 0 — без пауз')
+    parser.add_argument('--duration', type=float, default=10, help='длительность замера, секунд')
+    parser.add_argument('--mix', type=parse_mix, default=MIX, help='веса операций: бой=30,топ=10,...')
+    parser.add_argument('--backend', choices=('json', 'journal', 'sqlite'), default='json')
+    parser.add_argument('--cache', type=int, default=0, help='PLAYER_CACHE_SIZE, 0 — все игроки в памяти')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--results', help='дописать итог строкой JSON в этот файл')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
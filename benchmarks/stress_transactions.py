@@ -0,0 +1,115 @@
+"""Сохранение золота при тысячах одновременных подарков, дуэлей и милостыни.
+
+Выполняются настоящие команды RPGbot (через offline.py): !подарить золото, !дуэль с
+последующим !принять, !отмена и !милостыня, которая меняет золото одного игрока. Каждый
+ответ бота — точка переключения задач, как отправка в чат, а часть ответов падает с
+ошибкой посреди команды. Сначала всё прогоняется с отключёнными транзакциями, как было
+раньше, — золото теряется и удваивается; затем как есть. В конце открытые вызовы
+отменяются, и сумма золота должна сойтись до монеты с начальной плюс розданная
+милостыня, а число захваченных замков вернуться к нулю. Иначе скрипт завершается с ошибкой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.stress_transactions [число операций] [число игроков]
+По умолчанию — 20 000 операций над 50 игроками.
+"""
+import asyncio
+import contextlib
+import itertools
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from combat import calculate_hp
+from offline import create_bot, invoke
+from player import Player
+
+FAILURE_RATE = 0.02
+ALMS = re.compile(r'тебе дали (\d+) монет')
+
+
+class Failure(Exception):
+    """Ошибка посреди команды: всё, что команда успела изменить, должно откатиться."""
+
+
+def pause(rng):
+    """Отправка ответа: переключение задач и иногда ошибка."""
+    async def send(content):
+        await asyncio.sleep(0 if rng.random() < 0.7 else 0.0001)
+        if rng.random() < FAILURE_RATE:
+            raise Failure
+    return send
+
+
+def scenario(names, rng):
+    """Сообщения одной операции: [(ник, текст)]."""
+    a, b = rng.sample(names, 2)
+    amount = rng.randint(1, 30)
+    roll = rng.random()
+    if roll < 0.4:
+        return [(a, f'!подарить @{b} Золото {amount}')]
+    if roll < 0.8:
+        return [(a, f'!дуэль @{b} {amount}'), (b, f'!принять @{a}')]
+    if roll < 0.9:
+        return [(a, f'!отмена @{b}')]
+    return [(a, '!милостыня')]
+
+
+async def operation(bot, messages, rng, result):
+    for user, content in messages:
+        try:
+            replies = await invoke(bot, user, content, on_send=pause(rng))
+        except Failure:
+            continue
+        for reply in replies:
+            match = ALMS.search(reply)
+            if match:
+                result['alms'] += int(match.group(1))
+
+
+async def run(operations, count, transactional):
+    rng = random.Random(operations)
+    ticks = itertools.count(0, 1000)  # часы, по которым любой кулдаун уже прошёл
+    with tempfile.TemporaryDirectory(prefix='rpg-stress-') as directory:
+        bot = create_bot({
+            'SAVE_FILE': os.path.join(directory, 'players.json'),
+            'LOG_FILE': os.path.join(directory, 'bot.log'),
+            'PROFILE_DIR': os.path.join(directory, 'profiles'),
+        }, clock=lambda: next(ticks), rng=rng)
+        if not transactional:
+            bot.transaction = lambda *users: contextlib.nullcontext()
+        names = [f'viewer_{i}' for i in range(count)]
+        for name in names:
+            bot.players[name] = Player(current_hp=calculate_hp(1), gold=100)
+        total = sum(p.gold for p in bot.players.values())
+        result = {'alms': 0}
+        started = time.perf_counter()
+        await asyncio.gather(*(operation(bot, scenario(names, rng), rng, result) for _ in range(operations)))
+        for duel in list(bot.duels):
+            await bot.cancel_duel(duel)
+        seconds = time.perf_counter() - started
+        drift = sum(p.gold for p in bot.players.values()) - total - result['alms']
+        negative = sum(1 for p in bot.players.values() if p.gold < 0)
+        locks = len(bot.player_locks)
+        bot.store.close()
+    return drift, negative, locks, seconds
+
+
+async def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print(f'{"режим":<12} {"расхождение золота":>19} {"в минусе":>9} {"замков":>7} {"время, с":>9}')
+    failed = False
+    for transactional in (False, True):
+        drift, negative, locks, seconds = await run(operations, count, transactional)
+        print(f'{"транзакции" if transactional else "без замков":<12} {drift:>19} {negative:>9} {locks:>7} {seconds:>9.2f}')
+        if transactional:
+            failed = drift != 0 or negative != 0 or locks != 0
+    if failed:
+        sys.exit('Транзакции не сохранили золото')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,180 @@
+"""Боевые формулы и пошаговый бой двух сторон без цикла по раундам.
+
+Бой идёт раундами: сторона A бьёт первой, затем, если B жив, бьёт B. Урон каждого удара
+случаен и не зависит от хода боя, поэтому бой сводится к двум последовательностям бросков:
+A побеждает в первом раунде, где накопленный урон A достиг HP стороны B, если B к этому
+раунду ещё не добил A. Все броски делаются одним вызовом rng.choices, а раунд победы
+находится двоичным поиском по накопленным суммам.
+
+Подготовка пакетного броска окупается только в долгих боях: короткий бой (таких
+большинство) быстрее провести обычным циклом по раундам с одним броском на удар.
+"""
+import random
+from bisect import bisect, bisect_left
+from functools import lru_cache
+from itertools import accumulate
+from consts import ITEMS, CLASSES
+
+
+def calculate_hp(level):
+    """Рассчитать максимальное HP персонажа по уровню."""
+    return 30 + (level - 1) * 5
+
+
+def base_damage_range(level):
+    """Границы базового урона персонажа по уровню."""
+    return 5 + level * 2, 10 + level * 3
+
+
+def calculate_damage(level, rng=random):
+    """Бросить базовый урон персонажа по уровню."""
+    return rng.randint(*base_damage_range(level))
+
+
+def bonus_range(bonus):
+    """Бонус атаки как пара (min, max): в consts он задан либо числом, либо диапазоном."""
+    return bonus if isinstance(bonus, tuple) else (bonus, bonus)
+
+
+def equipment_bonuses(item_names, player_class):
+    """Бонусы от надетых предметов и класса: (мин. бонус атаки, макс. бонус атаки, бонус HP)."""
+    attack_bonus_min, attack_bonus_max, hp_bonus = 0, 0, 0
+    for item_name in item_names:
+        if item_name and item_name in ITEMS:
+            item = ITEMS[item_name]
+            ab_min, ab_max = bonus_range(item['attack_bonus'])
+            attack_bonus_min += ab_min
+            attack_bonus_max += ab_max
+            hp_bonus += item.get('hp_bonus', 0)
+    if player_class in CLASSES:
+        class_info = CLASSES[player_class]
+        ab_min, ab_max = bonus_range(class_info['attack_bonus'])
+        attack_bonus_min += ab_min
+        attack_bonus_max += ab_max
+        hp_bonus += class_info.get('hp_bonus', 0)
+    return attack_bonus_min, attack_bonus_max, hp_bonus
+
+
+def scale_monster(monster, level):
+    """HP и атака монстра из MONSTERS против игрока данного уровня."""
+    scale_factor = 1 + (level - 1) * 0.1
+    return int(monster['base_hp'] * scale_factor), int(monster['base_attack'] * scale_factor)
+
+
+class Damage:
+    """Распределение урона одного удара: значения и накопленные веса для rng.choices."""
+
+    __slots__ = ('values', 'cum_weights', 'min', 'total')
+
+    def __init__(self, values, cum_weights):
+        self.values = values
+        self.cum_weights = cum_weights
+        self.min = min(values)
+        self.total = cum_weights[-1]
+
+    @classmethod
+    def constant(cls, value):
+        """Урон без разброса, например атака монстра."""
+        return cls((value,), (1,))
+
+    @classmethod
+    def for_attack(cls, level, bonus_min, bonus_max, multiplier=1.0):
+        """Удар персонажа: int((базовый урон + бонус экипировки) * множитель)."""
+        return damage_distribution(*base_damage_range(level), bonus_min, bonus_max, multiplier)
+
+    def hit(self, rng):
+        """Один бросок урона; то же, что rng.choices(..., k=1)[0], без создания списка."""
+        if len(self.values) == 1:
+            return self.values[0]
+        return self.values[bisect(self.cum_weights, rng.random() * self.total)]
+
+    def roll(self, rng, count):
+        """count независимых бросков урона."""
+        if len(self.values) == 1:
+            return [self.values[0]] * count
+        return rng.choices(self.values, cum_weights=self.cum_weights, k=count)
+
+    def dealt(self, rng, count):
+        """Накопленный урон после каждого из count ударов."""
+        if len(self.values) == 1 and self.values[0] > 0:
+            # Постоянный урон растёт арифметической прогрессией, бросать нечего
+            value = self.values[0]
+            return range(value, value * (count + 1), value)
+        return list(accumulate(self.roll(rng, count)))
+
+
+@lru_cache(maxsize=1024)
+def damage_distribution(base_min, base_max, bonus_min, bonus_max, multiplier):
+    """Распределение int((U[base_min, base_max] + U[bonus_min, bonus_max]) * multiplier).
+
+    Это ровно то, что даёт пара randint на каждый удар, только посчитанное заранее.
+    """
+    weights = {}
+    for base in range(base_min, base_max + 1):
+        for bonus in range(bonus_min, bonus_max + 1):
+            value = int((base + bonus) * multiplier)
+            weights[value] = weights.get(value, 0) + 1
+    values = tuple(sorted(weights))
+    return Damage(values, tuple(accumulate(weights[value] for value in values)))
+
+
+class FightResult:
+    """Итог боя: кто победил, за сколько раундов и сколько HP осталось у сторон."""
+
+    __slots__ = ('a_won', 'rounds', 'hp_a', 'hp_b')
+
+    def __init__(self, a_won, rounds, hp_a, hp_b):
+        self.a_won = a_won
+        self.rounds = rounds
+        self.hp_a = hp_a
+        self.hp_b = hp_b
+
+
+def strikes_to_kill(hp, damage):
+    """Сколько ударов гарантированно хватит, чтобы снять hp, или None, если урон может быть нулевым."""
+    if hp <= 0:
+        return 0
+    if damage.min <= 0:
+        return None
+    return -(-hp // damage.min)
+
+
+# Граница раундов, до которой бой считается циклом (см. benchmarks/bench_combat.py)
+LOOP_ROUNDS = 20
+
+
+def fight_loop(hp_a, damage_a, hp_b, damage_b, rng):
+    """Бой раунд за раундом, по броску на удар."""
+    rounds = 0
+    while True:
+        rounds += 1
+        hp_b -= damage_a.hit(rng)
+        if hp_b <= 0:
+            return FightResult(True, rounds, hp_a, hp_b)
+        hp_a -= damage_b.hit(rng)
+        if hp_a <= 0:
+            return FightResult(False, rounds, hp_a, hp_b)
+
+
+def resolve_fight(hp_a, damage_a, hp_b, damage_b, rng=random):
+    """Провести бой A против B. Результат распределён так же, как у цикла «удар A, удар B»."""
+    if hp_a <= 0:
+        return FightResult(False, 0, hp_a, hp_b)
+    if hp_b <= 0:
+        return FightResult(True, 0, hp_a, hp_b)
+    # Бой закончится не позже, чем один из противников гарантированно добьёт другого
+    bounds = [n for n in (strikes_to_kill(hp_b, damage_a), strikes_to_kill(hp_a, damage_b)) if n is not None]
+    if not bounds:
+        raise ValueError("бой не может закончиться: урон обеих сторон может быть нулевым")
+    rounds = min(bounds)
+    if rounds <= LOOP_ROUNDS:
+        return fight_loop(hp_a, damage_a, hp_b, damage_b, rng)
+    dealt_a = damage_a.dealt(rng, rounds)
+    dealt_b = damage_b.dealt(rng, rounds)
+    kill_a = bisect_left(dealt_a, hp_b)  # индекс раунда, в котором A добивает B
+    kill_b = bisect_left(dealt_b, hp_a)
+    if kill_a <= kill_b:
+        # A бьёт первым, поэтому в общем раунде побеждает он; B успел ударить kill_a раз
+        taken = dealt_b[kill_a - 1] if kill_a else 0
+        return FightResult(True, kill_a + 1, hp_a - taken, hp_b - dealt_a[kill_a])
+    return FightResult(False, kill_b + 1, hp_a - dealt_b[kill_b], hp_b - dealt_a[kill_b])
@@ -1,3 +1,19 @@
+RACES = {
+    'человек': {'hp_bonus': 5, 'xp_bonus': 0},
+    'эльф': {'hp_bonus': 0, 'xp_bonus': 0.1},
+    'орк': {'hp_bonus': 10, 'xp_bonus': -0.05}
+}
+
+CLASSES = {
+    'воин': {'attack_bonus': (2, 5), 'hp_bonus': 10},
+    'маг': {'attack_bonus': (0, 3), 'xp_bonus': 0.1},
+    'вор': {'attack_bonus': (1, 4), 'steal_chance_bonus': 0.05}
+}
+
+FIGHT_COOLDOWN = 90  # секунд между боями с монстрами
+DUEL_TIMEOUT = 120  # секунд на !принять, потом вызов на дуэль сгорает
+BLACK_MARKET_ROTATION = 600  # секунд между сменами товаров чёрного рынка
+
 MONSTERS = {
     'Гоблин': {
         'base_hp': 25,
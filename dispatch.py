@@ -0,0 +1,176 @@
+"""Разбор команд чата: быстрый отсев обычных сообщений и аргументы, объявленные один раз.
+
+Большинство сообщений в чате — не команды. command_name отсекает их по первому символу
+ещё до того, как twitchio начнёт строить контекст и разбирать строку. Команды объявляются
+декоратором command: в нём перечисляются аргументы (Nick, Amount, Word, Text), ответ на
+неверный формат, нужен ли автору персонаж и только ли читает команда состояние (для
+admission.py). Обработчик получает уже разобранные значения.
+"""
+from twitchio.ext import commands
+
+from admission import READ, WRITE
+
+PREFIX = '!'
+NO_CHARACTER = '{author}, у тебя нет персонажа. Создай его командой !старт.'
+
+
+class UsageError(Exception):
+    """Аргументы сообщения не подходят под объявленные аргументы команды."""
+
+
+class Arg:
+    """Аргумент команды — одно слово сообщения. Необязательный получает default, если слова нет."""
+
+    greedy = False  # забирает весь остаток сообщения
+
+    def __init__(self, name, optional=False, default=None):
+        self.name = name
+        self.optional = optional
+        self.default = default
+
+    def convert(self, token):
+        return token
+
+
+class Nick(Arg):
+    """Ник игрока: без @ и в нижнем регистре, как ключи self.players."""
+
+    def convert(self, token):
+        nick = token.lstrip('@').lower()
+        if not nick:
+            raise ValueError(token)
+        return nick
+
+
+class Amount(Arg):
+    """Целое неотрицательное число: номер товара, ставка."""
+
+    def convert(self, token):
+        if not token.isdigit():
+            raise ValueError(token)
+        return int(token)
+
+
+class Word(Arg):
+    """Одно слово в нижнем регистре: слот, раса, класс."""
+
+    def convert(self, token):
+        return token.lower()
+
+
+class Text(Arg):
+    """Весь остаток сообщения как есть, например название предмета из нескольких слов."""
+
+    greedy = True
+
+
+def command_name(content, prefix=PREFIX):
+    """Имя команды из текста сообщения или None, если сообщение не начинается с префикса."""
+    if not content.startswith(prefix):
+        return None
+    words = content[len(prefix):].split(None, 1)
+    return words[0] if words else None
+
+
+def is_command(message, names):
+    """Стоит ли отдавать сообщение twitchio: в нём команда из names."""
+    if command_name(message.content) in names:
+        return True
+    # В ответе на сообщение команда идёт после @ника; такие сообщения редки, их разбирает twitchio
+    return 'reply-parent-msg-id' in (message.tags or ())
+
+
+def request_class(message, cmd):
+    """Класс приоритета и ключ склейки команды для Admission.run: (priority, key)."""
+    if cmd is None or not getattr(cmd, 'read_only', False):
+        return WRITE, None
+    author = None if cmd.shared else message.author.name.lower()
+    return READ, (cmd.name, argument_text(message).lower(), author)
+
+
+def argument_text(message):
+    """Всё, что идёт после имени команды."""
+    content = message.content
+    if 'reply-parent-msg-id' in (message.tags or ()):
+        # В ответе на сообщение twitch ставит первым словом @ник адресата
+        content = content.split(None, 1)[-1]
+    words = content.split(None, 1)
+    return words[1] if len(words) > 1 else ''
+
+
+def parse_args(spec, text):
+    """Разобрать строку аргументов по списку Arg. Лишние слова отбрасываются."""
+    values = []
+    rest = text.strip()
+    for arg in spec:
+        if arg.greedy:
+            token, tail = rest, ''
+        else:
+            token, _, tail = rest.partition(' ')
+        if not token:
+            if not arg.optional:
+                raise UsageError(arg.name)
+            values.append(arg.default)
+            continue
+        try:
+            values.append(arg.convert(token))
+        except ValueError:
+            if not arg.optional:
+                raise UsageError(arg.name)
+            # Слово не подошло необязательному аргументу — оно достаётся следующему
+            values.append(arg.default)
+            continue
+        rest = tail.lstrip()
+    return values
+
+
+def command(name, *spec, usage=None, requires_character=False, read_only=False, shared=False, moderator=False,
+            own_transaction=False):
+    """Команда бота с объявленными аргументами.
+
+    Обработчик вызывается как handler(self, ctx, *значения). usage — ответ, если аргументы
+    не разобрались; в нём можно подставить {author}. С requires_character автору без
+    персонажа отвечает общий NO_CHARACTER, а обработчик не вызывается. Игроки из аргументов
+    Nick подгружаются из хранилища до вызова.
+
+    read_only — команда ничего не меняет и при перегрузке уступает остальным; shared —
+    её ответ не зависит от автора, поэтому одинаковые запросы разных зрителей склеиваются.
+    moderator — команда только для модераторов и владельца канала, остальным бот не отвечает.
+
+    Команда, которая что-то меняет, выполняется в транзакции автора (transactions.py): под его
+    замком, чтобы откат чужой транзакции не стёр её изменения, и с откатом при исключении.
+    own_transaction — обработчик меняет нескольких игроков и сам берёт их в self.transaction.
+    """
+    nicks = [i for i, arg in enumerate(spec) if isinstance(arg, Nick)]
+
+    def decorator(handler):
+        async def callback(self, ctx):
+            if moderator and not getattr(ctx.author, 'is_mod', False):
+                return
+            if requires_character and ctx.author.name.lower() not in self.players:
+                await ctx.send(NO_CHARACTER.format(author=ctx.author.name))
+                return
+            try:
+                values = parse_args(spec, argument_text(ctx.message))
+            except UsageError:
+                await ctx.send((usage or f'Формат: {PREFIX}{name}').format(author=ctx.author.name))
+                return
+            if nicks:
+                await self.load_players_for(ctx, *(values[i] for i in nicks if values[i] is not None))
+            if read_only or own_transaction:
+                await handler(self, ctx, *values)
+                return
+            async with self.transaction(ctx.author.name.lower()):
+                await handler(self, ctx, *values)
+
+        # Сигнатура callback должна остаться (self, ctx), иначе twitchio начнёт разбирать аргументы сам
+        callback.__name__ = handler.__name__
+        callback.__qualname__ = handler.__qualname__
+        callback.__doc__ = handler.__doc__
+        cmd = commands.command(name=name)(callback)
+        cmd.spec = spec
+        cmd.read_only = read_only
+        cmd.shared = shared
+        return cmd
+
+    return decorator
@@ -0,0 +1,71 @@
+"""Открытые вызовы на дуэль.
+
+Вызов хранится в двух индексах — по вызывающему и по вызванному, — поэтому найти, принять
+или отменить любой вызов можно за O(1), а у игрока может быть сколько угодно входящих и
+исходящих вызовов (но не больше одного на пару игроков). Ставка вызывающего удерживается
+в момент вызова: она лежит в Duel.amount и в Player.escrowed, пока вызов не примут, не
+отменят или он не истечёт. Сами вызовы живут только в памяти, а escrowed сохраняется с
+игроком, поэтому после падения бота ставки возвращаются при загрузке (RPGbot.release_escrow).
+"""
+
+
+class Duel:
+    """Вызов challenger → target со ставкой amount, уже удержанной у challenger."""
+
+    __slots__ = ('challenger', 'target', 'amount')
+
+    def __init__(self, challenger, target, amount):
+        self.challenger = challenger
+        self.target = target
+        self.amount = amount
+
+    @property
+    def key(self):
+        return self.challenger, self.target
+
+
+class DuelRegistry:
+    """Вызовы на дуэль с индексами по обоим участникам. Вызовы одного игрока идут от старых к новым."""
+
+    def __init__(self):
+        self.outgoing_by = {}  # вызывающий -> {вызванный: Duel}
+        self.incoming_by = {}  # вызванный -> {вызывающий: Duel}
+
+    def __len__(self):
+        return sum(len(duels) for duels in self.incoming_by.values())
+
+    def __iter__(self):
+        for duels in list(self.incoming_by.values()):
+            yield from list(duels.values())
+
+    def get(self, challenger, target):
+        return self.outgoing_by.get(challenger, {}).get(target)
+
+    def add(self, challenger, target, amount):
+        """Зарегистрировать вызов. ValueError, если такой вызов уже есть."""
+        if self.get(challenger, target) is not None:
+            raise ValueError(f"{challenger} уже вызвал {target}")
+        duel = Duel(challenger, target, amount)
+        self.outgoing_by.setdefault(challenger, {})[target] = duel
+        self.incoming_by.setdefault(target, {})[challenger] = duel
+        return duel
+
+    def remove(self, challenger, target):
+        """Убрать вызов и вернуть его, или None, если его нет."""
+        duel = self.outgoing_by.get(challenger, {}).pop(target, None)
+        if duel is None:
+            return None
+        if not self.outgoing_by[challenger]:
+            del self.outgoing_by[challenger]
+        del self.incoming_by[target][challenger]
+        if not self.incoming_by[target]:
+            del self.incoming_by[target]
+        return duel
+
+    def incoming(self, target):
+        """Входящие вызовы игрока."""
+        return list(self.incoming_by.get(target, {}).values())
+
+    def outgoing(self, challenger):
+        """Исходящие вызовы игрока."""
+        return list(self.outgoing_by.get(challenger, {}).values())
@@ -0,0 +1,47 @@
+"""Рейтинг игроков по уровню и XP, который обновляется по одному игроку."""
+from sortedcontainers import SortedList
+
+
+class Leaderboard:
+    """Игроки, упорядоченные по убыванию уровня, затем XP, затем по нику.
+
+    Обновление игрока и место в рейтинге — O(log n), первые k мест — O(log n + k).
+    """
+
+    def __init__(self, entries=()):
+        self.keys = {name: (-level, -xp, name) for name, level, xp in entries}
+        self.ranking = SortedList(self.keys.values())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, name):
+        return name in self.keys
+
+    def update(self, name, level, xp):
+        """Записать новые уровень и XP игрока."""
+        key = (-level, -xp, name)
+        old = self.keys.get(name)
+        if old == key:
+            return
+        if old is not None:
+            self.ranking.remove(old)
+        self.ranking.add(key)
+        self.keys[name] = key
+
+    def remove(self, name):
+        """Убрать игрока из рейтинга."""
+        old = self.keys.pop(name, None)
+        if old is not None:
+            self.ranking.remove(old)
+
+    def top(self, limit):
+        """Первые limit мест: список (ник, уровень, XP)."""
+        return [(name, -level, -xp) for level, xp, name in self.ranking[:limit]]
+
+    def rank(self, name):
+        """Место игрока, начиная с 1, или None, если его нет в рейтинге."""
+        key = self.keys.get(name)
+        if key is None:
+            return None
+        return self.ranking.index(key) + 1
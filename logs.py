@@ -0,0 +1,99 @@
+"""Журнал бота: JSON-строки, запись в отдельном потоке, ротация со сжатием.
+
+Обработчик на корневом логгере только кладёт запись в очередь. Собирает сообщение из
+шаблона и аргументов (logging.info("%s купил %s", user, item)), переводит запись в JSON и
+пишет её в файл поток QueueListener, поэтому цикл событий не форматирует строки и не
+касается файла. Поэтому в аргументы передаются значения, а не объекты, которые команда
+потом изменит.
+
+Каждая запись — одна строка JSON: время, уровень, сообщение и поля из extra
+(logging.info(..., extra={'user': ..., 'command': ...})). Файл сменяется, когда вырастает
+до max_bytes или проходит interval секунд; старые файлы сжимаются в bot.log.1.gz,
+bot.log.2.gz… и хранятся в количестве backups.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Атрибуты любой LogRecord; всё остальное в записи пришло из extra
+STANDARD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Запись как одна строка JSON с полями из extra."""
+
+    def format(self, record):
+        event = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_FIELDS and not key.startswith('_'):
+                event[key] = value
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+        if record.exc_text:
+            event['exception'] = record.exc_text
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует запись в вызывающем потоке.
+
+    Стандартный prepare() собирает сообщение сразу; здесь в очередь уходит копия записи
+    с нетронутыми шаблоном и аргументами. Только трассировка исключения превращается в
+    текст на месте, чтобы запись не держала кадры стека.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """Ротация по размеру и по времени; старые файлы сжимаются gzip."""
+
+    def __init__(self, filename, max_bytes, interval, backups):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True)
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+        self.namer = lambda name: name + '.gz'
+        self.rotator = self.compress
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+    @staticmethod
+    def compress(source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+
+def setup_logging(path, max_bytes, interval, backups, level=logging.INFO):
+    """Направить корневой логгер в очередь, а из неё — в файл path. Возвращает запущенный QueueListener."""
+    file_handler = CompressingRotatingFileHandler(path, max_bytes, interval, backups)
+    file_handler.setFormatter(JsonLinesFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler)
+    logging.basicConfig(level=level, handlers=[LazyQueueHandler(log_queue)], force=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,148 @@
+"""Метрики бота в формате Prometheus.
+
+Гистограммы времени выполнения и счётчики ошибок по командам, гистограммы отдельных этапов
+(пометка игроков для сохранения, пересчёт характеристик, отправка ответа в чат) и
+показатели, которые снимаются в момент запроса: число игроков, открытых дуэлей, глубина
+очередей. Запись в гистограмму — поиск корзины и три сложения, без замков: всё
+выполняется в цикле событий.
+
+Метрики отдаёт маленький HTTP-сервер в процессе бота: GET /metrics.
+"""
+import asyncio
+import bisect
+import math
+from collections import Counter
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PREFIX = 'rpg'
+
+
+class Histogram:
+    """Распределение длительностей по корзинам BUCKETS."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя корзина — больше всех границ
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def render(self, name, labels):
+        """Строки _bucket, _sum и _count для Prometheus; в корзинах накопленные счётчики."""
+        lines = []
+        total = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            total += count
+            le = '+Inf' if bound == math.inf else repr(bound)
+            lines.append(f'{name}_bucket{render_labels(labels + (("le", le),))} {total}')
+        lines.append(f'{name}_sum{render_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{render_labels(labels)} {self.count}')
+        return lines
+
+
+def render_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels) + '}'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Метрики бота и HTTP-сервер, который их отдаёт."""
+
+    def __init__(self):
+        self.commands = {}  # команда -> Histogram
+        self.errors = Counter()  # команда -> число исключений
+        self.phases = {}  # этап -> Histogram
+        self.gauges = []  # (имя, описание, функция -> число)
+        self.stats = []  # (префикс, описание, функция -> словарь чисел)
+        self.server = None
+
+    def observe_command(self, command, seconds):
+        histogram = self.commands.get(command)
+        if histogram is None:
+            histogram = self.commands[command] = Histogram()
+        histogram.observe(seconds)
+
+    def observe(self, phase, seconds):
+        """Записать длительность этапа phase."""
+        histogram = self.phases.get(phase)
+        if histogram is None:
+            histogram = self.phases[phase] = Histogram()
+        histogram.observe(seconds)
+
+    def error(self, command):
+        self.errors[command] += 1
+
+    def gauge(self, name, description, func):
+        """Показатель, который снимается вызовом func() при каждом запросе метрик."""
+        self.gauges.append((name, description, func))
+
+    def gauges_from(self, prefix, description, func):
+        """Числовые поля словаря func() (например, OutboundQueue.stats) как показатели prefix_<поле>."""
+        self.stats.append((prefix, description, func))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        name = f'{PREFIX}_command_seconds'
+        lines += [f'# HELP {name} Время выполнения команды.', f'# TYPE {name} histogram']
+        for command, histogram in sorted(self.commands.items()):
+            lines += histogram.render(name, (('command', command),))
+        name = f'{PREFIX}_command_errors_total'
+        lines += [f'# HELP {name} Команды, завершившиеся исключением.', f'# TYPE {name} counter']
+        for command, count in sorted(self.errors.items()):
+            lines.append(f'{name}{render_labels((("command", command),))} {count}')
+        name = f'{PREFIX}_phase_seconds'
+        lines += [f'# HELP {name} Время этапов внутри команд.', f'# TYPE {name} histogram']
+        for phase, histogram in sorted(self.phases.items()):
+            lines += histogram.render(name, (('phase', phase),))
+        for gauge, description, func in self.gauges:
+            name = f'{PREFIX}_{gauge}'
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} gauge', f'{name} {func()}']
+        for prefix, description, func in self.stats:
+            for key, value in func().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f'{PREFIX}_{prefix}_{key}'
+                    lines += [f'# HELP {name} {description}: {key}.', f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host, port):
+        """Запустить HTTP-сервер метрик."""
+        self.server = await asyncio.start_server(self.handle, host, port)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader, writer):
+        """Ответить на один HTTP-запрос: метрики на GET /metrics, иначе 404."""
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while await asyncio.wait_for(reader.readline(), 5) not in (b'\r\n', b'\n', b''):
+                pass  # заголовки не нужны
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', self.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('ascii') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
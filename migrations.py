@@ -0,0 +1,68 @@
+"""Версии схемы данных игрока и шаги перехода между ними.
+
+Шаг с индексом N переводит игрока из версии N в версию N + 1. Шаги выполняются один раз
+при загрузке старого сохранения, после чего данные перезаписываются в актуальной версии,
+и следующие загрузки обходятся без поштучных исправлений.
+"""
+from player import Inventory, Player
+
+
+def add_base_fields(player, bot):
+    """Версия 1: поля, которых не было у первых персонажей, и текущее HP."""
+    defaults = {
+        'level': 1,
+        'xp': 0,
+        'gold': 15,
+        'inventory': [],
+        'equipment': {'weapon': None, 'armor': None, 'helmet': None, 'pet': None, 'amulet': None},
+        'last_xp_time': 0,
+        'last_fight_time': 0,
+        'last_pvp_time': 0,
+        'pvp_wins': 0,
+        'pvp_losses': 0,
+        'prison': False,
+        'prison_until': 0,
+        'race': None,
+        'class': None,
+        'current_hp': None
+    }
+    for key, value in defaults.items():
+        if key not in player:
+            player[key] = value
+    if player['current_hp'] is None:
+        player['current_hp'] = bot.get_stats(Player.from_dict(dict(player, inventory={}))).max_hp
+
+
+def add_effect_fields(player, bot):
+    """Версия 2: баффы, штраф и кулдауны, которые раньше появлялись у игрока по мере надобности."""
+    player.setdefault('xp_buff_until', 0)
+    player.setdefault('xp_penalty', False)
+    player.setdefault('attack_buff_until', 0)
+    player.setdefault('steal_time_unteal', 0)
+    player.setdefault('alms_unteal', 0)
+
+
+def inventory_to_counts(player, bot):
+    """Версия 3: инвентарь — словарь {название: количество} вместо списка с повторами.
+
+    Названия, отличающиеся только регистром, сливаются в одно.
+    """
+    if isinstance(player['inventory'], list):
+        player['inventory'] = Inventory.from_list(player['inventory']).to_dict()
+
+
+def add_escrow_field(player, bot):
+    """Версия 4: золото, удержанное под ставки открытых дуэлей."""
+    player.setdefault('escrowed', 0)
+
+
+MIGRATIONS = [add_base_fields, add_effect_fields, inventory_to_counts, add_escrow_field]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(players, version, bot):
+    """Довести всех игроков от версии version до SCHEMA_VERSION."""
+    for step in MIGRATIONS[version:]:
+        for player in players.values():
+            step(player, bot)
+
@@ -0,0 +1,97 @@
+"""RPGbot без подключения к Twitch: для бенчмарков, нагрузочных прогонов и отладки.
+
+Настройки подставляются модулем settings, собранным из словаря, поэтому settings.py не нужен,
+а файлы бота (сохранение, журнал, профили) можно увести во временный каталог. Команды
+вызываются так же, как их вызывает twitchio: global_before_invoke, обработчик,
+global_after_invoke; ответы складываются в список вместо чата.
+
+    bot = create_bot({'SAVE_FILE': '/tmp/players.json', 'LOG_FILE': '/tmp/bot.log'})
+    replies = await invoke(bot, 'viewer_1', '!бой')
+"""
+import importlib
+import sys
+import types
+
+from dispatch import command_name
+
+DEFAULT_SETTINGS = {
+    'TOKEN': 'offline',
+    'CHANNEL': 'offline',
+    'SAVE_FILE': 'players.json',
+    'METRICS_PORT': 0,
+}
+
+
+class Author:
+    """Автор сообщения: то, что обработчики берут из ctx.author."""
+
+    def __init__(self, name, is_mod=False):
+        self.name = name
+        self.is_mod = is_mod
+
+
+class Message:
+    def __init__(self, content, author):
+        self.content = content
+        self.author = author
+        self.tags = {}
+        self.echo = False
+
+
+class Context:
+    """Контекст команды, ответы которого остаются в replies. on_send(content), если задан, ждётся после
+    каждого ответа, как отправка в чат."""
+
+    def __init__(self, bot, command, message, on_send=None):
+        self.bot = bot
+        self.command = command
+        self.message = message
+        self.author = message.author
+        self.replies = []
+        self.on_send = on_send
+
+    async def send(self, content):
+        self.replies.append(content)
+        if self.on_send is not None:
+            await self.on_send(content)
+
+    send_now = send
+
+
+def create_bot(settings=None, **kwargs):
+    """Импортировать rpg_bot с настройками DEFAULT_SETTINGS, обновлёнными из settings, и создать бота
+    с уже загруженными игроками.
+
+    kwargs передаются в RPGbot: например, clock и rng для воспроизведения записи.
+    """
+    module = types.ModuleType('settings')
+    module.__dict__.update(DEFAULT_SETTINGS)
+    module.__dict__.update(settings or {})
+    sys.modules['settings'] = module
+    sys.modules.pop('rpg_bot', None)  # настройки читаются при импорте
+    rpg_bot = importlib.import_module('rpg_bot')
+    rpg_bot.configure_logging()
+    bot = rpg_bot.RPGbot(**kwargs)
+    bot.players = bot.load_players()  # подключения к чату нет: игроки загружаются сразу, а не в run()
+    bot.loaded.set()
+    return bot
+
+
+async def invoke(bot, user, content, is_mod=False, on_send=None):
+    """Выполнить сообщение content от user как команду. Ответы бота; None, если команды нет.
+
+    on_send — корутина, которую ждёт каждый ответ: например, пауза, чтобы команды перемежались.
+    """
+    cmd = bot.commands.get(command_name(content))
+    if cmd is None:
+        return None
+    ctx = Context(bot, cmd, Message(content, Author(user, is_mod)), on_send)
+    await bot.global_before_invoke(ctx)
+    try:
+        await cmd._callback(bot, ctx)
+    except Exception:
+        bot.metrics.error(cmd.name)
+        raise
+    finally:
+        await bot.global_after_invoke(ctx)
+    return ctx.replies
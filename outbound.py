@@ -0,0 +1,250 @@
+"""Очередь исходящих сообщений в чат с учётом лимитов Twitch.
+
+Обработчики команд не отправляют сообщения сами: OutboundContext.send кладёт строку
+в очередь канала, а отдельная задача отправляет её, когда позволяет лимит. Строки
+одного зрителя, которые ещё ждут отправки, склеиваются в одно сообщение до 500 символов.
+Если очередь растёт, новые строки склеиваются с последним ответом в очереди независимо
+от адресата, а ответы, прождавшие дольше max_age секунд, выбрасываются.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from twitchio.errors import IRCCooldownError
+from twitchio.ext import commands
+
+from metrics import Histogram
+
+MESSAGE_LIMIT = 500  # символов в одном сообщении Twitch
+SEPARATOR = ' '
+
+# Лимиты Twitch: 20 сообщений за 30 секунд, 100 — если бот модератор канала.
+# Ведро на burst токенов с пополнением (limit - burst) / 30 в секунду ни в одном
+# 30-секундном окне не отправит больше limit сообщений.
+LIMIT_WINDOW = 30
+USER_LIMIT, USER_BURST = 20, 5
+MOD_LIMIT, MOD_BURST = 100, 20
+
+
+class TokenBucket:
+    """Ведро токенов: capacity — размер всплеска, rate — токенов в секунду."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def configure(self, capacity, rate):
+        """Сменить лимит, не теряя накопленные токены сверх нового размера ведра."""
+        self.refill()
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = min(self.tokens, capacity)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Через сколько секунд появится токен; 0 — можно отправлять сейчас."""
+        self.refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.refill()
+        self.tokens -= 1
+
+
+class Reply:
+    """Ответ, ожидающий отправки: склеенные строки и контекст, через который он уйдёт."""
+
+    __slots__ = ('ctx', 'key', 'text', 'created')
+
+    def __init__(self, ctx, key, text):
+        self.ctx = ctx
+        self.key = key
+        self.text = text
+        self.created = time.monotonic()
+
+    def merge(self, text):
+        """Дописать строку, если сообщение не выйдет за лимит Twitch."""
+        if len(self.text) + len(SEPARATOR) + len(text) > MESSAGE_LIMIT:
+            return False
+        self.text = f'{self.text}{SEPARATOR}{text}'
+        return True
+
+
+def split_message(text):
+    """Разбить слишком длинную строку на части не длиннее MESSAGE_LIMIT, по возможности по словам."""
+    parts = []
+    while len(text) > MESSAGE_LIMIT:
+        cut = text.rfind(' ', 0, MESSAGE_LIMIT + 1)
+        if cut <= 0:
+            cut = MESSAGE_LIMIT
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+class ChannelQueue:
+    """Очередь ответов одного канала и задача, которая их отправляет."""
+
+    def __init__(self, name, max_age, backlog):
+        self.name = name
+        self.max_age = max_age
+        self.backlog = backlog
+        self.replies = deque()
+        self.pending = {}  # адресат -> его последний неотправленный ответ
+        self.bucket = TokenBucket(USER_BURST, (USER_LIMIT - USER_BURST) / LIMIT_WINDOW)
+        self.moderator = False
+        self.ready = asyncio.Event()
+        self.task = None
+
+    def put(self, ctx, key, text, metrics):
+        for part in split_message(text):
+            reply = self.pending.get(key)
+            if reply is not None and reply.merge(part):
+                metrics.merged += 1
+                continue
+            # Очередь не успевает: склеиваем с последним ответом, кому бы он ни был адресован
+            if len(self.replies) >= self.backlog and self.replies[-1].merge(part):
+                metrics.merged += 1
+                continue
+            reply = Reply(ctx, key, part)
+            self.replies.append(reply)
+            self.pending[key] = reply
+        metrics.max_depth = max(metrics.max_depth, len(self.replies))
+        self.ready.set()
+
+    def set_moderator(self, moderator):
+        """Подстроить ведро под лимит обычного пользователя или модератора."""
+        if moderator == self.moderator:
+            return
+        self.moderator = moderator
+        limit, burst = (MOD_LIMIT, MOD_BURST) if moderator else (USER_LIMIT, USER_BURST)
+        self.bucket.configure(burst, (limit - burst) / LIMIT_WINDOW)
+
+    async def run(self, metrics):
+        """Отправлять ответы по мере появления токенов."""
+        while True:
+            if not self.replies:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            reply = self.replies[0]
+            try:
+                self.set_moderator(bool(reply.ctx._bot_is_mod()))
+            except (AttributeError, KeyError):
+                pass
+            delay = self.bucket.delay()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            self.replies.popleft()
+            if self.pending.get(reply.key) is reply:
+                del self.pending[reply.key]
+            waited = time.monotonic() - reply.created
+            if waited > self.max_age:
+                metrics.dropped += 1
+                logging.warning("Ответ в #%s выброшен: ждал %.1f с", self.name, waited)
+                continue
+            self.bucket.take()
+            started = time.perf_counter()
+            try:
+                await reply.ctx.send_now(reply.text)
+            except IRCCooldownError as e:
+                # Лимит twitchio сработал раньше нашего: вернём ответ в начало и подождём
+                logging.warning("Лимит сообщений в #%s: %s", self.name, e)
+                self.replies.appendleft(reply)
+                await asyncio.sleep(1)
+                continue
+            except Exception as e:
+                metrics.failed += 1
+                logging.error("Ошибка отправки в #%s: %s", self.name, e)
+                continue
+            metrics.record_sent(waited, time.perf_counter() - started)
+
+
+class OutboundMetrics:
+    """Счётчики очереди: глубина, время ожидания, склеенные, выброшенные и неотправленные строки."""
+
+    def __init__(self):
+        self.sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.send_time = Histogram()  # сколько занимает сама отправка в чат
+
+    def record_sent(self, waited, sending):
+        self.sent += 1
+        self.send_time.observe(sending)
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+
+class OutboundQueue:
+    """Исходящие сообщения всех каналов бота."""
+
+    def __init__(self, max_age=30, backlog=10):
+        self.max_age = max_age
+        self.backlog = backlog
+        self.channels = {}
+        self.metrics = OutboundMetrics()
+
+    def put(self, ctx, text):
+        """Поставить строку в очередь канала. Строки одного зрителя склеиваются."""
+        name = ctx.channel.name
+        queue = self.channels.get(name)
+        if queue is None:
+            queue = self.channels[name] = ChannelQueue(name, self.max_age, self.backlog)
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(queue.run(self.metrics))
+        queue.put(ctx, ctx.author.name.lower(), str(text), self.metrics)
+
+    def depth(self):
+        """Сколько ответов ждут отправки во всех каналах."""
+        return sum(len(queue.replies) for queue in self.channels.values())
+
+    def stats(self):
+        """Метрики очереди для логов и мониторинга."""
+        m = self.metrics
+        return {
+            'depth': self.depth(),
+            'max_depth': m.max_depth,
+            'sent': m.sent,
+            'merged': m.merged,
+            'dropped': m.dropped,
+            'failed': m.failed,
+            'wait_avg': m.wait_total / m.sent if m.sent else 0.0,
+            'wait_max': m.wait_max,
+        }
+
+    async def drain(self, timeout):
+        """Дать очереди до timeout секунд на отправку оставшегося, затем остановить задачи."""
+        deadline = time.monotonic() + timeout
+        while self.depth() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for queue in self.channels.values():
+            if queue.task is not None:
+                queue.task.cancel()
+
+
+class OutboundContext(commands.Context):
+    """Контекст команды, ответы которого уходят через очередь бота (bot.outbound)."""
+
+    async def send(self, content):
+        self.bot.outbound.put(self, content)
+
+    async def send_now(self, content):
+        """Отправить сразу, минуя очередь."""
+        await super().send(content)
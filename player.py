@@ -0,0 +1,226 @@
+"""Игрок и его экипировка в памяти.
+
+Объекты со __slots__ заметно компактнее словарей, когда игроков сотни тысяч, а доступ
+к атрибуту дешевле поиска по строковому ключу. На диск игроки уходят словарями:
+to_dict и from_dict переводят между представлениями, формат файлов при этом не меняется.
+"""
+
+
+class Equipment:
+    """Предметы, надетые в слоты. Пустой слот — None."""
+
+    SLOTS = ('weapon', 'armor', 'helmet', 'pet', 'amulet')
+    __slots__ = SLOTS
+
+    def __init__(self, weapon=None, armor=None, helmet=None, pet=None, amulet=None):
+        self.weapon = weapon
+        self.armor = armor
+        self.helmet = helmet
+        self.pet = pet
+        self.amulet = amulet
+
+    # Слот часто приходит строкой из чата или из описания предмета, поэтому доступ по имени
+    # слота тоже есть; чужие имена не пропускаются к произвольным атрибутам объекта
+    def __getitem__(self, slot):
+        if slot not in self.SLOTS:
+            raise KeyError(slot)
+        return getattr(self, slot)
+
+    def __setitem__(self, slot, item_name):
+        if slot not in self.SLOTS:
+            raise KeyError(slot)
+        setattr(self, slot, item_name)
+
+    def __contains__(self, slot):
+        return slot in self.SLOTS
+
+    def get(self, slot, default=None):
+        """Предмет в слоте или default, если такого слота нет."""
+        return getattr(self, slot) if slot in self.SLOTS else default
+
+    def items(self):
+        """Пары (слот, предмет) в постоянном порядке слотов."""
+        return [(slot, getattr(self, slot)) for slot in self.SLOTS]
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.SLOTS}
+
+    @classmethod
+    def from_dict(cls, data):
+        # Слоты, которых больше нет, молча отбрасываются
+        return cls(**{slot: data.get(slot) for slot in cls.SLOTS})
+
+
+class Inventory:
+    """Предметы игрока как мультимножество: ключ — название в нижнем регистре, значение — количество.
+
+    Поиск не зависит от регистра, а для вывода хранится написание, под которым предмет
+    попал в инвентарь (обычно это ключ ITEMS).
+    """
+
+    __slots__ = ('counts', 'names')
+
+    def __init__(self):
+        self.counts = {}
+        self.names = {}
+
+    @staticmethod
+    def key(item_name):
+        return item_name.strip().lower()
+
+    def add(self, item_name, count=1):
+        key = self.key(item_name)
+        if key not in self.counts:
+            self.counts[key] = 0
+            self.names[key] = item_name.strip()
+        self.counts[key] += count
+
+    def remove(self, item_name, count=1):
+        """Убрать предметы и вернуть их название для вывода. KeyError, если их не хватает."""
+        key = self.key(item_name)
+        have = self.counts.get(key, 0)
+        if have < count:
+            raise KeyError(item_name)
+        name = self.names[key]
+        if have == count:
+            del self.counts[key]
+            del self.names[key]
+        else:
+            self.counts[key] = have - count
+        return name
+
+    def count(self, item_name):
+        return self.counts.get(self.key(item_name), 0)
+
+    def display(self, item_name):
+        """Название предмета в том написании, в каком он лежит в инвентаре, или None."""
+        return self.names.get(self.key(item_name))
+
+    def __contains__(self, item_name):
+        return self.key(item_name) in self.counts
+
+    def __bool__(self):
+        return bool(self.counts)
+
+    def __len__(self):
+        """Число разных предметов."""
+        return len(self.counts)
+
+    def items(self):
+        """Пары (название, количество) в порядке появления предметов."""
+        return [(self.names[key], count) for key, count in self.counts.items()]
+
+    def item_names(self):
+        """Названия разных предметов в порядке появления."""
+        return list(self.names.values())
+
+    def to_dict(self):
+        return {self.names[key]: count for key, count in self.counts.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        inventory = cls()
+        for item_name, count in data.items():
+            inventory.add(item_name, count)
+        return inventory
+
+    @classmethod
+    def from_list(cls, item_names):
+        inventory = cls()
+        for item_name in item_names:
+            inventory.add(item_name)
+        return inventory
+
+
+class CombatStats:
+    """Производные боевые характеристики игрока: всё, что зависит только от уровня,
+    экипировки, расы и класса."""
+
+    __slots__ = ('attack_min', 'attack_max', 'hp_bonus', 'max_hp', 'damage_min', 'damage_max', 'steal_chance')
+
+    def __init__(self, attack_min, attack_max, hp_bonus, max_hp, damage_min, damage_max, steal_chance):
+        self.attack_min = attack_min
+        self.attack_max = attack_max
+        self.hp_bonus = hp_bonus
+        self.max_hp = max_hp
+        self.damage_min = damage_min
+        self.damage_max = damage_max
+        self.steal_chance = steal_chance
+
+    @property
+    def damage_range(self):
+        return f'{self.damage_min}-{self.damage_max}'
+
+
+class Player:
+    """Персонаж игрока. Поля совпадают с ключами сохранения, кроме class → player_class.
+
+    stats — кэш CombatStats, он не сохраняется. Кто меняет уровень, экипировку, расу
+    или класс, обязан вызвать invalidate_stats(). escrowed — золото, удержанное под
+    ставки открытых вызовов на дуэль: оно уже списано с gold и вернётся при отмене.
+    """
+
+    __slots__ = (
+        'level', 'xp', 'gold', 'inventory', 'equipment',
+        'last_xp_time', 'last_fight_time', 'last_pvp_time',
+        'pvp_wins', 'pvp_losses', 'prison', 'prison_until',
+        'race', 'player_class', 'current_hp',
+        'xp_buff_until', 'xp_penalty', 'attack_buff_until',
+        'steal_time_unteal', 'alms_unteal', 'escrowed', 'stats',
+    )
+
+    def __init__(self, current_hp, level=1, xp=0, gold=0, inventory=None, equipment=None,
+                 last_xp_time=0, last_fight_time=0, last_pvp_time=0, pvp_wins=0, pvp_losses=0,
+                 prison=False, prison_until=0, race=None, player_class=None,
+                 xp_buff_until=0, xp_penalty=False, attack_buff_until=0,
+                 steal_time_unteal=0, alms_unteal=0, escrowed=0):
+        self.level = level
+        self.xp = xp
+        self.gold = gold
+        self.inventory = Inventory() if inventory is None else inventory
+        self.equipment = Equipment() if equipment is None else equipment
+        self.last_xp_time = last_xp_time
+        self.last_fight_time = last_fight_time
+        self.last_pvp_time = last_pvp_time
+        self.pvp_wins = pvp_wins
+        self.pvp_losses = pvp_losses
+        self.prison = prison
+        self.prison_until = prison_until
+        self.race = race
+        self.player_class = player_class
+        self.current_hp = current_hp
+        self.xp_buff_until = xp_buff_until
+        self.xp_penalty = xp_penalty
+        self.attack_buff_until = attack_buff_until
+        self.steal_time_unteal = steal_time_unteal
+        self.alms_unteal = alms_unteal
+        self.escrowed = escrowed
+        self.stats = None
+
+    def invalidate_stats(self):
+        """Сбросить кэш боевых характеристик."""
+        self.stats = None
+
+    def to_dict(self):
+        """Словарь для сохранения. Инвентарь и экипировка копируются, поэтому результат
+        можно сериализовать в другом потоке, пока игрок меняется."""
+        data = {field: getattr(self, field) for field in self.__slots__ if field != 'stats'}
+        data['class'] = data.pop('player_class')
+        data['inventory'] = self.inventory.to_dict()
+        data['equipment'] = self.equipment.to_dict()
+        return data
+
+    def restore(self, data):
+        """Вернуть все поля к словарю из to_dict(), сохранив сам объект (откат транзакции)."""
+        restored = Player.from_dict(data)
+        for field in self.__slots__:
+            setattr(self, field, getattr(restored, field))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Игрок из сохранённого словаря актуальной версии схемы (см. migrations.py)."""
+        fields = dict(data)
+        fields['player_class'] = fields.pop('class')
+        fields['equipment'] = Equipment.from_dict(fields['equipment'])
+        fields['inventory'] = Inventory.from_dict(fields['inventory'])
+        return cls(**fields)
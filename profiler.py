@@ -0,0 +1,133 @@
+"""Профилирование работающего бота без перезапуска.
+
+Поток профилировщика раз в interval секунд снимает стек потока цикла событий
+(sys._current_frames) и считает одинаковые стеки. Бот при этом не замедляется: поток
+просыпается на доли миллисекунды, ничего не трассируется. По окончании записываются два
+файла:
+
+    profile-<время>.folded — свёрнутые стеки «кадр;кадр;кадр число», их понимают
+                             flamegraph.pl, speedscope и inferno;
+    profile-<время>.txt    — топ функций по собственному и полному числу попаданий.
+
+SlowCommands помнит последние медленные вызовы команд с аргументами; при старте профиля
+их список сразу пишется в profile-<время>-slow.txt.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+
+class SlowCommands:
+    """Кольцевой буфер последних вызовов команд дольше threshold секунд."""
+
+    def __init__(self, size=100, threshold=0.05):
+        self.threshold = threshold
+        self.calls = deque(maxlen=size)
+
+    def record(self, seconds, user, command, content):
+        if seconds >= self.threshold:
+            self.calls.append((seconds, time.time(), user, command, content))
+
+    def snapshot(self):
+        """Вызовы от самого медленного к самому быстрому."""
+        return sorted(self.calls, key=lambda call: call[0], reverse=True)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def collapse(frame):
+    """Стек от корня к текущему кадру одной строкой через ';'."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def sample(thread_id, duration, interval):
+    """Снимать стек потока thread_id каждые interval секунд в течение duration. Counter свёрнутых стеков.
+
+    Снимки идут по фиксированной сетке от начала профиля, а не «interval после прошлого
+    снимка», поэтому задержка получения GIL не копится и не сдвигает частоту. Интервал
+    переключения GIL не трогается: профиль не должен замедлять цикл событий и поток записи.
+    """
+    stacks = Counter()
+    started = time.monotonic()
+    deadline = started + duration
+    tick = 0
+    while True:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break  # поток завершился
+        stacks[collapse(frame)] += 1
+        del frame
+        tick += 1
+        delay = started + tick * interval - time.monotonic()
+        if delay < 0:
+            # Опоздали больше чем на интервал: пропускаем отметки, а не снимаем их пачкой
+            tick += int(-delay // interval) + 1
+            delay = started + tick * interval - time.monotonic()
+        if started + tick * interval >= deadline:
+            break
+        time.sleep(max(delay, 0))
+    return stacks
+
+
+def summary(stacks, top):
+    """Топ функций: собственные попадания (функция на вершине стека) и полные (где-либо в стеке)."""
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for name in set(frames):
+            total[name] += count
+    samples = sum(stacks.values()) or 1
+    lines = [f'Снимков: {sum(stacks.values())}', '', 'Собственное время:']
+    lines += [f'{count / samples:7.1%} {count:7} {name}' for name, count in own.most_common(top)]
+    lines += ['', 'Полное время:']
+    lines += [f'{count / samples:7.1%} {count:7} {name}' for name, count in total.most_common(top)]
+    return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """Профиль цикла событий на duration секунд в отдельном потоке. Одновременно идёт не больше одного."""
+
+    def __init__(self, directory, interval=0.005, top=30):
+        self.directory = directory
+        self.interval = interval
+        self.top = top
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration, slow_commands):
+        """Начать профиль потока, из которого вызван метод. Префикс файлов или None, если профиль уже идёт."""
+        if self.running:
+            return None
+        prefix = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S'))
+        self.thread = threading.Thread(target=self.run, name='profiler', daemon=True,
+                                       args=(threading.get_ident(), duration, prefix, slow_commands.snapshot()))
+        self.thread.start()
+        return prefix
+
+    def run(self, thread_id, duration, prefix, slow):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(prefix + '-slow.txt', 'w', encoding='utf-8') as f:
+            for seconds, when, user, command, content in slow:
+                f.write(f'{seconds * 1000:9.1f} мс  {time.strftime("%H:%M:%S", time.localtime(when))}  '
+                        f'{user}  {command}  {content}\n')
+        stacks = sample(thread_id, duration, self.interval)
+        with open(prefix + '.folded', 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(prefix + '.txt', 'w', encoding='utf-8') as f:
+            f.write(summary(stacks, self.top))
+        logging.info("Профиль записан: %s.folded, %s.txt", prefix, prefix)
@@ -0,0 +1,193 @@
+"""Запись чата и детерминированное воспроизведение записи.
+
+Запись. С RECORD_FILE в settings.py бот пишет каждую допущенную к выполнению команду:
+время по часам бота, ник, текст, модератор ли автор. Файл — строки JSON в gzip; первая
+строка — заголовок с зерном генератора случайных чисел бота и временем запуска. Пишет
+отдельный поток, цикл событий только кладёт запись в очередь.
+
+Воспроизведение. Бот собирается через offline.py с подменёнными часами (время каждого
+сообщения берётся из записи) и генератором, засеянным зерном из заголовка, и выполняет
+команды по очереди: как можно быстрее или в реальном темпе (--speed). Таймеры
+планировщика — конец тюрьмы и баффов, истечение дуэлей, смена чёрного рынка — вызываются
+между сообщениями по тем же подменённым часам. Одна и та же запись на одном и том же
+коде всегда даёт одно и то же итоговое состояние игроков; его можно сохранить (--dump) и
+сравнить с состоянием другого прогона или с сохранением бота (--compare).
+
+Живой прогон совпадает с воспроизведением, пока команды не выполнялись одновременно:
+если две команды ждали хранилище или замок игрока, их броски могли перемешаться.
+
+    python replay.py session.jsonl.gz [--players players.json] [--speed 0] [--dump final.json] [--compare other.json]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import queue
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from offline import create_bot, invoke
+from snapshot import SCHEMA_KEY
+
+FORMAT = 'rpg-chat'
+VERSION = 1
+
+
+class Recorder:
+    """Запись команд чата в файл path (в нём можно указать поля time.strftime). Пишет поток recorder."""
+
+    def __init__(self, path, seed, started):
+        self.path = time.strftime(path)
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.write, args=(self.path,), name='recorder', daemon=True)
+        self.queue.put({'format': FORMAT, 'version': VERSION, 'seed': seed, 'started': started})
+        self.thread.start()
+
+    def record(self, when, user, content, is_mod=False, reply=False):
+        self.queue.put([when, user, content, int(is_mod) | int(reply) << 1])
+
+    def write(self, path):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    break
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+                if self.queue.empty():
+                    f.flush()
+
+    def close(self):
+        """Дописать очередь и закрыть файл."""
+        self.queue.put(None)
+        self.thread.join()
+
+
+def read_session(path):
+    """Заголовок записи и список сообщений [время, ник, текст, флаги]."""
+    messages = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != FORMAT or header.get('version') != VERSION:
+            raise ValueError(f"{path}: не запись чата версии {VERSION}")
+        try:
+            for line in f:
+                messages.append(json.loads(line))
+        except (EOFError, ValueError):
+            pass  # бот остановился аварийно и не дописал файл: берём всё, что успело записаться
+    return header, messages
+
+
+class ReplayClock:
+    """Подменённые часы: показывают время, выставленное последним set()."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def set(self, now):
+        self.now = max(self.now, now)  # часы не идут назад, даже если записи пришли не по порядку
+
+
+def player_state(bot):
+    return {name: player.to_dict() for name, player in sorted(bot.players.items())}
+
+
+def load_state(path):
+    """Состояние из --dump или сохранение бота в формате JSON: с версией схемы игроки лежат под
+    ключом 'players', в старых сохранениях — на верхнем уровне рядом со служебными ключами."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if SCHEMA_KEY in data:
+        data = data['players']
+    return {name: player for name, player in data.items() if not name.startswith('_')}
+
+
+def diff_states(old, new):
+    """Строки с различиями двух состояний игроков."""
+    lines = []
+    for name in sorted(old.keys() | new.keys()):
+        if name not in new:
+            lines.append(f'- {name}')
+        elif name not in old:
+            lines.append(f'+ {name}')
+        else:
+            for field in sorted(old[name].keys() | new[name].keys()):
+                if old[name].get(field) != new[name].get(field):
+                    lines.append(f'~ {name}.{field}: {old[name].get(field)!r} -> {new[name].get(field)!r}')
+    return lines
+
+
+async def replay(bot, clock, messages, speed=0):
+    """Выполнить сообщения записи. Число выполненных команд и ошибок."""
+    bot.restore_timers()
+    started, first = time.perf_counter(), messages[0][0] if messages else 0
+    done = errors = 0
+    for when, user, content, flags in messages:
+        if speed:
+            delay = (when - first) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        clock.set(when)
+        bot.scheduler.run_due()
+        if flags & 2:
+            content = content.split(None, 1)[-1]  # в ответе на сообщение первым идёт @ник адресата
+        try:
+            if await invoke(bot, user, content, is_mod=bool(flags & 1)) is not None:
+                done += 1
+        except Exception:
+            errors += 1
+        await asyncio.sleep(0)  # дать выполниться задачам, запущенным таймерами
+    return done, errors
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Воспроизвести записанный чат на текущем коде бота')
+    parser.add_argument('session', help='файл записи (RECORD_FILE)')
+    parser.add_argument('--players', help='сохранение бота на момент начала записи; без него игроков нет')
+    parser.add_argument('--backend', choices=('json', 'journal', 'sqlite'), default='json', help='формат --players')
+    parser.add_argument('--snapshot-format', choices=('json', 'binary'), default='json')
+    parser.add_argument('--speed', type=float, default=0, help='1 — в реальном темпе, 0 — как можно быстрее')
+    parser.add_argument('--dump', help='записать итоговое состояние игроков в JSON')
+    parser.add_argument('--compare', help='сравнить итоговое состояние с --dump другого прогона или сохранением JSON')
+    args = parser.parse_args()
+
+    header, messages = read_session(args.session)
+    clock = ReplayClock(header['started'])
+    with tempfile.TemporaryDirectory(prefix='rpg-replay-') as directory:
+        save_file = os.path.join(directory, os.path.basename(args.players) if args.players else 'players.json')
+        if args.players:
+            shutil.copyfile(args.players, save_file)
+        bot = create_bot({
+            'SAVE_FILE': save_file,
+            'STORAGE_BACKEND': args.backend,
+            'SNAPSHOT_FORMAT': args.snapshot_format,
+            'LOG_FILE': os.path.join(directory, 'bot.log'),
+            'PROFILE_DIR': os.path.join(directory, 'profiles'),
+        }, clock=clock, rng=random.Random(header['seed']))
+        started = time.perf_counter()
+        done, errors = await replay(bot, clock, messages, args.speed)
+        seconds = time.perf_counter() - started
+        state = player_state(bot)
+        bot.store.close()
+
+    span = messages[-1][0] - messages[0][0] if messages else 0
+    print(f'Команд: {done} из {len(messages)}, ошибок: {errors}; запись длиной {span / 60:.1f} мин '
+          f'воспроизведена за {seconds:.2f} с')
+    if args.dump:
+        with open(args.dump, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+    if args.compare:
+        lines = diff_states(load_state(args.compare), state)
+        print('\n'.join(lines) if lines else 'Состояние игроков совпадает')
+        if lines:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
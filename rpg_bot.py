@@ -1,177 +1,483 @@
+import time
+STARTED = time.perf_counter()  # начало импорта, от него считается отчёт о запуске
 import asyncio
-import json
-import os
 import random
-import time
-import shutil
+import signal
 import logging
-from collections import Counter
-from filelock import FileLock
 from twitchio.ext import commands
-
-# Настройка логирования
-logging.basicConfig(filename='bot.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
+from storage import PlayerStore, open_storage
+from migrations import SCHEMA_VERSION, migrate
+from player import CombatStats, Inventory, Player
+from leaderboard import Leaderboard
+from combat import Damage, base_damage_range, calculate_hp, equipment_bonuses, resolve_fight, scale_monster
+from outbound import OutboundContext, OutboundQueue
+from dispatch import NO_CHARACTER, Amount, Nick, Text, Word, command, command_name, is_command, request_class
+from admission import Admission
+from transactions import PlayerLocks, Transaction
+from scheduler import Scheduler
+from duels import DuelRegistry
+from logs import setup_logging
+from metrics import Metrics
+from profiler import Profiler, SlowCommands
+from replay import Recorder
+
+SETTINGS_STARTED = time.perf_counter()
 try:
+    import settings
     from settings import TOKEN, CHANNEL, SAVE_FILE
-    from consts import MONSTERS, ITEM_DESCRIPTIONS, ITEMS, BLACK_MARKET_ITEMS
+    from consts import (MONSTERS, ITEM_DESCRIPTIONS, ITEMS, BLACK_MARKET_ITEMS, RACES, CLASSES, FIGHT_COOLDOWN,
+                        DUEL_TIMEOUT, BLACK_MARKET_ROTATION)
 except ImportError as e:
-    logging.error(f"Ошибка импорта настроек или констант: {e}")
+    logging.error("Ошибка импорта настроек или констант: %s", e)
     raise ImportError(f"Ошибка импорта настроек или констант: {e}")
 
-def calculate_hp(level):
-    """Рассчитать максимальное HP персонажа по уровню."""
-    return 30 + (level - 1) * 5
+# Необязательные настройки журнала
+LOG_FILE = getattr(settings, 'LOG_FILE', 'bot.log')
+LOG_MAX_BYTES = getattr(settings, 'LOG_MAX_BYTES', 10 * 1024 * 1024)  # размер файла журнала до ротации
+LOG_ROTATE_INTERVAL = getattr(settings, 'LOG_ROTATE_INTERVAL', 24 * 60 * 60)  # секунд до ротации, 0 — только по размеру
+LOG_BACKUPS = getattr(settings, 'LOG_BACKUPS', 14)  # сколько сжатых старых файлов хранить
+# Необязательные настройки отложенного сохранения
+SAVE_INTERVAL = getattr(settings, 'SAVE_INTERVAL', 5)  # секунд между фоновыми записями, 0 — сохранять сразу
+MAX_UNSAVED_SECONDS = getattr(settings, 'MAX_UNSAVED_SECONDS', 30)  # предел жизни несохранённых изменений
+STORAGE_BACKEND = getattr(settings, 'STORAGE_BACKEND', 'json')  # 'json', 'journal' или 'sqlite'
+JOURNAL_MAX_BYTES = getattr(settings, 'JOURNAL_MAX_BYTES', 4 * 1024 * 1024)  # размер журнала до слияния со снимком
+SNAPSHOT_FORMAT = getattr(settings, 'SNAPSHOT_FORMAT', 'json')  # 'json' или компактный 'binary'
+PLAYER_CACHE_SIZE = getattr(settings, 'PLAYER_CACHE_SIZE', 0)  # игроков в памяти, 0 — держать всех
+# Необязательные настройки очереди исходящих сообщений
+OUTBOUND_MAX_AGE = getattr(settings, 'OUTBOUND_MAX_AGE', 30)  # секунд, после которых неотправленный ответ выбрасывается
+OUTBOUND_BACKLOG = getattr(settings, 'OUTBOUND_BACKLOG', 10)  # глубина очереди, с которой ответы склеиваются в общие
+# Необязательные настройки допуска команд при наплыве зрителей
+ADMISSION_USER_RATE = getattr(settings, 'ADMISSION_USER_RATE', 0.5)  # команд в секунду на зрителя
+ADMISSION_USER_BURST = getattr(settings, 'ADMISSION_USER_BURST', 3)  # сколько команд зритель может прислать подряд
+ADMISSION_MAX_RUNNING = getattr(settings, 'ADMISSION_MAX_RUNNING', 8)  # команд, выполняемых одновременно
+ADMISSION_MAX_WAITING = getattr(settings, 'ADMISSION_MAX_WAITING', 50)  # длина очереди, дальше команды отбрасываются
+# Необязательные настройки метрик
+METRICS_HOST = getattr(settings, 'METRICS_HOST', '127.0.0.1')
+METRICS_PORT = getattr(settings, 'METRICS_PORT', 9108)  # порт страницы /metrics, 0 — не запускать сервер
+# Необязательные настройки профилирования (!профиль, SIGUSR1)
+PROFILE_DIR = getattr(settings, 'PROFILE_DIR', 'profiles')  # куда писать профили и списки медленных команд
+PROFILE_SECONDS = getattr(settings, 'PROFILE_SECONDS', 30)  # длительность профиля по умолчанию
+PROFILE_MAX_SECONDS = getattr(settings, 'PROFILE_MAX_SECONDS', 300)
+SLOW_COMMAND_MS = getattr(settings, 'SLOW_COMMAND_MS', 50)  # команды дольше этого попадают в список медленных
+SLOW_COMMANDS_KEPT = getattr(settings, 'SLOW_COMMANDS_KEPT', 100)  # сколько последних медленных команд помнить
+# Необязательная запись чата для воспроизведения (replay.py)
+RECORD_FILE = getattr(settings, 'RECORD_FILE', None)  # например 'session.jsonl.gz', None — не записывать
+SETTINGS_SECONDS = time.perf_counter() - SETTINGS_STARTED
+
+# Поля игрока со сроком окончания эффекта; по истечении их сбрасывает планировщик
+EFFECT_FIELDS = ('prison_until', 'attack_buff_until', 'xp_buff_until')
+# Поля игрока, изменения которых за команду попадают в журнал
+DELTA_FIELDS = ('gold', 'xp', 'level', 'current_hp')
+# Написание предмета в ITEMS по ключу инвентаря: в старых сохранениях предмет лежит так,
+# как его набрал вор в !кража ('деревянный меч'), а описание ищется по ITEMS
+ITEM_NAMES = {Inventory.key(name): name for name in ITEMS}
+
+
+def item_name_in(inventory, item_name):
+    """Название предмета из инвентаря в написании ITEMS, а если его нет в ITEMS — в написании инвентаря."""
+    return ITEM_NAMES.get(Inventory.key(item_name)) or inventory.display(item_name)
 
-def calculate_damage(level):
-    """Рассчитать базовый урон персонажа по уровню."""
-    return random.randint(5 + level * 2, 10 + level * 3)
 
 class RPGbot(commands.Bot):
     """Twitch RPG бот с системой уровней, боев, экономики и кражи."""
 
-    def __init__(self):
-        """Инициализация бота с загрузкой данных игроков и настройкой параметров."""
+    def __init__(self, clock=None, rng=None):
+        """Инициализация бота с загрузкой данных игроков и настройкой параметров.
+
+        Все обработчики берут время из self.clock, а случайность из self.rng. Для воспроизведения
+        записанного чата (replay.py) их подменяют: clock тогда же служит часами планировщика.
+        """
         super().__init__(token=TOKEN, prefix='!', initial_channels=[CHANNEL])
-        self.players = self.load_players()
+        self.clock = clock or time.time
+        self.rng = rng or random.Random()
+        self.recorder = None
+        if RECORD_FILE:
+            seed = random.randrange(2 ** 63)
+            self.rng.seed(seed)
+            self.recorder = Recorder(RECORD_FILE, seed, self.clock())
         self.black_market_items = []
-        self.black_market_last_refresh = 0
-        self.pending_duels = {}
-        self.races = {
-            'человек': {'hp_bonus': 5, 'xp_bonus': 0},
-            'эльф': {'hp_bonus': 0, 'xp_bonus': 0.1},
-            'орк': {'hp_bonus': 10, 'xp_bonus': -0.05}
-        }
-        self.classes = {
-            'воин': {'attack_bonus': (2, 5), 'hp_bonus': 10},
-            'маг': {'attack_bonus': (0, 3), 'xp_bonus': 0.1},
-            'вор': {'attack_bonus': (1, 4), 'steal_chance_bonus': 0.05}
-        }
+        self.duels = DuelRegistry()
+        self.races = RACES
+        self.classes = CLASSES
+        self.metrics = Metrics()  # время команд и этапов; нужно уже при загрузке игроков
+        self.storage = open_storage(STORAGE_BACKEND, SAVE_FILE, SCHEMA_VERSION, JOURNAL_MAX_BYTES, SNAPSHOT_FORMAT)
+        self.store = PlayerStore(self.storage, SAVE_INTERVAL, MAX_UNSAVED_SECONDS, PLAYER_CACHE_SIZE,
+                                 lambda players, version: migrate(players, version, self))
+        self.players = self.store.players  # пусто до load(); команды до конца загрузки ждут loaded
+        self.leaderboard = Leaderboard()
+        self.loaded = asyncio.Event()
+        self.load_error = None
+        self.startup = {}  # длительности этапов запуска, см. report_startup
+        self.flush_task = None
+        self.outbound = OutboundQueue(OUTBOUND_MAX_AGE, OUTBOUND_BACKLOG)
+        self.player_locks = PlayerLocks()
+        self.scheduler = Scheduler(clock or time.monotonic, self.clock)
+        self.admission = Admission(ADMISSION_USER_RATE, ADMISSION_USER_BURST, ADMISSION_MAX_RUNNING, ADMISSION_MAX_WAITING)
+        self.register_metrics()
+        self.profiler = Profiler(PROFILE_DIR)
+        self.slow_commands = SlowCommands(SLOW_COMMANDS_KEPT, SLOW_COMMAND_MS / 1000)
+
+    def register_metrics(self):
+        """Показатели игроков, дуэлей и очередей, которые снимаются при запросе метрик."""
+        metrics = self.metrics
+        metrics.phases['send'] = self.outbound.metrics.send_time
+        metrics.gauge('players_resident', 'Игроков в памяти.', lambda: len(self.players))
+        metrics.gauge('players_unsaved', 'Изменённых игроков, ждущих записи.', lambda: len(self.store.dirty))
+        metrics.gauge('unsaved_seconds', 'Возраст самого старого несохранённого изменения.', self.store.unsaved_seconds)
+        metrics.gauge('duels_pending', 'Открытых вызовов на дуэль.', lambda: len(self.duels))
+        metrics.gauge('timers_pending', 'Таймеров в планировщике.', lambda: len(self.scheduler))
+        metrics.gauges_from('outbound', 'Очередь исходящих сообщений', self.outbound.stats)
+        metrics.gauges_from('admission', 'Допуск команд', self.admission.stats)
+        metrics.gauges_from('cache', 'Кэш игроков', self.store.cache_stats)
+
+    async def load(self):
+        """Загрузить игроков в отдельном потоке, пока бот подключается к чату, и пропустить ждущие команды."""
+        started = time.perf_counter()
+        try:
+            self.players = await asyncio.get_running_loop().run_in_executor(None, self.load_players)  # to_thread есть только с 3.9
+        except Exception as e:
+            # Продолжать с пустыми игроками нельзя: первая же запись затёрла бы сохранение и его копию
+            logging.exception("Ошибка загрузки %s: %s", SAVE_FILE, e)
+            print(f"⚠️ Ошибка загрузки {SAVE_FILE}: {e}. Бот остановлен, сохранение не тронуто")
+            self.load_error = e
+            self.loop.stop()  # run() закроет бота; хранилище без загрузки ничего не запишет
+            return
+        self.startup['load'] = time.perf_counter() - started
+        self.loaded.set()
 
     def load_players(self):
-        """Загрузить данные игроков из JSON-файла с проверкой структуры."""
-        if not os.path.exists(SAVE_FILE):
-            logging.info(f"Файл {SAVE_FILE} не существует, создаётся пустой словарь игроков.")
-            return {}
-
-        lock = FileLock(f"{SAVE_FILE}.lock")
-        with lock:
-            try:
-                with open(SAVE_FILE, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if not content:
-                        logging.warning(f"Файл {SAVE_FILE} пуст.")
-                        return {}
-                    players = json.loads(content)
-                    # Дополняем старые данные новыми полями
-                    default_player = {
-                        'level': 1,
-                        'xp': 0,
-                        'gold': 15,
-                        'inventory': [],
-                        'equipment': {'weapon': None, 'armor': None, 'helmet': None, 'pet': None, 'amulet': None},
-                        'last_xp_time': 0,
-                        'last_fight_time': 0,
-                        'last_pvp_time': 0,
-                        'pvp_wins': 0,
-                        'pvp_losses': 0,
-                        'prison': False,
-                        'prison_until': 0,
-                        'race': None,
-                        'class': None,
-                        'current_hp': None
-                    }
-                    for user, data in players.items():
-                        for key, value in default_player.items():
-                            if key not in data:
-                                data[key] = value
-                        # Устанавливаем current_hp, если не задано
-                        if data['current_hp'] is None:
-                            data['current_hp'] = calculate_hp(data['level']) + self.get_equipment_bonuses(data)[2]
-                    return players
-            except (json.JSONDecodeError, IOError) as e:
-                logging.error(f"Ошибка загрузки {SAVE_FILE}: {e}")
-                print(f"⚠️ Ошибка загрузки {SAVE_FILE}: {e}")
-                return {}
+        """Загрузить данные игроков из хранилища. Ошибки чтения и слишком новая схема не глотаются."""
+        players = self.players = self.store.load()
+        self.leaderboard = Leaderboard(self.store.rank_entries())
+        self.release_escrow(list(players))
+        return players
+
+    def release_escrow(self, names):
+        """Вернуть игрокам, только что прочитанным из хранилища, ставки вызовов, которых больше нет.
+
+        Удержанное золото сохраняется вместе с игроком, а вызовы живут только в памяти: после
+        падения бота ставки остаются в escrowed без вызовов. Удержанным считается столько,
+        сколько стоят открытые вызовы игрока в реестре, остальное возвращается в gold.
+        Игрока, которого только что прочитали, не держит ни одна команда, поэтому менять его
+        можно без замка.
+        """
+        released = []
+        for name in names:
+            player = self.players.get(name)
+            if player is None or not player.escrowed:
+                continue
+            held = sum(duel.amount for duel in self.duels.outgoing(name))
+            if player.escrowed != held:
+                logging.info("%s возвращено %s золота ставок закрытых вызовов", name, player.escrowed - held)
+                player.gold += player.escrowed - held
+                player.escrowed = held
+                released.append(name)
+        if released:
+            self.store.mark_dirty(*released)
+
+    def get_stats(self, player):
+        """Боевые характеристики игрока из кэша; пересчитываются только после invalidate_stats()."""
+        stats = player.stats
+        if stats is None:
+            started = time.perf_counter()
+            stats = player.stats = self.compute_stats(player)
+            self.metrics.observe('stats', time.perf_counter() - started)
+        return stats
+
+    def compute_stats(self, player):
+        """Рассчитать боевые характеристики игрока с нуля."""
+        attack_min, attack_max, hp_bonus = self.get_equipment_bonuses(player)
+        base_min, base_max = base_damage_range(player.level)
+        steal_chance = 0.1 + (self.classes[player.player_class].get('steal_chance_bonus', 0) if player.player_class else 0)
+        if player.equipment.amulet == 'Амулет удачи':
+            steal_chance += ITEMS['Амулет удачи']['effect']['steal_chance_bonus']
+        return CombatStats(
+            attack_min, attack_max, hp_bonus,
+            max_hp=calculate_hp(player.level) + hp_bonus,
+            damage_min=base_min + attack_min,
+            damage_max=base_max + attack_max,
+            steal_chance=steal_chance,
+        )
 
     def save_players(self):
-        """Сохранить данные игроков в JSON-файл с резервной копией."""
-        lock = FileLock(f"{SAVE_FILE}.lock")
-        with lock:
-            try:
-                # Создаём резервную копию
-                if os.path.exists(SAVE_FILE):
-                    shutil.copy(SAVE_FILE, f"{SAVE_FILE}.bak")
-                    logging.info(f"Создана резервная копия {SAVE_FILE}.bak")
-                with open(SAVE_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(self.players, f, ensure_ascii=False, indent=2)
-                logging.info(f"Данные игроков сохранены в {SAVE_FILE}")
-            except IOError as e:
-                logging.error(f"Ошибка сохранения {SAVE_FILE}: {e}")
-                print(f"⚠️ Ошибка сохранения {SAVE_FILE}: {e}")
+        """Поставить запись изменённых игроков в очередь потока ввода-вывода."""
+        started = time.perf_counter()
+        self.store.schedule_write()
+        self.metrics.observe('persistence', time.perf_counter() - started)
+
+    def mark_dirty(self, *users):
+        """Пометить игроков изменёнными и обновить их место в рейтинге. На диск их запишет фоновый флашер."""
+        started = time.perf_counter()
+        for user in users:
+            player = self.players.get(user)
+            if player is not None:
+                self.leaderboard.update(user, player.level, player.xp)
+        self.store.mark_dirty(*users)
+        self.metrics.observe('persistence', time.perf_counter() - started)
 
     def try_level_up(self, player):
         """Проверить и повысить уровень игрока, если достаточно XP."""
         leveled_up = False
-        while player['xp'] >= player['level'] * 100:
-            player['xp'] -= player['level'] * 100
-            player['level'] += 1
+        while player.xp >= player.level * 100:
+            player.xp -= player.level * 100
+            player.level += 1
+            player.invalidate_stats()
             leveled_up = True
             # Обновляем максимальное HP при повышении уровня
-            player['current_hp'] = calculate_hp(player['level']) + self.get_equipment_bonuses(player)[2]
+            player.current_hp = self.get_stats(player).max_hp
         return leveled_up
 
     def get_equipment_bonuses(self, player):
         """Рассчитать бонусы от экипировки и класса."""
-        equip = player.get('equipment', {})
-        attack_bonus_min, attack_bonus_max, hp_bonus = 0, 0, 0
-
-        for slot, item_name in equip.items():
-            if item_name and item_name in ITEMS:
-                item = ITEMS[item_name]
-                ab_min, ab_max = item['attack_bonus'] if isinstance(item['attack_bonus'], tuple) else (item['attack_bonus'], item['attack_bonus'])
-                attack_bonus_min += ab_min
-                attack_bonus_max += ab_max
-                hp_bonus += item.get('hp_bonus', 0)
-
-        # Бонусы от класса
-        player_class = player.get('class')
-        if player_class in self.classes:
-            class_info = self.classes[player_class]
-            ab_min, ab_max = class_info['attack_bonus'] if isinstance(class_info['attack_bonus'], tuple) else (class_info['attack_bonus'], class_info['attack_bonus'])
-            attack_bonus_min += ab_min
-            attack_bonus_max += ab_max
-            hp_bonus += class_info.get('hp_bonus', 0)
-
-        return attack_bonus_min, attack_bonus_max, hp_bonus
+        return equipment_bonuses([item_name for _, item_name in player.equipment.items()], player.player_class)
+
+    async def global_before_invoke(self, ctx):
+        """Подгрузить из хранилища автора команды. Игроков из аргументов подгружает dispatch.command."""
+        ctx.started = time.perf_counter()
+        ctx.pinned_players = set()
+        ctx.players_before = {}
+        await self.load_players_for(ctx, ctx.author.name.lower())
+
+    async def global_after_invoke(self, ctx):
+        """Разрешить вытеснять игроков, с которыми работала команда, записать её время в метрики и журнал."""
+        self.store.unpin(getattr(ctx, 'pinned_players', ()))
+        if not hasattr(ctx, 'started'):
+            return
+        seconds = time.perf_counter() - ctx.started
+        command = ctx.command.name if ctx.command else None
+        self.metrics.observe_command(command, seconds)
+        user = ctx.author.name.lower()
+        self.slow_commands.record(seconds, user, command, ctx.message.content)
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            latency_ms = round(seconds * 1000, 1)
+            logging.info("Команда %s от %s за %s мс", command, user, latency_ms,
+                         extra={'event': 'command', 'user': user, 'command': command,
+                                'latency_ms': latency_ms, 'deltas': self.player_deltas(ctx)})
+
+    async def event_command_error(self, ctx, error):
+        """Посчитать ошибку команды в метриках и передать её стандартному обработчику twitchio."""
+        if ctx.command:
+            self.metrics.error(ctx.command.name)
+        await super().event_command_error(ctx, error)
+
+    async def load_players_for(self, ctx, *names):
+        """Подгрузить игроков и закрепить их в памяти до конца команды."""
+        names = set(names) - ctx.pinned_players
+        ctx.pinned_players |= names
+        self.store.pin(names)
+        missing = [name for name in names if name not in self.players]
+        await self.store.prefetch(names)
+        self.release_escrow(missing)
+        for name in names:
+            player = self.players.get(name)
+            ctx.players_before[name] = None if player is None else tuple(getattr(player, f) for f in DELTA_FIELDS)
+
+    def player_deltas(self, ctx):
+        """Изменения DELTA_FIELDS игроков команды: {ник: {поле: разница}}, только ненулевые."""
+        deltas = {}
+        for name, before in ctx.players_before.items():
+            player = self.players.get(name)
+            if player is None or before is None:
+                continue
+            changed = {f: getattr(player, f) - old for f, old in zip(DELTA_FIELDS, before) if getattr(player, f) != old}
+            if changed:
+                deltas[name] = changed
+        return deltas
+
+    def transaction(self, *users):
+        """Транзакция над игроками users: замки по порядку ников, откат при ошибке (см. transactions.py)."""
+        return Transaction(self.player_locks, self.players, users, self.mark_dirty)
 
     async def check_cooldown(self, player, key, cooldown, ctx):
         """Проверить кулдаун для действия."""
-        now = time.time()
-        last_time = player.get(key, 0)
+        now = self.clock()
+        last_time = getattr(player, key)
         if now - last_time < cooldown:
             remain = int(cooldown - (now - last_time))
             await ctx.send(f'{ctx.author.name}, подожди {remain} секунд.')
             return False
-        player[key] = now
+        setattr(player, key, now)
         return True
 
     def refresh_black_market(self):
         """Обновить ассортимент черного рынка."""
-        self.black_market_items = random.sample(BLACK_MARKET_ITEMS, k=min(3, len(BLACK_MARKET_ITEMS)))
-        self.black_market_last_refresh = time.time()
+        self.black_market_items = self.rng.sample(BLACK_MARKET_ITEMS, k=min(3, len(BLACK_MARKET_ITEMS)))
         logging.info("Чёрный рынок обновлён")
 
+    def rotate_black_market(self):
+        """Сменить товары чёрного рынка и поставить следующую смену."""
+        self.refresh_black_market()
+        self.scheduler.call_later(BLACK_MARKET_ROTATION, self.rotate_black_market, key='black_market')
+
+    def schedule_effects(self, user):
+        """Поставить таймеры окончания тюрьмы и баффов игрока по срокам, записанным в нём."""
+        player = self.players[user]
+        now = self.clock()
+        for field in EFFECT_FIELDS:
+            until = getattr(player, field)
+            if until > now:
+                self.scheduler.call_at_epoch(until, self.expire_effect, user, field, key=(field, user))
+
+    async def expire_effect(self, user, field):
+        """Выпустить игрока из тюрьмы или снять закончившийся бафф. Под замком игрока, как команды."""
+        if user not in self.players:
+            return  # игрок вытеснен из памяти; при загрузке срок проверят команды
+        async with self.transaction(user):
+            player = self.players.get(user)
+            if player is None:
+                return
+            until = getattr(player, field)
+            if until > self.clock() + 1:
+                # Срок продлили, а таймер остался старый (или системные часы перевели назад)
+                self.scheduler.call_at_epoch(until, self.expire_effect, user, field, key=(field, user))
+                return
+            setattr(player, field, 0)
+            if field == 'prison_until':
+                player.prison = False
+        logging.info("У %s закончился эффект %s", user, field)
+
+    async def cancel_duel(self, duel):
+        """Снять вызов и вернуть вызывающему удержанную ставку. False, если вызова уже нет."""
+        if self.duels.remove(duel.challenger, duel.target) is not duel:
+            return False
+        self.scheduler.cancel(('duel', duel.challenger, duel.target))
+        if duel.amount:
+            self.store.pin([duel.challenger])
+            try:
+                await self.store.prefetch([duel.challenger])
+                async with self.transaction(duel.challenger):
+                    player = self.players.get(duel.challenger)
+                    if player is None:
+                        logging.error("Не удалось вернуть ставку %s: игрок %s не найден", duel.amount, duel.challenger)
+                    else:
+                        player.escrowed -= duel.amount
+                        player.gold += duel.amount
+            finally:
+                self.store.unpin([duel.challenger])
+        return True
+
+    async def expire_duel(self, challenger, target, ctx):
+        """Снять вызов на дуэль, который не приняли за DUEL_TIMEOUT секунд, и вернуть ставку."""
+        duel = self.duels.get(challenger, target)
+        if duel is None or not await self.cancel_duel(duel):
+            return
+        logging.info("Вызов %s на дуэль с %s истёк", challenger, target)
+        refund = f', ставка {duel.amount} золота возвращена' if duel.amount else ''
+        await ctx.send(f'⌛ @{target} не принял вызов {challenger}, дуэль отменена{refund}.')
+
+    def restore_timers(self):
+        """Поставить таймеры заново после запуска: сроки эффектов хранятся в игроках."""
+        for user in list(self.players):
+            self.schedule_effects(user)
+        self.rotate_black_market()
+
     async def event_ready(self):
-        """Обработчик события готовности бота."""
+        """Обработчик события готовности бота. Таймеры ставятся, когда загружены игроки."""
+        self.startup.setdefault('connect', time.perf_counter() - self.startup.get('run', STARTED))
         print(f'✅ Бот подключен как {self.nick}')
-        logging.info(f'Бот подключен как {self.nick}')
-
-    @commands.command(name='черныйрынок')
+        logging.info("Бот подключен как %s", self.nick)
+        if self.flush_task is None and SAVE_INTERVAL > 0:
+            self.flush_task = asyncio.create_task(self.store.flush_loop())
+        await self.loaded.wait()
+        if self.scheduler.task is None:
+            self.restore_timers()
+            self.scheduler.start()
+            self.report_startup()
+        if self.metrics.server is None and METRICS_PORT:
+            try:
+                await self.metrics.serve(METRICS_HOST, METRICS_PORT)
+                logging.info("Метрики: http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+            except OSError as e:
+                logging.error("Не удалось запустить сервер метрик на %s:%s: %s", METRICS_HOST, METRICS_PORT, e)
+
+    async def event_message(self, message):
+        """Отдать twitchio только сообщения с известной командой, пропустив их через допуск команд."""
+        if message.echo or not is_command(message, self.commands):
+            return
+        if not self.loaded.is_set():
+            await self.loaded.wait()  # команды, пришедшие во время загрузки игроков, ждут её в порядке прихода
+        priority, key = request_class(message, self.commands.get(command_name(message.content)))
+        await self.admission.run(message.author.name.lower(), priority, key, lambda: self.handle_message(message))
+
+    async def handle_message(self, message):
+        """Выполнить допущенную команду. При записи чата (RECORD_FILE) сообщение сначала пишется в запись."""
+        if self.recorder is not None:
+            self.recorder.record(self.clock(), message.author.name, message.content,
+                                 getattr(message.author, 'is_mod', False), 'reply-parent-msg-id' in (message.tags or ()))
+        await self.handle_commands(message)
+
+    async def get_context(self, message, *, cls=None):
+        """Контекст команды, ответы которого идут через очередь исходящих сообщений."""
+        return await super().get_context(message, cls=cls or OutboundContext)
+
+    async def close(self):
+        """Вернуть ставки открытых дуэлей, отправить ответы, остановить фоновую запись, сохранить несохранённое и отключиться."""
+        self.scheduler.stop()
+        await self.metrics.close()
+        for duel in list(self.duels):
+            await self.cancel_duel(duel)  # вызовы живут только в памяти: вернуть ставки до финального сохранения
+        await self.outbound.drain(5)
+        logging.info("Очередь сообщений: %s", self.outbound.stats())
+        logging.info("Допуск команд: %s", self.admission.stats())
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.store.flush()
+        self.store.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        await super().close()
+
+    def run(self):
+        """Запустить бота. SIGTERM завершает его так же, как Ctrl+C — с финальным сохранением, SIGUSR1 снимает профиль."""
+        signal.signal(signal.SIGTERM, self.handle_sigterm)
+        if hasattr(signal, 'SIGUSR1'):  # на Windows сигнала нет, остаётся !профиль
+            signal.signal(signal.SIGUSR1, self.handle_sigusr1)
+        self.startup['run'] = time.perf_counter()
+        self.loop.create_task(self.load())  # загрузка идёт одновременно с подключением к чату
+        try:
+            super().run()
+        except RuntimeError:
+            if self.load_error is None:
+                raise  # иначе это цикл, остановленный load() ещё до конца подключения
+        if self.load_error is not None:
+            raise SystemExit(1)
+
+    def report_startup(self):
+        """Записать, сколько заняли этапы запуска: импорт, настройки, загрузка игроков и подключение."""
+        timings = {
+            'import': SETTINGS_STARTED - STARTED,
+            'settings': SETTINGS_SECONDS,
+            'load': self.startup.get('load', 0.0),
+            'connect': self.startup.get('connect', 0.0),
+            'total': time.perf_counter() - STARTED,
+        }
+        report = (f"Запуск за {timings['total']:.2f} с: импорт {timings['import']:.2f} с, "
+                  f"настройки {timings['settings']:.2f} с, загрузка игроков {timings['load']:.2f} с "
+                  f"({len(self.players)}), подключение {timings['connect']:.2f} с")
+        print(f'⏱️ {report}')
+        logging.info("%s", report, extra={'event': 'startup', **{k: round(v, 3) for k, v in timings.items()}})
+
+    def handle_sigusr1(self, signum, frame):
+        """Снять профиль на PROFILE_SECONDS секунд: kill -USR1 <pid>."""
+        self.loop.call_soon_threadsafe(self.start_profile, PROFILE_SECONDS)
+
+    def start_profile(self, seconds):
+        """Записать медленные команды и начать профиль цикла событий. Префикс файлов или None, если профиль уже идёт."""
+        prefix = self.profiler.start(seconds, self.slow_commands)
+        if prefix is not None:
+            logging.info("Профиль на %s с: %s", seconds, prefix)
+        return prefix
+
+    def handle_sigterm(self, signum, frame):
+        """Превратить SIGTERM в KeyboardInterrupt, который twitchio обрабатывает штатно."""
+        logging.info("Получен SIGTERM, бот завершает работу")
+        raise KeyboardInterrupt
+
+    @command('черныйрынок', read_only=True, shared=True)
     async def cmd_black_market(self, ctx):
         """Показать доступные предметы на черном рынке."""
-        now = time.time()
-        if now - self.black_market_last_refresh > 600 or not self.black_market_items:
+        if not self.black_market_items:
             self.refresh_black_market()
 
         msg_lines = ['🕶️ Тёмный торговец шепчет:\nСегодня в продаже:']
@@ -182,20 +488,11 @@ class RPGbot(commands.Bot):
         for line in msg_lines:
             await ctx.send(line)
 
-    @commands.command(name='купить')
-    async def cmd_buy(self, ctx):
+    @command('купить', Amount('номер'), usage='Используй формат: !купить <номер>', requires_character=True)
+    async def cmd_buy(self, ctx, number):
         """Купить предмет с черного рынка."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
-
-        parts = ctx.message.content.strip().split()
-        if len(parts) != 2 or not parts[1].isdigit():
-            await ctx.send('Используй формат: !купить <номер>')
-            return
-
-        choice = int(parts[1]) - 1
+        choice = number - 1
         if choice < 0 or choice >= len(self.black_market_items):
             await ctx.send(f'{ctx.author.name}, нет такого товара.')
             return
@@ -203,14 +500,14 @@ class RPGbot(commands.Bot):
         player = self.players[user]
         item = self.black_market_items[choice]
 
-        if player['gold'] < item['price']:
+        if player.gold < item['price']:
             await ctx.send(f'{ctx.author.name}, у тебя недостаточно золота.')
             return
 
-        player['gold'] -= item['price']
-        player['inventory'].append(item['name'])
-        self.save_players()
-        logging.info(f"{user} купил {item['name']} за {item['price']} золота")
+        player.gold -= item['price']
+        player.inventory.add(item['name'])
+        self.mark_dirty(user)
+        logging.info("%s купил %s за %s золота", user, item['name'], item['price'])
 
         if item['type'] in ['pet', 'amulet', 'consumable']:
             await ctx.send(f'{ctx.author.name}, ты приобрел {item["type"]}: {item["name"]}! '
@@ -218,7 +515,7 @@ class RPGbot(commands.Bot):
         else:
             await ctx.send(f'{ctx.author.name}, ты купил: {item["name"]}')
 
-    @commands.command(name='старт')
+    @command('старт')
     async def cmd_start(self, ctx):
         """Создать нового персонажа."""
         user = ctx.author.name.lower()
@@ -226,148 +523,113 @@ class RPGbot(commands.Bot):
             await ctx.send(f'{ctx.author.name}, ты уже начал игру!')
             return
 
-        max_hp = calculate_hp(1)
-        self.players[user] = {
-            'level': 1,
-            'xp': 0,
-            'gold': 0,
-            'inventory': [],
-            'equipment': {'weapon': None, 'armor': None, 'helmet': None, 'pet': None, 'amulet': None},
-            'last_xp_time': 0,
-            'last_fight_time': 0,
-            'last_pvp_time': 0,
-            'pvp_wins': 0,
-            'pvp_losses': 0,
-            'prison': False,
-            'prison_until': 0,
-            'race': None,
-            'class': None,
-            'current_hp': max_hp
-        }
-        self.save_players()
-        logging.info(f"Создан персонаж для {user}")
+        self.players[user] = Player(current_hp=calculate_hp(1))
+        self.mark_dirty(user)
+        logging.info("Создан персонаж для %s", user)
         await ctx.send(f'{ctx.author.name}, персонаж создан! Уровень 1, XP 0, золото 0. Выбери расу (!раса) и класс (!класс).')
 
-    @commands.command(name='статус')
-    async def cmd_status(self, ctx):
+    @command('статус', Nick('ник', optional=True), read_only=True)
+    async def cmd_status(self, ctx, target):
         """Показать статус игрока."""
-        parts = ctx.message.content.strip().split()
-        target = parts[1].lstrip('@').lower() if len(parts) == 2 else ctx.author.name.lower()
+        target = target or ctx.author.name.lower()
 
         if target not in self.players:
             await ctx.send(f'{ctx.author.name}, у {target} нет персонажа.')
             return
 
         p = self.players[target]
-        lvl = p["level"]
-        min_bonus, max_bonus, hp_bonus = self.get_equipment_bonuses(p)
-        base_min = 5 + lvl * 2
-        base_max = 10 + lvl * 3
-        dmg_range = f'{base_min + min_bonus}-{base_max + max_bonus}'
-        hp = calculate_hp(lvl) + hp_bonus
-        current_hp = p.get('current_hp', hp)
-
-        msg = f'{target} — Уровень {lvl}, XP {p["xp"]}, Золото {p["gold"]}, Урон {dmg_range}, HP {current_hp}/{hp}'
-        if p.get('race'):
-            msg += f', Раса: {p["race"]}'
-        if p.get('class'):
-            msg += f', Класс: {p["class"]}'
+        lvl = p.level
+        stats = self.get_stats(p)
+        dmg_range = stats.damage_range
+        hp = stats.max_hp
+        current_hp = p.current_hp
+
+        msg = f'{target} — Уровень {lvl}, XP {p.xp}, Золото {p.gold}, Урон {dmg_range}, HP {current_hp}/{hp}'
+        if p.race:
+            msg += f', Раса: {p.race}'
+        if p.player_class:
+            msg += f', Класс: {p.player_class}'
         await ctx.send(msg)
 
-        now = time.time()
+        now = self.clock()
         status = []
-        if p.get('xp_buff_until', 0) > now:
+        if p.xp_buff_until > now:
             status.append('📈 +50% XP (бордель)')
-        if p.get('xp_penalty', False):
+        if p.xp_penalty:
             status.append('⚠️ -50% XP (штраф)')
-        if p.get('prison', False) and p.get('prison_until', 0) > now:
-            remain = int(p['prison_until'] - now)
+        if p.prison and p.prison_until > now:
+            remain = int(p.prison_until - now)
             status.append(f'🔒 В тюрьме ({remain} сек.)')
-        if p.get('attack_buff_until', 0) > now:
-            remain = int(p['attack_buff_until'] - now)
+        if p.attack_buff_until > now:
+            remain = int(p.attack_buff_until - now)
             status.append(f'⚔️ +10% урона ({remain} сек.)')
         if status:
             await ctx.send(f'{target}, активные эффекты: {", ".join(status)}')
 
-    @commands.command(name='инвентарь')
+    @command('инвентарь', requires_character=True, read_only=True)
     async def cmd_inventory(self, ctx):
         """Показать инвентарь игрока."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
 
-        inventory = self.players[user].get('inventory', [])
+        inventory = self.players[user].inventory
         if not inventory:
             await ctx.send(f'@{ctx.author.name}, твой инвентарь пуст.')
             return
 
-        item_counts = Counter(inventory)
-        formatted_items = [f'{item} x{count}' if count > 1 else item for item, count in item_counts.items()]
+        formatted_items = [f'{item} x{count}' if count > 1 else item for item, count in inventory.items()]
         await ctx.send(f'@{ctx.author.name}, инвентарь: {", ".join(formatted_items)}')
 
-    @commands.command(name='экипировка')
+    @command('экипировка', requires_character=True, read_only=True)
     async def cmd_equipment(self, ctx):
         """Показать текущую экипировку игрока."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
 
-        equipment = self.players[user].get('equipment', {})
+        equipment = self.players[user].equipment
         eq_text = ', '.join(
-            f'{slot.capitalize()}: {equipment[slot] if equipment[slot] else "—"}'
-            for slot in ['weapon', 'armor', 'helmet', 'pet', 'amulet']
+            f'{slot.capitalize()}: {item_name if item_name else "—"}'
+            for slot, item_name in equipment.items()
         )
         await ctx.send(f'🛡️ Экипировка {ctx.author.name}: {eq_text}')
 
-    @commands.command(name='опыт')
+    @command('опыт', requires_character=True)
     async def cmd_xp(self, ctx):
         """Получить опыт с учетом кулдауна и баффов."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, сначала создай персонажа (!старт).')
-            return
 
         player = self.players[user]
         if not await self.check_cooldown(player, 'last_xp_time', 300, ctx):
             return
 
         base_xp = 50
-        race_bonus = self.races[player.get('race', '')].get('xp_bonus', 0) if player.get('race') else 0
-        class_bonus = self.classes[player.get('class', '')].get('xp_bonus', 0) if player.get('class') else 0
+        race_bonus = self.races[player.race].get('xp_bonus', 0) if player.race else 0
+        class_bonus = self.classes[player.player_class].get('xp_bonus', 0) if player.player_class else 0
 
-        now = time.time()
-        if player.get('xp_buff_until', 0) > now:
+        now = self.clock()
+        if player.xp_buff_until > now:
             base_xp = int(base_xp * 1.5)
-        if player.get('xp_penalty', False):
+        if player.xp_penalty:
             base_xp = int(base_xp * 0.5)
         base_xp = int(base_xp * (1 + race_bonus + class_bonus))
 
-        player['xp'] += base_xp
+        player.xp += base_xp
         leveled = self.try_level_up(player)
-        self.save_players()
-        logging.info(f"{user} получил {base_xp} XP")
+        self.mark_dirty(user)
+        logging.info("%s получил %s XP", user, base_xp)
 
-        msg = f'{ctx.author.name}, получено {base_xp} XP. Текущий XP: {player["xp"]}'
+        msg = f'{ctx.author.name}, получено {base_xp} XP. Текущий XP: {player.xp}'
         if leveled:
-            msg += f' 📈 Уровень повышен! Теперь уровень {player["level"]}.'
+            msg += f' 📈 Уровень повышен! Теперь уровень {player.level}.'
         await ctx.send(msg)
 
-    @commands.command(name='надеть')
-    async def cmd_equip(self, ctx):
+    @command('надеть', Text('предмет'), usage='{author}, укажи предмет: !надеть <название>', requires_character=True)
+    async def cmd_equip(self, ctx, item_name):
         """Надеть предмет из инвентаря."""
         user = ctx.author.name.lower()
-        item_name = ctx.message.content.strip()[7:].strip()
-
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
-
         player = self.players[user]
-        if item_name.lower() not in [i.lower() for i in player['inventory']]:
+        if item_name not in player.inventory:
             await ctx.send(f'{ctx.author.name}, у тебя нет предмета "{item_name}".')
             return
+        item_name = item_name_in(player.inventory, item_name)
 
         if item_name not in ITEMS:
             await ctx.send(f'{ctx.author.name}, предмет "{item_name}" не может быть надет.')
@@ -379,74 +641,57 @@ class RPGbot(commands.Bot):
             await ctx.send(f'{ctx.author.name}, этот предмет нельзя надеть. Используй !использовать {item_name}.')
             return
 
-        current_equipped = player['equipment'].get(slot)
+        current_equipped = player.equipment.get(slot)
         if current_equipped == item_name:
             await ctx.send(f'{ctx.author.name}, у тебя уже надет "{item_name}".')
             return
 
         if current_equipped:
-            player['inventory'].append(current_equipped)
-        player['inventory'].remove(item_name)
-        player['equipment'][slot] = item_name
+            player.inventory.add(current_equipped)
+        player.inventory.remove(item_name)
+        player.equipment[slot] = item_name
+        player.invalidate_stats()
         # Обновляем максимальное HP при смене экипировки
-        player['current_hp'] = min(player['current_hp'], calculate_hp(player['level']) + self.get_equipment_bonuses(player)[2])
-        self.save_players()
-        logging.info(f"{user} надел {item_name} в слот {slot}")
+        player.current_hp = min(player.current_hp, self.get_stats(player).max_hp)
+        self.mark_dirty(user)
+        logging.info("%s надел %s в слот %s", user, item_name, slot)
 
         msg = f'{ctx.author.name}, ты надел {item_name} в слот {slot}.'
         if current_equipped:
             msg = f'{ctx.author.name}, ты заменил {current_equipped} на {item_name} в слоте {slot}.'
         await ctx.send(msg)
 
-    @commands.command(name='снять')
-    async def cmd_unequip(self, ctx):
+    @command('снять', Word('слот'), usage='{author}, укажи слот: !снять <weapon|armor|helmet|pet|amulet>',
+             requires_character=True)
+    async def cmd_unequip(self, ctx, slot):
         """Снять предмет из указанного слота."""
         user = ctx.author.name.lower()
-        parts = ctx.message.content.strip().split(maxsplit=1)
-
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
-
-        if len(parts) < 2:
-            await ctx.send(f'{ctx.author.name}, укажи слот: !снять <weapon|armor|helmet|pet|amulet>')
-            return
-
-        slot = parts[1].strip().lower()
         player = self.players[user]
-        if slot not in player['equipment'] or not player['equipment'][slot]:
+        if slot not in player.equipment or not player.equipment[slot]:
             await ctx.send(f'{ctx.author.name}, в слоте "{slot}" ничего не надето.')
             return
 
-        item_name = player['equipment'][slot]
-        player['equipment'][slot] = None
-        player['inventory'].append(item_name)
+        item_name = player.equipment[slot]
+        player.equipment[slot] = None
+        player.invalidate_stats()
+        player.inventory.add(item_name)
         # Обновляем максимальное HP
-        player['current_hp'] = min(player['current_hp'], calculate_hp(player['level']) + self.get_equipment_bonuses(player)[2])
-        self.save_players()
-        logging.info(f"{user} снял {item_name} из слота {slot}")
+        player.current_hp = min(player.current_hp, self.get_stats(player).max_hp)
+        self.mark_dirty(user)
+        logging.info("%s снял %s из слота %s", user, item_name, slot)
 
         await ctx.send(f'{ctx.author.name}, ты снял "{item_name}" из слота "{slot}".')
 
-    @commands.command(name='использовать')
-    async def cmd_use(self, ctx):
+    @command('использовать', Text('предмет'), usage='{author}, укажи предмет: !использовать <название>',
+             requires_character=True)
+    async def cmd_use(self, ctx, item_name):
         """Использовать расходуемый предмет."""
         user = ctx.author.name.lower()
-        parts = ctx.message.content.strip().split(maxsplit=1)
-
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
-
-        if len(parts) < 2:
-            await ctx.send(f'{ctx.author.name}, укажи предмет: !использовать <название>')
-            return
-
-        item_name = parts[1].strip()
         player = self.players[user]
-        if item_name.lower() not in [i.lower() for i in player['inventory']]:
+        if item_name not in player.inventory:
             await ctx.send(f'{ctx.author.name}, у тебя нет предмета "{item_name}".')
             return
+        item_name = item_name_in(player.inventory, item_name)
 
         if item_name not in ITEMS or ITEMS[item_name]['slot'] != 'consumable':
             await ctx.send(f'{ctx.author.name}, предмет "{item_name}" нельзя использовать.')
@@ -454,113 +699,104 @@ class RPGbot(commands.Bot):
 
         effect = ITEMS[item_name].get('effect', {})
         if 'heal' in effect:
-            max_hp = calculate_hp(player['level']) + self.get_equipment_bonuses(player)[2]
-            old_hp = player['current_hp']
-            player['current_hp'] = min(player['current_hp'] + effect['heal'], max_hp)
-            player['inventory'].remove(item_name)
-            self.save_players()
-            logging.info(f"{user} использовал {item_name}, восстановлено {effect['heal']} HP")
-            await ctx.send(f'{ctx.author.name}, ты использовал "{item_name}" и восстановил {player['current_hp'] - old_hp} HP. Текущие HP: {player['current_hp']}/{max_hp}.')
-
-    @commands.command(name='бой')
-    async def cmd_fight(self, ctx):
+            max_hp = self.get_stats(player).max_hp
+            old_hp = player.current_hp
+            player.current_hp = min(player.current_hp + effect['heal'], max_hp)
+            player.inventory.remove(item_name)
+            self.mark_dirty(user)
+            logging.info("%s использовал %s, восстановлено %s HP", user, item_name, effect['heal'])
+            await ctx.send(f'{ctx.author.name}, ты использовал "{item_name}" и восстановил {player.current_hp - old_hp} HP. Текущие HP: {player.current_hp}/{max_hp}.')
+
+    @command('бой', Word('монстр', optional=True), requires_character=True)
+    async def cmd_fight(self, ctx, monster_name):
         """Сражение с монстром."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, создай персонажа с помощью !старт.')
-            return
-
         player = self.players[user]
-        now = time.time()
-        if player.get('prison', False) and player.get('prison_until', 0) > now:
-            remain = int(player['prison_until'] - now)
+        now = self.clock()
+        if player.prison and player.prison_until > now:
+            remain = int(player.prison_until - now)
             await ctx.send(f'@{ctx.author.name}, ты в тюрьме! Заплати взятку (!взятка) или жди {remain} сек.')
             return
 
-        if not await self.check_cooldown(player, 'last_fight_time', 90, ctx):
+        if not await self.check_cooldown(player, 'last_fight_time', FIGHT_COOLDOWN, ctx):
             return
 
-        parts = ctx.message.content.strip().split()
         # Учитываем редких монстров
-        monster_name = parts[1].capitalize() if len(parts) > 1 and parts[1].capitalize() in MONSTERS else random.choice(
-            [k for k, v in MONSTERS.items() if not v.get('rare', False) or random.random() < 0.1]
+        monster_name = monster_name.capitalize() if monster_name and monster_name.capitalize() in MONSTERS else self.rng.choice(
+            [k for k, v in MONSTERS.items() if not v.get('rare', False) or self.rng.random() < 0.1]
         )
         base = MONSTERS[monster_name]
-        level = player['level']
-        scale_factor = 1 + (level - 1) * 0.1
-        monster_hp = int(base['base_hp'] * scale_factor)
-        monster_attack = int(base['base_attack'] * scale_factor)
+        level = player.level
+        monster_hp, monster_attack = scale_monster(base, level)
 
-        min_bonus, max_bonus, hp_bonus = self.get_equipment_bonuses(player)
-        player_hp = calculate_hp(level) + hp_bonus
-        current_hp = player.get('current_hp', player_hp)
+        stats = self.get_stats(player)
+        player_hp = stats.max_hp
 
         # Учёт баффа таверны
-        attack_multiplier = 1.1 if player.get('attack_buff_until', 0) > now else 1.0
+        attack_multiplier = 1.1 if player.attack_buff_until > now else 1.0
 
         log = [f'{ctx.author.name} сражается с {monster_name}! (Монстр: {monster_hp} HP, {monster_attack} ATK)']
-        raund = 0
-
-        while monster_hp > 0 and current_hp > 0:
-            raund += 1
-            total_attack = int((calculate_damage(level) + random.randint(min_bonus, max_bonus)) * attack_multiplier)
-            monster_hp -= total_attack
-            if monster_hp <= 0:
-                break
-            current_hp -= monster_attack
-
-        if current_hp > 0:
-            xp_reward = random.randint(*base['xp_reward'])
-            gold_reward = random.randint(*base['gold_reward'])
-            player['xp'] += xp_reward
-            player['gold'] += gold_reward
-            drop = random.choice(base['loot']) if base['loot'] and random.random() < base['loot_chance'] else None
+
+        player_damage = Damage.for_attack(level, stats.attack_min, stats.attack_max, attack_multiplier)
+        result = resolve_fight(player.current_hp, player_damage, monster_hp, Damage.constant(monster_attack), self.rng)
+        raund = result.rounds
+        current_hp = result.hp_a
+
+        if result.a_won:
+            xp_reward = self.rng.randint(*base['xp_reward'])
+            gold_reward = self.rng.randint(*base['gold_reward'])
+            player.xp += xp_reward
+            player.gold += gold_reward
+            drop = self.rng.choice(base['loot']) if base['loot'] and self.rng.random() < base['loot_chance'] else None
             if drop:
-                player['inventory'].append(drop)
-            player['current_hp'] = min(current_hp + player_hp // 2, player_hp)
+                player.inventory.add(drop)
+            player.current_hp = min(current_hp + player_hp // 2, player_hp)
             leveled = self.try_level_up(player)
-            self.save_players()
-            logging.info(f"{user} победил {monster_name}, получил {xp_reward} XP, {gold_reward} золота, дроп: {drop}")
+            self.mark_dirty(user)
+            logging.info("%s победил %s, получил %s XP, %s золота, дроп: %s", user, monster_name, xp_reward, gold_reward, drop)
 
             msg = f'🏆 Победа за {raund} ходов! +{xp_reward} XP, +{gold_reward} золота.'
             if drop:
                 msg += f' Дроп: {drop}.'
             log.append(msg)
             if leveled:
-                log.append(f'📈 Уровень повышен! Текущий уровень: {player["level"]}')
+                log.append(f'📈 Уровень повышен! Текущий уровень: {player.level}')
         else:
-            xp_loss = int(player['xp'] * 0.1)
-            player['xp'] = max(0, player['xp'] - xp_loss)
-            player['current_hp'] = player_hp // 2
+            xp_loss = int(player.xp * 0.1)
+            player.xp = max(0, player.xp - xp_loss)
+            player.current_hp = player_hp // 2
             log.append(f'💀 Поражение от {monster_name}... Потеряно {xp_loss} XP')
-            self.save_players()
-            logging.info(f"{user} проиграл {monster_name}, потеряно {xp_loss} XP")
+            self.mark_dirty(user)
+            logging.info("%s проиграл %s, потеряно %s XP", user, monster_name, xp_loss)
 
         for l in log:
             await ctx.send(l)
 
-    @commands.command(name='топ')
+    @command('топ', read_only=True, shared=True)
     async def cmd_top(self, ctx):
         """Показать топ-10 игроков по уровню и XP."""
-        if not self.players:
+        if not self.leaderboard:
             await ctx.send('Нет данных для рейтинга.')
             return
-        top = sorted(self.players.items(), key=lambda i: (i[1]['level'], i[1]['xp']), reverse=True)[:10]
-        result = ', '.join([f'{i + 1}. {name} (Lvl {p["level"]}, XP {p["xp"]})' for i, (name, p) in enumerate(top)])
+        top = self.leaderboard.top(10)
+        result = ', '.join([f'{i + 1}. {name} (Lvl {level}, XP {xp})' for i, (name, level, xp) in enumerate(top)])
         await ctx.send(f'🏆 ТОП игроков: {result}')
 
-    @commands.command(name='дуэль')
-    async def cmd_duel(self, ctx):
-        """Вызвать игрока на дуэль."""
-        challenger = ctx.author.name.lower()
-        parts = ctx.message.content.strip().split()
-
-        if len(parts) < 2:
-            await ctx.send('Формат: !дуэль @ник [ставка]')
+    @command('ранг', Nick('ник', optional=True), read_only=True)
+    async def cmd_rank(self, ctx, target):
+        """Показать место игрока в рейтинге."""
+        target = target or ctx.author.name.lower()
+        rank = self.leaderboard.rank(target)
+        if rank is None:
+            await ctx.send(f'{ctx.author.name}, у {target} нет персонажа.')
             return
+        await ctx.send(f'🏅 {target} — {rank} место из {len(self.leaderboard)}.')
 
-        target = parts[1].lstrip('@').lower()
-        amount = int(parts[2]) if len(parts) >= 3 and parts[2].isdigit() and int(parts[2]) >= 0 else 0
+    @command('дуэль', Nick('ник'), Amount('ставка', optional=True, default=0), usage='Формат: !дуэль @ник [ставка]',
+             own_transaction=True)
+    async def cmd_duel(self, ctx, target, amount):
+        """Вызвать игрока на дуэль. Ставка вызывающего удерживается сразу и возвращается, если вызов не примут."""
+        challenger = ctx.author.name.lower()
 
         if challenger == target:
             await ctx.send('Нельзя вызвать самого себя.')
@@ -570,185 +806,175 @@ class RPGbot(commands.Bot):
             await ctx.send('Оба игрока должны иметь персонажей.')
             return
 
-        if self.players[challenger]['gold'] < amount:
-            await ctx.send('Недостаточно золота для ставки.')
-            return
-
-        if target in self.pending_duels:
-            await ctx.send(f'{target} уже ожидает другой дуэли.')
-            return
+        async with self.transaction(challenger):
+            cl = self.players[challenger]
+            if self.duels.get(challenger, target) is not None:
+                await ctx.send(f'{ctx.author.name}, ты уже вызвал @{target}. Дождись ответа или отмени вызов: !отмена @{target}')
+                return
+            if cl.gold < amount:
+                await ctx.send('Недостаточно золота для ставки.')
+                return
+            # Золото уходит в escrowed и сохраняется с игроком: после падения бота его вернёт release_escrow
+            cl.gold -= amount
+            cl.escrowed += amount
+            self.duels.add(challenger, target, amount)
+        self.scheduler.call_later(DUEL_TIMEOUT, self.expire_duel, challenger, target, ctx, key=('duel', challenger, target))
 
-        cl = self.players[challenger]
         tl = self.players[target]
-        chp = calculate_hp(cl['level']) + self.get_equipment_bonuses(cl)[2]
-        thp = calculate_hp(tl['level']) + self.get_equipment_bonuses(tl)[2]
-        cdmg = f'{5 + cl["level"] * 2 + self.get_equipment_bonuses(cl)[0]}-{10 + cl["level"] * 3 + self.get_equipment_bonuses(cl)[1]}'
-        tdmg = f'{5 + tl["level"] * 2 + self.get_equipment_bonuses(tl)[0]}-{10 + tl["level"] * 3 + self.get_equipment_bonuses(tl)[1]}'
-
-        self.pending_duels[target] = {'challenger': challenger, 'amount': amount}
+        cstats, tstats = self.get_stats(cl), self.get_stats(tl)
+        chp, thp = cstats.max_hp, tstats.max_hp
+        cdmg, tdmg = cstats.damage_range, tstats.damage_range
         await ctx.send(
             f'⚔️ {ctx.author.name} вызывает @{target} на дуэль{" со ставкой " + str(amount) + " золота" if amount else ""}!\n'
             f'{ctx.author.name}: HP {chp}, Урон {cdmg}; @{target}: HP {thp}, Урон {tdmg}\n'
-            f'@{target}, напиши !принять чтобы принять вызов.'
+            f'@{target}, напиши !принять @{ctx.author.name} чтобы принять вызов.'
         )
-        logging.info(f"{challenger} вызвал {target} на дуэль с ставкой {amount}")
+        logging.info("%s вызвал %s на дуэль с ставкой %s", challenger, target, amount)
 
-    @commands.command(name='принять')
-    async def cmd_accept(self, ctx):
-        """Принять вызов на дуэль."""
+    @command('принять', Nick('ник', optional=True), requires_character=True, own_transaction=True)
+    async def cmd_accept(self, ctx, challenger):
+        """Принять вызов на дуэль. Если вызовов несколько, нужно указать, чей."""
         defender = ctx.author.name.lower()
-        if defender not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
-
-        now = time.time()
-        if self.players[defender].get('prison', False) and self.players[defender].get('prison_until', 0) > now:
-            remain = int(self.players[defender]['prison_until'] - now)
+        now = self.clock()
+        if self.players[defender].prison and self.players[defender].prison_until > now:
+            remain = int(self.players[defender].prison_until - now)
             await ctx.send(f'@{ctx.author.name}, ты в тюрьме! Заплати взятку (!взятка) или жди {remain} сек.')
             return
 
-        if defender not in self.pending_duels:
-            await ctx.send('Тебя никто не вызывал на дуэль.')
-            return
+        if challenger is None:
+            incoming = self.duels.incoming(defender)
+            if not incoming:
+                await ctx.send('Тебя никто не вызывал на дуэль.')
+                return
+            if len(incoming) > 1:
+                names = ', '.join(f'@{duel.challenger}' for duel in incoming)
+                await ctx.send(f'{ctx.author.name}, тебя вызвали {names}. Напиши !принять @ник.')
+                return
+            challenger = incoming[0].challenger
+            await self.load_players_for(ctx, challenger)
 
-        duel = self.pending_duels.pop(defender)
-        challenger = duel['challenger']
-        amount = duel['amount']
+        duel = self.duels.get(challenger, defender)
+        if duel is None:
+            await ctx.send(f'{ctx.author.name}, @{challenger} не вызывал тебя на дуэль.')
+            return
+        amount = duel.amount
 
         if challenger not in self.players:
             await ctx.send('Игрок-вызывающий не найден.')
             return
 
-        a = self.players[challenger]
-        d = self.players[defender]
-        if not await self.check_cooldown(a, 'last_pvp_time', 60, ctx) or not await self.check_cooldown(d, 'last_pvp_time', 60, ctx):
-            return
+        # Кулдауны, ставка и награды меняются под замками обоих игроков: между проверкой
+        # золота и списанием есть await, и другая команда не должна вклиниться
+        async with self.transaction(challenger, defender):
+            a = self.players[challenger]
+            d = self.players[defender]
+            if not await self.check_cooldown(a, 'last_pvp_time', 60, ctx) or not await self.check_cooldown(d, 'last_pvp_time', 60, ctx):
+                return
 
-        if amount > 0 and (a['gold'] < amount or d['gold'] < amount):
-            await ctx.send('У кого-то не хватает золота.')
-            return
+            if d.gold < amount:
+                await ctx.send(f'{ctx.author.name}, не хватает золота, чтобы принять ставку {amount}.')
+                return
+
+            # Вызов забирается из реестра без await до самой выплаты: пока ждали замков,
+            # его могли отменить или он мог истечь — тогда ставку уже вернули вызывающему
+            if self.duels.remove(challenger, defender) is not duel:
+                return
+            self.scheduler.cancel(('duel', challenger, defender))
+            a.escrowed -= amount  # ставка вызывающего удержана ещё при вызове
+            d.gold -= amount
+
+            stats_a, stats_d = self.get_stats(a), self.get_stats(d)
+            damage_a = Damage.for_attack(a.level, stats_a.attack_min, stats_a.attack_max,
+                                         1.1 if a.attack_buff_until > now else 1.0)
+            damage_d = Damage.for_attack(d.level, stats_d.attack_min, stats_d.attack_max,
+                                         1.1 if d.attack_buff_until > now else 1.0)
+
+            # Кто бьёт первым, решает жребий
+            sides = [(challenger, a, damage_a), (defender, d, damage_d)]
+            if self.rng.random() >= 0.5:
+                sides.reverse()
+            (first, first_p, first_damage), (second, second_p, second_damage) = sides
+            result = resolve_fight(first_p.current_hp, first_damage, second_p.current_hp, second_damage, self.rng)
+            if result.a_won:
+                winner, loser, winner_p, loser_p, winner_hp = first, second, first_p, second_p, result.hp_a
+            else:
+                winner, loser, winner_p, loser_p, winner_hp = second, first, second_p, first_p, result.hp_b
 
-        if amount > 0:
-            a['gold'] -= amount
-            d['gold'] -= amount
-
-        min_bonus_a, max_bonus_a, hp_bonus_a = self.get_equipment_bonuses(a)
-        min_bonus_d, max_bonus_d, hp_bonus_d = self.get_equipment_bonuses(d)
-        hp1 = a.get('current_hp', calculate_hp(a['level']) + hp_bonus_a)
-        hp2 = d.get('current_hp', calculate_hp(d['level']) + hp_bonus_d)
-
-        attack_multiplier_a = 1.1 if a.get('attack_buff_until', 0) > now else 1.0
-        attack_multiplier_d = 1.1 if d.get('attack_buff_until', 0) > now else 1.0
-
-        attacker_name, defender_name = (challenger, defender) if random.random() < 0.5 else (defender, challenger)
-        attacker_p, defender_p = (a, d) if attacker_name == challenger else (d, a)
-        hp_attacker, hp_defender = (hp1, hp2) if attacker_name == challenger else (hp2, hp1)
-        attacker_bonus = (min_bonus_a, max_bonus_a) if attacker_name == challenger else (min_bonus_d, max_bonus_d)
-        defender_bonus = (min_bonus_d, max_bonus_d) if attacker_name == challenger else (min_bonus_a, max_bonus_a)
-        attacker_multiplier = attack_multiplier_a if attacker_name == challenger else attack_multiplier_d
-        defender_multiplier = attack_multiplier_d if attacker_name == challenger else attack_multiplier_a
-
-        def dmg(p, min_b, max_b, multiplier):
-            base = calculate_damage(p['level'])
-            bonus = random.randint(min_b, max_b)
-            return int((base + bonus) * multiplier)
-
-        round_num = 1
-        while True:
-            damage = dmg(attacker_p, *attacker_bonus, attacker_multiplier)
-            hp_defender -= damage
-            if hp_defender <= 0:
-                winner, loser = attacker_name, defender_name
-                winner_p, loser_p = attacker_p, defender_p
-                break
-
-            damage = dmg(defender_p, *defender_bonus, defender_multiplier)
-            hp_attacker -= damage
-            if hp_attacker <= 0:
-                winner, loser = defender_name, attacker_name
-                winner_p, loser_p = attacker_p, defender_p
-                break
-
-            round_num += 1
-
-        winner_p['current_hp'] = max(1, hp_attacker if winner == attacker_name else hp_defender)
-        loser_p['current_hp'] = calculate_hp(loser_p['level']) + self.get_equipment_bonuses(loser_p)[2] // 2
-
-        gold_msg = f' и {amount * 2} золота' if amount > 0 else ''
-        xp = 10 * loser_p['level']
-        winner_p['xp'] += xp
-        level_msg = ''
-        if self.try_level_up(winner_p):
-            level_msg = f'📈 {winner} повышает уровень! Теперь уровень {winner_p["level"]}.'
-
-        winner_p['pvp_wins'] = winner_p.get('pvp_wins', 0) + 1
-        loser_p['pvp_losses'] = loser_p.get('pvp_losses', 0) + 1
-        if amount > 0:
-            winner_p['gold'] += amount * 2
-        self.save_players()
-        logging.info(f"Дуэль: {winner} победил {loser}, получил {xp} XP{gold_msg}")
+            winner_p.current_hp = max(1, winner_hp)
+            loser_p.current_hp = calculate_hp(loser_p.level) + self.get_stats(loser_p).hp_bonus // 2
+
+            gold_msg = f' и {amount * 2} золота' if amount > 0 else ''
+            xp = 10 * loser_p.level
+            winner_p.xp += xp
+            level_msg = ''
+            if self.try_level_up(winner_p):
+                level_msg = f'📈 {winner} повышает уровень! Теперь уровень {winner_p.level}.'
+
+            winner_p.pvp_wins = winner_p.pvp_wins + 1
+            loser_p.pvp_losses = loser_p.pvp_losses + 1
+            if amount > 0:
+                winner_p.gold += amount * 2
+            logging.info("Дуэль: %s победил %s, получил %s XP%s", winner, loser, xp, gold_msg)
 
         await ctx.send(f'🏁 Побеждает {winner}, получает {xp} XP{gold_msg}!')
         if level_msg:
             await ctx.send(level_msg)
 
-    @commands.command(name='отмена')
-    async def cmd_cancel_duel(self, ctx):
-        """Отменить вызов на дуэль."""
+    @command('отмена', Nick('ник', optional=True), own_transaction=True)
+    async def cmd_cancel_duel(self, ctx, other):
+        """Отменить свой вызов или отклонить чужой. Без ника — все вызовы игрока."""
         user = ctx.author.name.lower()
-        if user in self.pending_duels:
-            self.pending_duels.pop(user)
-            await ctx.send(f'{ctx.author.name}, твой вызов на дуэль отменён.')
-            logging.info(f"{user} отменил входящий вызов на дуэль")
-            return
-
-        for target, duel in list(self.pending_duels.items()):
-            if duel['challenger'] == user:
-                self.pending_duels.pop(target)
-                await ctx.send(f'{ctx.author.name}, ты отменил вызов дуэли @{target}.')
-                logging.info(f"{user} отменил вызов дуэли для {target}")
-                return
-        await ctx.send(f'{ctx.author.name}, у тебя нет активных вызовов на дуэль.')
+        if other is None:
+            duels = self.duels.outgoing(user) + self.duels.incoming(user)
+        else:
+            duels = [duel for duel in (self.duels.get(user, other), self.duels.get(other, user)) if duel is not None]
+
+        cancelled = [duel for duel in duels if await self.cancel_duel(duel)]
+        if not cancelled:
+            await ctx.send(f'{ctx.author.name}, у тебя нет активных вызовов на дуэль.')
+        elif len(cancelled) > 1:
+            await ctx.send(f'{ctx.author.name}, отменено вызовов на дуэль: {len(cancelled)}.')
+        elif cancelled[0].challenger == user:
+            await ctx.send(f'{ctx.author.name}, ты отменил вызов дуэли @{cancelled[0].target}.')
+        else:
+            await ctx.send(f'{ctx.author.name}, ты отклонил вызов @{cancelled[0].challenger}.')
+        for duel in cancelled:
+            logging.info("%s отменил вызов %s на дуэль с %s", user, duel.challenger, duel.target)
 
-    @commands.command(name='пвп')
+    @command('пвп', requires_character=True, read_only=True)
     async def cmd_pvp_stats(self, ctx):
         """Показать статистику PvP."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
         p = self.players[user]
-        wins = p.get('pvp_wins', 0)
-        losses = p.get('pvp_losses', 0)
+        wins = p.pvp_wins
+        losses = p.pvp_losses
         total = wins + losses
         winrate = f"{(wins / total * 100):.1f}%" if total > 0 else "–"
         await ctx.send(f'{ctx.author.name}, PvP: Победы: {wins}, Поражения: {losses}, Winrate: {winrate}')
 
-    @commands.command(name='описание')
-    async def cmd_description(self, ctx):
+    @command('описание', Text('предмет', optional=True), read_only=True)
+    async def cmd_description(self, ctx, item_name):
         """Показать описание предмета."""
-        parts = ctx.message.content.strip().split(maxsplit=1)
         user = ctx.author.name.lower()
 
-        if len(parts) == 2:
-            item_name = parts[1].strip().lower()
-            description = ITEM_DESCRIPTIONS.get(item_name)
+        if item_name:
+            description = ITEM_DESCRIPTIONS.get(item_name.lower())
             if description:
-                await ctx.send(f'Описание {parts[1].strip()}: {description}')
+                await ctx.send(f'Описание {item_name}: {description}')
             else:
-                await ctx.send(f'{ctx.author.name}, описание для "{parts[1].strip()}" не найдено.')
+                await ctx.send(f'{ctx.author.name}, описание для "{item_name}" не найдено.')
             return
 
         if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
+            await ctx.send(NO_CHARACTER.format(author=ctx.author.name))
             return
 
-        inventory = self.players[user].get('inventory', [])
+        inventory = self.players[user].inventory
         if not inventory:
             await ctx.send(f'{ctx.author.name}, у тебя пустой инвентарь.')
             return
 
-        unique_items = list(set(inventory))
+        unique_items = inventory.item_names()
         if len(unique_items) == 1:
             item_name = unique_items[0].lower()
             description = ITEM_DESCRIPTIONS.get(item_name)
@@ -760,113 +986,90 @@ class RPGbot(commands.Bot):
             await ctx.send(f'{ctx.author.name}, укажи название предмета: !описание <название>. '
                            f'Инвентарь: {", ".join(unique_items)}')
 
-    @commands.command(name='бордель')
+    @command('бордель', requires_character=True)
     async def cmd_brothel(self, ctx):
         """Посетить бордель для получения баффа или штрафа."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, сначала создай персонажа (!старт).')
-            return
 
         player = self.players[user]
         cost = 100
-        now = time.time()
+        now = self.clock()
 
-        if player['gold'] < cost:
+        if player.gold < cost:
             await ctx.send(f'{ctx.author.name}, у тебя недостаточно золота (нужно {cost}).')
             return
 
-        if player.get('xp_buff_until', 0) > now:
+        if player.xp_buff_until > now:
             await ctx.send(f'{ctx.author.name}, эффект уже активен. Подожди, пока он закончится.')
             return
 
-        player['gold'] -= cost
-        if random.random() < 0.25:
-            player['xp_penalty'] = True
+        player.gold -= cost
+        if self.rng.random() < 0.25:
+            player.xp_penalty = True
             await ctx.send(
                 f'💋 {ctx.author.name}, ты подцепил что-то... XP уменьшается на 50%! Используй !лечиться за 50 золота.')
-            logging.info(f"{user} получил штраф XP в борделе")
+            logging.info("%s получил штраф XP в борделе", user)
         else:
-            player['xp_buff_until'] = now + 1800
+            player.xp_buff_until = now + 1800
+            self.schedule_effects(user)
             await ctx.send(
                 f'💃 {ctx.author.name}, ты вдохновлён! В течение 30 минут +50% XP.')
-            logging.info(f"{user} получил бафф XP в борделе")
-        self.save_players()
+            logging.info("%s получил бафф XP в борделе", user)
+        self.mark_dirty(user)
 
-    @commands.command(name='лечиться')
+    @command('лечиться', requires_character=True)
     async def cmd_heal(self, ctx):
         """Вылечиться от штрафа за посещение борделя."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
 
         player = self.players[user]
         cost = 50
 
-        if not player.get('xp_penalty'):
+        if not player.xp_penalty:
             await ctx.send(f'{ctx.author.name}, тебе не нужно лечение.')
             return
 
-        if player['gold'] < cost:
+        if player.gold < cost:
             await ctx.send(f'{ctx.author.name}, у тебя недостаточно золота (нужно {cost}).')
             return
 
-        player['gold'] -= cost
-        player['xp_penalty'] = False
-        self.save_players()
-        logging.info(f"{user} вылечился от штрафа XP")
+        player.gold -= cost
+        player.xp_penalty = False
+        self.mark_dirty(user)
+        logging.info("%s вылечился от штрафа XP", user)
         await ctx.send(f'🧼 {ctx.author.name}, ты вылечился и готов к приключениям!')
 
-    @commands.command(name='продать')
-    async def cmd_sell(self, ctx):
+    @command('продать', Text('предмет'), usage='{author}, укажи предмет: !продать <название>', requires_character=True)
+    async def cmd_sell(self, ctx, item_name):
         """Продать предмет из инвентаря."""
         user = ctx.author.name.lower()
-        parts = ctx.message.content.strip().split(maxsplit=1)
-
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
-
-        if len(parts) != 2:
-            await ctx.send(f'{ctx.author.name}, укажи предмет: !продать <название>')
-            return
-
-        item_name = parts[1].strip()
         player = self.players[user]
-        if item_name.lower() not in [i.lower() for i in player['inventory']]:
+        if item_name not in player.inventory:
             await ctx.send(f'{ctx.author.name}, у тебя нет предмета "{item_name}".')
             return
+        item_name = item_name_in(player.inventory, item_name)
 
         if item_name not in ITEMS or 'price' not in ITEMS[item_name]:
             await ctx.send(f'{ctx.author.name}, этот предмет нельзя продать.')
             return
 
         sell_price = ITEMS[item_name]['price'] // 2
-        player['inventory'].remove(item_name)
-        player['gold'] += sell_price
-        self.save_players()
-        logging.info(f"{user} продал {item_name} за {sell_price} золота")
+        player.inventory.remove(item_name)
+        player.gold += sell_price
+        self.mark_dirty(user)
+        logging.info("%s продал %s за %s золота", user, item_name, sell_price)
         await ctx.send(f'{ctx.author.name}, ты продал "{item_name}" за {sell_price} золота.')
 
-    @commands.command(name='оценить')
-    async def cmd_appraise(self, ctx):
+    @command('оценить', Text('предмет'), usage='{author}, укажи предмет: !оценить <название>', requires_character=True,
+             read_only=True)
+    async def cmd_appraise(self, ctx, item_name):
         """Оценить стоимость предмета."""
         user = ctx.author.name.lower()
-        parts = ctx.message.content.strip().split(maxsplit=1)
-
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
-
-        if len(parts) < 2:
-            await ctx.send(f'{ctx.author.name}, укажи предмет: !оценить <название>')
-            return
-
-        item_name = parts[1].strip()
-        if item_name.lower() not in [i.lower() for i in self.players[user]['inventory']]:
+        inventory = self.players[user].inventory
+        if item_name not in inventory:
             await ctx.send(f'{ctx.author.name}, у тебя нет предмета "{item_name}".')
             return
+        item_name = item_name_in(inventory, item_name)
 
         if item_name not in ITEMS:
             await ctx.send(f'{ctx.author.name}, предмет "{item_name}" не подлежит продаже.')
@@ -876,22 +1079,11 @@ class RPGbot(commands.Bot):
         sell_price = max(price // 2, 1)
         await ctx.send(f'{ctx.author.name}, ты можешь продать "{item_name}" за {sell_price} золота.')
 
-    @commands.command(name='кража')
-    async def cmd_steal(self, ctx):
+    @command('кража', Nick('ник'), Text('предмет'), usage='{author}, формат: !кража @ник <предмет>',
+             requires_character=True, own_transaction=True)
+    async def cmd_steal(self, ctx, target, item_name):
         """Попытаться украсть предмет у другого игрока."""
         user = ctx.author.name.lower()
-        parts = ctx.message.content.strip().split(maxsplit=2)
-
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
-
-        if len(parts) < 3:
-            await ctx.send(f'{ctx.author.name}, формат: !кража @ник <предмет>')
-            return
-
-        target = parts[1].lstrip('@').lower()
-        item_name = parts[2].strip()
 
         if target == user:
             await ctx.send(f'{ctx.author.name}, нельзя украсть у себя.')
@@ -901,248 +1093,232 @@ class RPGbot(commands.Bot):
             await ctx.send(f'{target} не имеет персонажа.')
             return
 
-        player = self.players[user]
-        now = time.time()
-        if not await self.check_cooldown(player, 'steal_time_unteal', 600, ctx):
-            return
-
-        if item_name.lower() not in [i.lower() for i in self.players[target]['inventory']]:
-            await ctx.send(f'{ctx.author.name}, у @{target} нет предмета "{item_name}".')
-            return
+        async with self.transaction(user, target):
+            player = self.players[user]
+            now = self.clock()
+            if not await self.check_cooldown(player, 'steal_time_unteal', 600, ctx):
+                return
 
-        steal_chance = 0.1 + (self.classes[player.get('class', '')].get('steal_chance_bonus', 0) if player.get('class') else 0)
-        if player['equipment'].get('amulet') == 'Амулет удачи':
-            steal_chance += ITEMS['Амулет удачи']['effect']['steal_chance_bonus']
+            if item_name not in self.players[target].inventory:
+                await ctx.send(f'{ctx.author.name}, у @{target} нет предмета "{item_name}".')
+                return
 
-        if random.random() < steal_chance:
-            player['inventory'].append(item_name)
-            self.players[target]['inventory'].remove(item_name)
-            await ctx.send(f'{ctx.author.name}, {item_name} успешно украден у @{target}!')
-            logging.info(f"{user} украл {item_name} у {target}")
-        else:
-            player['prison'] = True
-            player['prison_until'] = now + 600
-            await ctx.send(f'@{ctx.author.name}, кража не удалась, тебя схватила стража! Ты в тюрьме на 5 минут.')
-            logging.info(f"{user} провалил кражу, отправлен в тюрьму")
-        self.save_players()
+            if self.rng.random() < self.get_stats(player).steal_chance:
+                item_name = self.players[target].inventory.remove(item_name)
+                player.inventory.add(item_name)
+                await ctx.send(f'{ctx.author.name}, {item_name} успешно украден у @{target}!')
+                logging.info("%s украл %s у %s", user, item_name, target)
+            else:
+                player.prison = True
+                player.prison_until = now + 600
+                self.schedule_effects(user)
+                await ctx.send(f'@{ctx.author.name}, кража не удалась, тебя схватила стража! Ты в тюрьме на 5 минут.')
+                logging.info("%s провалил кражу, отправлен в тюрьму", user)
 
-    @commands.command(name='взятка')
+    @command('взятка', requires_character=True)
     async def cmd_prison(self, ctx):
         """Заплатить взятку для выхода из тюрьмы."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
 
         player = self.players[user]
-        now = time.time()
-        if not player.get('prison', False) or player.get('prison_until', 0) <= now:
+        now = self.clock()
+        if not player.prison or player.prison_until <= now:
             await ctx.send(f'{ctx.author.name}, ты не в тюрьме.')
             return
 
         cost = 50
-        if player['gold'] < cost:
+        if player.gold < cost:
             await ctx.send(f'{ctx.author.name}, у тебя недостаточно золота (нужно {cost}).')
             return
 
-        player['gold'] -= cost
-        player['prison'] = False
-        player['prison_until'] = 0
-        self.save_players()
-        logging.info(f"{user} заплатил взятку и вышел из тюрьмы")
+        player.gold -= cost
+        player.prison = False
+        player.prison_until = 0
+        self.scheduler.cancel(('prison_until', user))
+        self.mark_dirty(user)
+        logging.info("%s заплатил взятку и вышел из тюрьмы", user)
         await ctx.send(f'@{ctx.author.name}, ты свободен!')
 
-    @commands.command(name='таверна')
+    @command('таверна', requires_character=True)
     async def cmd_tavern(self, ctx):
         """Посетить таверну для получения баффа на урон."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, сначала создай персонажа (!старт).')
-            return
 
         player = self.players[user]
         cost = 50
-        now = time.time()
+        now = self.clock()
 
-        if player.get('attack_buff_until', 0) > now:
+        if player.attack_buff_until > now:
             await ctx.send(f'{ctx.author.name}, бафф уже активен. Подожди, пока он закончится.')
             return
 
-        if player['gold'] < cost:
+        if player.gold < cost:
             await ctx.send(f'{ctx.author.name}, у тебя недостаточно золота (нужно {cost}).')
             return
 
-        player['gold'] -= cost
-        player['attack_buff_until'] = now + 1800
-        self.save_players()
-        logging.info(f"{user} получил бафф урона в таверне")
+        player.gold -= cost
+        player.attack_buff_until = now + 1800
+        self.schedule_effects(user)
+        self.mark_dirty(user)
+        logging.info("%s получил бафф урона в таверне", user)
         await ctx.send(f'🍺 {ctx.author.name}, ты отдохнул в таверне! В течение 30 минут +10% урона.')
 
-    @commands.command(name='раса')
-    async def cmd_race(self, ctx):
+    @command('раса', Word('раса', optional=True), requires_character=True)
+    async def cmd_race(self, ctx, race):
         """Выбрать расу для персонажа."""
         user = ctx.author.name.lower()
-        parts = ctx.message.content.strip().split(maxsplit=1)
-
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, сначала создай персонажа (!старт).')
-            return
-
         player = self.players[user]
-        if len(parts) < 2:
+        if not race:
             races = ', '.join(self.races.keys())
             await ctx.send(f'{ctx.author.name}, укажи расу: !раса <название>. Доступные расы: {races}')
             return
 
-        race = parts[1].strip().lower()
         if race not in self.races:
             await ctx.send(f'{ctx.author.name}, раса "{race}" не существует.')
             return
 
-        if player.get('race'):
-            await ctx.send(f'{ctx.author.name}, ты уже выбрал расу: {player["race"]}.')
+        if player.race:
+            await ctx.send(f'{ctx.author.name}, ты уже выбрал расу: {player.race}.')
             return
 
-        player['race'] = race
+        player.race = race
+        player.invalidate_stats()
         # Обновляем HP при выборе расы
-        player['current_hp'] = calculate_hp(player['level']) + self.get_equipment_bonuses(player)[2]
-        self.save_players()
-        logging.info(f"{user} выбрал расу {race}")
+        player.current_hp = self.get_stats(player).max_hp
+        self.mark_dirty(user)
+        logging.info("%s выбрал расу %s", user, race)
         await ctx.send(f'{ctx.author.name}, ты выбрал расу: {race.capitalize()}.')
 
-    @commands.command(name='класс')
-    async def cmd_class(self, ctx):
+    @command('класс', Word('класс', optional=True), requires_character=True)
+    async def cmd_class(self, ctx, class_name):
         """Выбрать класс для персонажа."""
         user = ctx.author.name.lower()
-        parts = ctx.message.content.strip().split(maxsplit=1)
-
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, сначала создай персонажа (!старт).')
-            return
-
         player = self.players[user]
-        if len(parts) < 2:
+        if not class_name:
             classes = ', '.join(self.classes.keys())
             await ctx.send(f'{ctx.author.name}, укажи класс: !класс <название>. Доступные классы: {classes}')
             return
 
-        class_name = parts[1].strip().lower()
         if class_name not in self.classes:
             await ctx.send(f'{ctx.author.name}, класс "{class_name}" не существует.')
             return
 
-        if player.get('class'):
-            await ctx.send(f'{ctx.author.name}, ты уже выбрал класс: {player["class"]}.')
+        if player.player_class:
+            await ctx.send(f'{ctx.author.name}, ты уже выбрал класс: {player.player_class}.')
             return
 
-        player['class'] = class_name
+        player.player_class = class_name
+        player.invalidate_stats()
         # Обновляем HP при выборе класса
-        player['current_hp'] = calculate_hp(player['level']) + self.get_equipment_bonuses(player)[2]
-        self.save_players()
-        logging.info(f"{user} выбрал класс {class_name}")
+        player.current_hp = self.get_stats(player).max_hp
+        self.mark_dirty(user)
+        logging.info("%s выбрал класс %s", user, class_name)
         await ctx.send(f'{ctx.author.name}, ты выбрал класс: {class_name.capitalize()}.')
 
-    @commands.command(name='отдых')
+    @command('отдых', requires_character=True)
     async def cmd_full_heal(self, ctx):
         """Полностью восстановить HP за 5 золота."""
         user = ctx.author.name.lower()
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
 
         player = self.players[user]
         cost = 5
-        max_hp = calculate_hp(player['level']) + self.get_equipment_bonuses(player)[2]
+        max_hp = self.get_stats(player).max_hp
 
-        if player['current_hp'] >= max_hp:
+        if player.current_hp >= max_hp:
             await ctx.send(f'{ctx.author.name}, твоё здоровье и так полное!')
             return
 
-        if player['gold'] < cost:
+        if player.gold < cost:
             await ctx.send(f'{ctx.author.name}, у тебя недостаточно золота (нужно {cost}).')
             return
 
-        player['gold'] -= cost
-        player['current_hp'] = max_hp
-        self.save_players()
-        logging.info(f"{user} полностью восстановил HP за {cost} золота")
+        player.gold -= cost
+        player.current_hp = max_hp
+        self.mark_dirty(user)
+        logging.info("%s полностью восстановил HP за %s золота", user, cost)
         await ctx.send(f'🩺 {ctx.author.name}, ты полностью восстановил HP за {cost} золота!')
 
-    @commands.command(name='подарить')
-    async def cmd_gift(self, ctx):
+    @command('подарить', Nick('ник'), Text('предмет'),
+             usage='@{author}, формат отправки подарка: !подарок <имя персонажа> <название предмета из инвентаря>',
+             requires_character=True, own_transaction=True)
+    async def cmd_gift(self, ctx, target, item):
         """Подарить любой предмет из инвентаря другому игроку"""
         user = ctx.author.name.lower()
-        player = self.players[user]
-        parts = ctx.message.content.strip().split(maxsplit=2)
-
-        if user not in self.players:
-            await ctx.send(f'{ctx.author.name}, у тебя нет персонажа.')
-            return
-
-        if len(parts) != 3:
-            await ctx.send(f'@{user}, формат отправки подарка: !подарок <имя персонажа> <название предмета из инвентаря>')
+        item = item.capitalize()
+        item_slpit = item.split()
+        if target not in self.players:
+            await ctx.send(f'@{user}, {target} должен иметь персонажа!')
             return
-
-        if len(parts) == 3:
-            target = parts[1].lstrip('@').lower()
-            item = parts[2].capitalize()
-            item_slpit = item.split()
-            if target not in self.players:
-                await ctx.send(f'@{user}, {target} должен иметь персонажа!')
-                return
+        async with self.transaction(user, target):
+            player = self.players[user]
             if item_slpit[0] == 'Золото':
-                if item_slpit[1].isalpha():
+                if len(item_slpit) != 2 or not item_slpit[1].isdigit():
                     await ctx.send(f'@{user}, ты хоть сам понял что хочешь?)')
                     return
-                if int(item_slpit[1]) <= player['gold']:
-                    self.players[target]['gold'] += int(item_slpit[1])
-                    player['gold'] -= int(item_slpit[1])
-                    self.save_players()
+                if int(item_slpit[1]) <= player.gold:
+                    self.players[target].gold += int(item_slpit[1])
+                    player.gold -= int(item_slpit[1])
                     await ctx.send(f'@{user} подарил @{target} {int(item_slpit[1])} золотых монет!')
                     return
-                elif int(item_slpit[1]) > player['gold']:
+                elif int(item_slpit[1]) > player.gold:
                     await ctx.send(f'@{user}, у тебя нет столько золота!')
                     return
 
-            if item in player['inventory']:
-                self.players[target]['inventory'].append(item)
-                player['inventory'].remove(item)
-                self.save_players()
+            if item in player.inventory:
+                item = player.inventory.remove(item)
+                self.players[target].inventory.add(item)
                 await ctx.send(f'@{user} успешно передал @{target} предмет {item}')
                 return
 
-            if item not in player['inventory']:
+            if item not in player.inventory:
                 await ctx.send(f'@{user}, у тебя нет такого предмета в инвентаре!')
                 return
-            
-    @commands.command(name='команды')
+
+    @command('профиль', Amount('секунды', optional=True, default=PROFILE_SECONDS), moderator=True)
+    async def cmd_profile(self, ctx, seconds):
+        """Снять профиль бота и записать последние медленные команды (только модераторы)."""
+        seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+        prefix = self.start_profile(seconds)
+        if prefix is None:
+            await ctx.send(f'{ctx.author.name}, профиль уже снимается.')
+            return
+        await ctx.send(f'{ctx.author.name}, снимаю профиль {seconds} с, файлы: {prefix}.*')
+
+    @command('команды', read_only=True, shared=True)
     async def cmd_commands(self, ctx):
         user = ctx.author.name.lower()
 
         await ctx.send(f'@{user} для просмотра команд иди в описание канала!')
         return
 
-    @commands.command(name='милостыня')
+    @command('милостыня', requires_character=True)
     async def cmd_alms(self, ctx):
-        now = time.time()
+        now = self.clock()
         user = ctx.author.name.lower() # тута имя автора сообщения
         player = self.players[user] # тута вся стата перса
         gold = [0, 1, 2]
-        gold_given = random.choice(gold)
-        if 'alms_unteal' not in player:
-
-            player['alms_unteal'] = 0
-
-        if player['alms_unteal'] >= now:
-            await ctx.send(f'@{user}, шел бы ты, пока люлей не дали! До следующей попытки {int(player['alms_unteal'] - now)} секунд.')
+        gold_given = self.rng.choice(gold)
+        if player.alms_unteal >= now:
+            await ctx.send(f'@{user}, шел бы ты, пока люлей не дали! До следующей попытки {int(player.alms_unteal - now)} секунд.')
             return
 
-        player['alms_unteal'] = now + 300
-        player['gold'] += gold_given
-        self.save_players()
+        player.alms_unteal = now + 300
+        player.gold += gold_given
+        self.mark_dirty(user)
         await ctx.send(f'@{user}, тебе дали {gold_given} монет/у, благодари господа!')
         return
 
 
-bot = RPGbot()
-bot.run()
+def configure_logging():
+    """Направить журнал в LOG_FILE (см. logs.py). При импорте модуля журнал не настраивается."""
+    return setup_logging(LOG_FILE, LOG_MAX_BYTES, LOG_ROTATE_INTERVAL, LOG_BACKUPS)
+
+
+def main():
+    """Точка входа: python rpg_bot.py или python -m rpg_bot."""
+    configure_logging()
+    RPGbot().run()
+
+
+if __name__ == '__main__':
+    main()
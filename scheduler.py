@@ -0,0 +1,143 @@
+"""Планировщик отложенных вызовов: окончание тюрьмы и баффов, истечение дуэлей, смена чёрного рынка.
+
+Таймеры лежат в куче по сроку на монотонных часах, поэтому перевод системного времени их
+не сдвигает. Одна задача asyncio спит до ближайшего срока и вызывает колбэки; колбэк может
+быть корутинной функцией, тогда он запускается отдельной задачей. Таймер можно поставить
+с ключом: новый таймер с тем же ключом заменяет старый. Отменённые таймеры не ищутся в
+куче, а пропускаются при извлечении; когда их становится больше половины, куча пересобирается.
+"""
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+
+COMPACT_MIN = 64  # меньше стольких отменённых таймеров кучу не пересобираем
+
+
+class Timer:
+    """Отложенный вызов callback(*args) в момент deadline по часам планировщика."""
+
+    __slots__ = ('deadline', 'seq', 'key', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, seq, key, callback, args):
+        self.deadline = deadline
+        self.seq = seq
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+
+class Scheduler:
+    """Таймеры на одной задаче asyncio.
+
+    clock — монотонные часы для сроков, wall_clock — системные, в которых заданы сроки
+    call_at_epoch. При воспроизведении записанного чата оба — подменённые часы, а таймеры
+    вызывает run_due() между сообщениями.
+    """
+
+    def __init__(self, clock=time.monotonic, wall_clock=time.time):
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.heap = []
+        self.keys = {}  # ключ -> Timer
+        self.cancelled = 0
+        self.seq = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.fired = 0
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled
+
+    def call_later(self, delay, callback, *args, key=None):
+        """Вызвать callback(*args) через delay секунд. Таймер с тем же key заменяется."""
+        if key is not None:
+            self.cancel(key)
+        timer = Timer(self.clock() + max(delay, 0), next(self.seq), key, callback, args)
+        if key is not None:
+            self.keys[key] = timer
+        heapq.heappush(self.heap, timer)
+        if self.heap[0] is timer:
+            self.wakeup.set()  # новый таймер раньше всех — задача должна проснуться пораньше
+        return timer
+
+    def call_at_epoch(self, epoch, callback, *args, key=None):
+        """Вызвать callback в момент epoch по системным часам (так хранятся сроки у игроков)."""
+        return self.call_later(epoch - self.wall_clock(), callback, *args, key=key)
+
+    def cancel(self, key_or_timer):
+        """Отменить таймер по ключу или сам таймер. Отмена несуществующего ничего не делает."""
+        timer = self.keys.pop(key_or_timer, None) if not isinstance(key_or_timer, Timer) else key_or_timer
+        if timer is None or timer.cancelled:
+            return
+        if timer.key is not None and self.keys.get(timer.key) is timer:
+            del self.keys[timer.key]
+        timer.cancelled = True
+        self.cancelled += 1
+        if self.cancelled > COMPACT_MIN and self.cancelled * 2 > len(self.heap):
+            self.heap = [t for t in self.heap if not t.cancelled]
+            heapq.heapify(self.heap)
+            self.cancelled = 0
+
+    def pending(self, key):
+        """Стоит ли таймер с ключом key."""
+        return key in self.keys
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        """Спать до ближайшего срока и вызывать наступившие таймеры."""
+        while True:
+            while self.heap and self.heap[0].cancelled:
+                heapq.heappop(self.heap)
+                self.cancelled -= 1
+            delay = self.heap[0].deadline - self.clock() if self.heap else None
+            if delay is None or delay > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.fire(heapq.heappop(self.heap))
+
+    def run_due(self):
+        """Вызвать все наступившие таймеры без задачи asyncio. Сколько вызвано."""
+        fired = 0
+        while self.heap and (self.heap[0].cancelled or self.heap[0].deadline <= self.clock()):
+            timer = heapq.heappop(self.heap)
+            if timer.cancelled:
+                self.cancelled -= 1
+                continue
+            self.fire(timer)
+            fired += 1
+        return fired
+
+    def fire(self, timer):
+        if timer.key is not None and self.keys.get(timer.key) is timer:
+            del self.keys[timer.key]
+        self.fired += 1
+        try:
+            result = timer.callback(*timer.args)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result).add_done_callback(self.log_failure)
+        except Exception as e:
+            logging.error("Ошибка таймера %s: %s", timer.callback.__name__, e)
+
+    @staticmethod
+    def log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Ошибка таймера: %s", task.exception())
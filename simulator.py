@@ -0,0 +1,117 @@
+"""Симулятор боёв с монстрами для настройки баланса MONSTERS и ITEMS.
+
+Для каждой комбинации монстр × уровень × снаряжение разыгрывает тысячи боёв сразу
+массивами NumPy по тем же формулам, что и бот (combat.py), и печатает долю побед,
+среднее число раундов и ожидаемые XP и золото в минуту с учётом кулдауна !бой.
+
+Каждый бой начинается с полным HP; штраф за поражение (10% текущего XP) не учитывается,
+потому что зависит от накопленного XP игрока.
+
+Запуск:
+    python simulator.py [--fights 20000] [--levels 1,5,10,20,30,40 | 1-40] [--buff] [--csv grid.csv]
+"""
+import argparse
+import csv
+import sys
+import time
+
+import numpy as np
+
+from combat import calculate_hp, equipment_bonuses, damage_distribution, base_damage_range, scale_monster
+from consts import MONSTERS, CLASSES, FIGHT_COOLDOWN
+
+GEAR = {
+    'без экипировки': [],
+    'стартовая': ['Деревянный меч', 'Кожаная броня', 'Кожаный шлем'],
+    'средняя': ['Железный меч', 'Кольчуга', 'Железный шлем', 'Странно пахнущий мешочек'],
+    'лучшая': ['Драконий клык', 'Железный доспех', 'Железный шлем', 'Теневой змей'],
+}
+TAVERN_MULTIPLIER = 1.1
+
+
+def loadouts():
+    """Все сочетания класса и набора снаряжения: (название, класс, предметы)."""
+    for player_class in [None, *CLASSES]:
+        for gear_name, items in GEAR.items():
+            yield f'{player_class or "без класса"}, {gear_name}', player_class, items
+
+
+def simulate(rng, fights, player_hp, damage, monster_hp, monster_attack):
+    """Разыграть fights боёв сразу. Возвращает (доля побед, среднее число раундов)."""
+    # Игрок успевает ударить столько раз, сколько переживёт постоянных ударов монстра
+    strikes_alive = -(-player_hp // monster_attack) if monster_attack > 0 else None
+    strikes_needed = -(-monster_hp // damage.min)
+    rounds = strikes_needed if strikes_alive is None else min(strikes_needed, strikes_alive)
+    cum_weights = np.asarray(damage.cum_weights)
+    values = np.asarray(damage.values)
+    # Все броски урона разом: строка — бой, столбец — раунд
+    rolls = values[np.searchsorted(cum_weights, rng.integers(0, cum_weights[-1], size=(fights, rounds)), side='right')]
+    dealt = np.cumsum(rolls, axis=1)
+    killed = dealt >= monster_hp
+    won = killed.any(axis=1)
+    kill_round = np.where(won, killed.argmax(axis=1) + 1, rounds)
+    return float(won.mean()), float(kill_round.mean())
+
+
+def run_grid(levels, fights, buff, seed=0):
+    """Строки результатов по всей сетке монстр × уровень × снаряжение."""
+    rng = np.random.default_rng(seed)
+    multiplier = TAVERN_MULTIPLIER if buff else 1.0
+    fights_per_minute = 60 / FIGHT_COOLDOWN
+    rows = []
+    for loadout, player_class, items in loadouts():
+        bonus_min, bonus_max, hp_bonus = equipment_bonuses(items, player_class)
+        for level in levels:
+            damage = damage_distribution(*base_damage_range(level), bonus_min, bonus_max, multiplier)
+            player_hp = calculate_hp(level) + hp_bonus
+            for monster_name, monster in MONSTERS.items():
+                monster_hp, monster_attack = scale_monster(monster, level)
+                win_rate, mean_rounds = simulate(rng, fights, player_hp, damage, monster_hp, monster_attack)
+                rows.append({
+                    'monster': monster_name,
+                    'level': level,
+                    'loadout': loadout,
+                    'win_rate': win_rate,
+                    'mean_rounds': mean_rounds,
+                    'xp_per_minute': win_rate * sum(monster['xp_reward']) / 2 * fights_per_minute,
+                    'gold_per_minute': win_rate * sum(monster['gold_reward']) / 2 * fights_per_minute,
+                })
+    return rows
+
+
+def parse_levels(text):
+    """'1,5,10' или '1-40' в список уровней."""
+    if '-' in text:
+        first, last = text.split('-')
+        return list(range(int(first), int(last) + 1))
+    return [int(level) for level in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Симуляция боёв с монстрами по сетке монстр × уровень × снаряжение.')
+    parser.add_argument('--fights', type=int, default=20_000, help='боёв на каждую комбинацию')
+    parser.add_argument('--levels', type=parse_levels, default=[1, 5, 10, 20, 30, 40], help="'1,5,10' или '1-40'")
+    parser.add_argument('--buff', action='store_true', help='с баффом таверны (+10%% урона)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', help='записать всю сетку в CSV вместо таблицы')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = run_grid(args.levels, args.fights, args.buff, args.seed)
+    elapsed = time.perf_counter() - started
+
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        print(f'{"монстр":<10} {"ур.":>3} {"снаряжение":<26} {"победы":>7} {"раунды":>7} {"XP/мин":>7} {"золото/мин":>11}')
+        for row in rows:
+            print(f'{row["monster"]:<10} {row["level"]:>3} {row["loadout"]:<26} {row["win_rate"]:>7.1%} '
+                  f'{row["mean_rounds"]:>7.2f} {row["xp_per_minute"]:>7.1f} {row["gold_per_minute"]:>11.1f}')
+    print(f'{len(rows)} комбинаций по {args.fights} боёв за {elapsed:.1f} с', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
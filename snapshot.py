@@ -0,0 +1,209 @@
+"""Компактный двоичный снимок игроков с индексом для чтения отдельных записей через mmap.
+
+Устройство файла:
+    заголовок   — магия, версия формата, версия схемы игрока, число игроков, смещения схемы и индекса;
+    схема       — JSON-список имён полей, общих для всех игроков;
+    записи      — длина (u32), ник (u16 + UTF-8) и JSON-массив значений полей по схеме;
+                  поля, которых нет в схеме, идут последним элементом-словарём;
+    индекс      — отсортированные по хешу ника тройки (хеш, смещение записи, длина записи).
+
+Запуск как скрипта переводит снимок между форматами:
+    python snapshot.py to-binary players.json players.snap
+    python snapshot.py to-json players.snap players.json
+"""
+import gc
+import json
+import mmap
+import os
+import struct
+import sys
+from hashlib import blake2b
+
+MAGIC = b'RPGS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIQQ')  # магия, версия, версия схемы игрока, число игроков, смещение схемы, смещение индекса
+INDEX_ENTRY = struct.Struct('<QQI')  # хеш ника, смещение записи, длина записи
+RECORD_LENGTH = struct.Struct('<I')
+NAME_LENGTH = struct.Struct('<H')
+SCHEMA_KEY = '_schema_version'  # ключ версии схемы в players.json; ник Twitch не может начинаться с '_'
+
+
+def name_hash(name):
+    """Стабильный 64-битный хеш ника для индекса."""
+    return int.from_bytes(blake2b(name.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def common_fields(players):
+    """Поля, которые есть у каждого игрока, в порядке первого появления."""
+    fields = None
+    for player in players.values():
+        if fields is None:
+            fields = list(player)
+        elif not player.keys() >= set(fields):
+            fields = [field for field in fields if field in player]
+    return fields or []
+
+
+def encode_record(name, player, fields):
+    """Закодировать игрока в запись без повторения имён полей."""
+    values = [player[field] for field in fields]
+    extra = {key: value for key, value in player.items() if key not in fields}
+    if extra:
+        values.append(extra)
+    name_bytes = name.encode('utf-8')
+    payload = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return NAME_LENGTH.pack(len(name_bytes)) + name_bytes + payload
+
+
+def decode_record(record, fields):
+    """Раскодировать запись в (ник, игрок)."""
+    (name_length,) = NAME_LENGTH.unpack_from(record)
+    start = NAME_LENGTH.size
+    name = record[start:start + name_length].decode('utf-8')
+    values = json.loads(record[start + name_length:])
+    player = dict(zip(fields, values))
+    if len(values) > len(fields):
+        player.update(values[-1])
+    return name, player
+
+
+def write_snapshot(path, players, schema_version=0):
+    """Записать всех игроков в двоичный снимок. Файл подменяется атомарно."""
+    fields = common_fields(players)
+    schema = json.dumps(fields, ensure_ascii=False).encode('utf-8')
+    index = []
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0))
+        schema_offset = f.tell()
+        f.write(RECORD_LENGTH.pack(len(schema)) + schema)
+        for name, player in players.items():
+            record = encode_record(name, player, fields)
+            offset = f.tell()
+            f.write(RECORD_LENGTH.pack(len(record)) + record)
+            index.append((name_hash(name), offset + RECORD_LENGTH.size, len(record)))
+        index.sort()
+        index_offset = f.tell()
+        f.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in index))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, schema_version, len(index), schema_offset, index_offset))
+    os.replace(tmp_path, path)
+
+
+class SnapshotReader:
+    """Чтение двоичного снимка через mmap: отдельный игрок читается без разбора всего файла."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.schema_version, self.count, schema_offset, self.index_offset = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise IOError(f"{path} не является двоичным снимком игроков версии {VERSION}")
+        (schema_length,) = RECORD_LENGTH.unpack_from(self.data, schema_offset)
+        start = schema_offset + RECORD_LENGTH.size
+        self.fields = json.loads(self.data[start:start + schema_length])
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def find(self, name):
+        """Найти (смещение, длина) записи игрока двоичным поиском по индексу."""
+        target = name_hash(name)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if INDEX_ENTRY.unpack_from(self.data, self.index_offset + mid * INDEX_ENTRY.size)[0] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        # У разных ников может совпасть хеш: проверяем все записи с ним
+        while lo < self.count:
+            entry_hash, offset, length = INDEX_ENTRY.unpack_from(self.data, self.index_offset + lo * INDEX_ENTRY.size)
+            if entry_hash != target:
+                break
+            (name_length,) = NAME_LENGTH.unpack_from(self.data, offset)
+            start = offset + NAME_LENGTH.size
+            if self.data[start:start + name_length] == name.encode('utf-8'):
+                return offset, length
+            lo += 1
+        return None
+
+    def get(self, name):
+        """Прочитать одного игрока или None, если его нет в снимке."""
+        location = self.find(name)
+        if location is None:
+            return None
+        offset, length = location
+        return decode_record(self.data[offset:offset + length], self.fields)[1]
+
+    def items(self):
+        """Все игроки в порядке записи: список (ник, игрок)."""
+        data, fields = self.data, self.fields
+        pos = HEADER.size
+        (schema_length,) = RECORD_LENGTH.unpack_from(data, pos)
+        pos += RECORD_LENGTH.size + schema_length
+        names, payloads = [], []
+        while pos < self.index_offset:
+            (length,) = RECORD_LENGTH.unpack_from(data, pos)
+            (name_length,) = NAME_LENGTH.unpack_from(data, pos + RECORD_LENGTH.size)
+            start = pos + RECORD_LENGTH.size + NAME_LENGTH.size
+            names.append(data[start:start + name_length].decode('utf-8'))
+            payloads.append(data[start + name_length:pos + RECORD_LENGTH.size + length])
+            pos += RECORD_LENGTH.size + length
+        # Один разбор JSON на все записи заметно быстрее, чем по вызову на игрока
+        all_values = json.loads(b'[' + b','.join(payloads) + b']')
+        result = []
+        width = len(fields)
+        for name, values in zip(names, all_values):
+            player = dict(zip(fields, values))
+            if len(values) > width:
+                player.update(values[-1])
+            result.append((name, player))
+        return result
+
+    def close(self):
+        """Закрыть отображение файла."""
+        self.data.close()
+
+
+def read_snapshot(path):
+    """Прочитать всех игроков из двоичного снимка: (игроки, версия схемы)."""
+    reader = SnapshotReader(path)
+    # Сборщик мусора зря обходит миллионы только что созданных словарей, пока идёт разбор
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return dict(reader.items()), reader.schema_version
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+        reader.close()
+
+
+def json_to_binary(json_path, binary_path):
+    """Перевести players.json в двоичный снимок."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if SCHEMA_KEY in data:
+        write_snapshot(binary_path, data['players'], data[SCHEMA_KEY])
+    else:
+        write_snapshot(binary_path, data)
+
+
+def binary_to_json(binary_path, json_path):
+    """Перевести двоичный снимок обратно в players.json."""
+    players, schema_version = read_snapshot(binary_path)
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({SCHEMA_KEY: schema_version, 'players': players}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    converters = {'to-binary': json_to_binary, 'to-json': binary_to_json}
+    if len(sys.argv) != 4 or sys.argv[1] not in converters:
+        sys.exit('Использование: python snapshot.py to-binary|to-json <откуда> <куда>')
+    converters[sys.argv[1]](sys.argv[2], sys.argv[3])
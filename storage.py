@@ -0,0 +1,690 @@
+import asyncio
+import json
+import os
+import shutil
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from filelock import FileLock
+import snapshot
+from player import Player
+
+
+class JsonStorage:
+    """Хранение всех игроков одним файлом-снимком с резервной копией.
+
+    Снимок пишется в JSON или, если binary, в компактном двоичном формате из snapshot.py.
+    Вместе с игроками хранится версия схемы, в которой они записаны (см. migrations.py).
+    """
+
+    pageable = False  # умеет ли хранилище читать отдельных игроков по нику
+
+    def __init__(self, path, schema_version, binary=False):
+        self.path = path
+        self.schema_version = schema_version
+        self.binary = binary
+        self.lock = FileLock(f"{path}.lock")
+        self.serialized = None  # ник -> словарь игрока в том виде, в каком он последний раз ушёл на запись
+
+    def read_snapshot(self):
+        """Прочитать полный снимок игроков: (игроки, версия схемы). Вызывать под блокировкой."""
+        if not os.path.exists(self.path):
+            logging.info("Файл %s не существует, создаётся пустой словарь игроков.", self.path)
+            return {}, self.schema_version
+        if self.binary:
+            return snapshot.read_snapshot(self.path)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+        if not content:
+            logging.warning("Файл %s пуст.", self.path)
+            return {}, self.schema_version
+        data = json.loads(content)
+        # Файлы до появления версий схемы — просто словарь игроков
+        if snapshot.SCHEMA_KEY not in data:
+            return data, 0
+        return data['players'], data[snapshot.SCHEMA_KEY]
+
+    def write_snapshot(self, players):
+        """Записать полный снимок игроков с резервной копией. Вызывать под блокировкой."""
+        if os.path.exists(self.path):
+            shutil.copy(self.path, f"{self.path}.bak")
+            logging.info("Создана резервная копия %s.bak", self.path)
+        if self.binary:
+            snapshot.write_snapshot(self.path, players, self.schema_version)
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({snapshot.SCHEMA_KEY: self.schema_version, 'players': players}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Загрузить всех игроков: (игроки, версия схемы)."""
+        with self.lock:
+            players, version = self.read_snapshot()
+        if self.serialized is None:
+            # Словари загруженных игроков и есть их данные для записи (migrate правит их на месте)
+            self.serialized = dict(players)
+        return players, version
+
+    def rewrite(self, players):
+        """Переписать всех игроков целиком в текущей версии схемы."""
+        with self.lock:
+            self.write_snapshot(players)
+
+    def rank_entries(self):
+        """(ник, уровень, XP) всех игроков для рейтинга. Снимок приходится прочитать целиком."""
+        players, _ = self.load()
+        return [(name, player['level'], player['xp']) for name, player in players.items()]
+
+    def snapshot(self, players, dirty):
+        """Снять данные для записи: заново сериализуются только изменённые игроки, остальные
+        берутся из прошлых записей. Сам файл переписывается целиком в потоке ввода-вывода."""
+        serialized = self.serialized
+        if serialized is None:
+            serialized = self.serialized = {}
+        for user in dirty:
+            player = players.get(user)
+            if player is not None:
+                serialized[user] = player.to_dict()
+        if len(serialized) != len(players):
+            for user in serialized.keys() - players.keys():
+                del serialized[user]
+            for user in players.keys() - serialized.keys():
+                serialized[user] = players[user].to_dict()
+        # Словари игроков не меняются после to_dict(), поэтому потоку записи хватает копии верхнего уровня
+        return dict(serialized)
+
+    def write(self, payload):
+        """Записать снятые данные. Выполняется в потоке ввода-вывода."""
+        with self.lock:
+            self.write_snapshot(payload)
+        logging.info("Данные игроков сохранены в %s", self.path)
+
+    def close(self):
+        """Освободить ресурсы хранилища."""
+
+
+class JournalStorage(JsonStorage):
+    """Снимок в JSON плюс журнал изменений, в который дописывается по строке на игрока.
+
+    Когда журнал перерастает max_bytes, он откладывается в сторону, а фоновый поток
+    вливает его в снимок. При загрузке снимок дополняется записями журналов.
+
+    С двоичным снимком отдельного игрока можно прочитать без загрузки всех: сначала
+    ищется его последняя запись в ещё не влитых журналах, затем — в индексе снимка.
+    """
+
+    def __init__(self, path, schema_version, max_bytes, binary=False):
+        super().__init__(path, schema_version, binary)
+        self.journal_path = f"{path}.journal"
+        self.sealed_path = f"{path}.journal.old"
+        self.max_bytes = max_bytes
+        self.journal = None
+        self.compactor = None
+        # Поколения журналов: отложенный журнал старше текущего на одно поколение
+        self.generation = 1
+        self.sealed_generation = 0
+        self.merged_generation = -1
+        self.purged_generation = -1
+        self.recent = None  # ник -> (поколение, строка журнала) для записей, ещё не влитых в снимок
+        self.reader = None
+
+    @property
+    def pageable(self):
+        return self.binary
+
+    @staticmethod
+    def replay(path, players):
+        """Применить записи журнала к словарю игроков."""
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Обычно это недописанная последняя строка после падения
+                    logging.warning("Пропущена повреждённая запись журнала %s", path)
+                    continue
+                players[record['u']] = record['p']
+
+    def load(self):
+        """Загрузить снимок и повторить поверх него отложенный и текущий журналы.
+
+        Записи журналов считаются записанными в версии схемы снимка: при переходе на новую
+        версию журналы вливаются в снимок и удаляются (см. rewrite).
+        """
+        with self.lock:
+            players, version = self.read_snapshot()
+            if not os.path.exists(self.path) and self.has_journals():
+                # Журналы без снимка могли остаться от бота без версий схемы
+                version = 0
+            self.replay(self.sealed_path, players)
+            self.replay(self.journal_path, players)
+        return players, version
+
+    def has_journals(self):
+        """Есть ли на диске журналы, ещё не влитые в снимок."""
+        return os.path.exists(self.journal_path) or os.path.exists(self.sealed_path)
+
+    def stored_version(self):
+        """Версия схемы сохранённых игроков без загрузки их всех. Только для двоичного снимка."""
+        if os.path.exists(self.path):
+            reader = snapshot.SnapshotReader(self.path)
+            try:
+                return reader.schema_version
+            finally:
+                reader.close()
+        return 0 if self.has_journals() else self.schema_version
+
+    def rewrite(self, players):
+        """Переписать всех игроков в снимок текущей версии и удалить журналы."""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        with self.lock:
+            self.write_snapshot(players)
+            for path in (self.sealed_path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.recent = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def snapshot(self, players, dirty):
+        """Закодировать по записи журнала на каждого изменённого игрока."""
+        return [
+            (user, json.dumps({'u': user, 'p': players[user].to_dict()}, ensure_ascii=False, separators=(',', ':')) + '\n')
+            for user in dirty if user in players
+        ]
+
+    def write(self, payload):
+        """Дописать записи в журнал. Выполняется в потоке ввода-вывода."""
+        if not payload:
+            return
+        if self.journal is None:
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.journal.write(''.join(line for _, line in payload))
+        self.journal.flush()
+        if self.recent is not None:
+            for user, line in payload:
+                self.recent[user] = (self.generation, line)
+        if self.journal.tell() >= self.max_bytes:
+            self.start_compaction()
+
+    def start_compaction(self):
+        """Отложить текущий журнал и запустить его слияние со снимком в фоне."""
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        # Если прошлое слияние не удалось, отложенный журнал ещё на месте: сначала доливаем его
+        if not os.path.exists(self.sealed_path):
+            self.journal.close()
+            self.journal = None
+            os.replace(self.journal_path, self.sealed_path)
+            self.sealed_generation = self.generation
+            self.generation += 1
+        self.compactor = threading.Thread(target=self.compact, args=(self.sealed_generation,),
+                                          name='journal-compactor', daemon=True)
+        self.compactor.start()
+
+    def compact(self, generation):
+        """Влить отложенный журнал в снимок. Выполняется в фоновом потоке."""
+        try:
+            with self.lock:
+                players, _ = self.read_snapshot()
+                self.replay(self.sealed_path, players)
+                self.write_snapshot(players)
+                os.remove(self.sealed_path)
+            self.merged_generation = generation
+            logging.info("Журнал %s влит в снимок %s", self.sealed_path, self.path)
+        except (ValueError, IOError) as e:
+            logging.error("Ошибка слияния журнала %s: %s", self.sealed_path, e)
+
+    def refresh_index(self):
+        """Подготовить чтение отдельных игроков. Выполняется в потоке ввода-вывода."""
+        if self.recent is None:
+            self.recent = {}
+            for generation, path in ((self.sealed_generation, self.sealed_path), (self.generation, self.journal_path)):
+                if not os.path.exists(path):
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            self.recent[json.loads(line)['u']] = (generation, line)
+                        except json.JSONDecodeError:
+                            continue
+        if self.merged_generation > self.purged_generation:
+            # Слитые записи уже есть в новом снимке: забываем их и переоткрываем снимок
+            merged = self.purged_generation = self.merged_generation
+            self.recent = {user: entry for user, entry in self.recent.items() if entry[0] > merged}
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+        if self.reader is None and os.path.exists(self.path):
+            self.reader = snapshot.SnapshotReader(self.path)
+
+    def load_some(self, names):
+        """Прочитать указанных игроков, которые есть в хранилище. Выполняется в потоке ввода-вывода."""
+        self.refresh_index()
+        found = {}
+        for name in names:
+            if name in self.recent:
+                found[name] = json.loads(self.recent[name][1])['p']
+            elif self.reader is not None:
+                player = self.reader.get(name)
+                if player is not None:
+                    found[name] = player
+        return found
+
+    def close(self):
+        """Закрыть журнал и дождаться фонового слияния."""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.compactor is not None:
+            self.compactor.join()
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+class SqliteStorage:
+    """Хранение игроков в SQLite: строка на игрока, запись только изменённых строк.
+
+    Уровень, XP, золото и победы в PvP лежат в отдельных индексированных колонках,
+    инвентарь и экипировка — в JSON-колонках, остальные поля — в колонке data.
+    Версия схемы игроков хранится в PRAGMA user_version.
+
+    Если база пуста, а рядом лежит сохранение прежнего хранилища (legacy_paths: players.json
+    с журналом или двоичный снимок), при загрузке оно один раз переносится в базу.
+    """
+
+    pageable = True
+    COLUMNS = ('level', 'xp', 'gold', 'pvp_wins')
+    JSON_COLUMNS = ('inventory', 'equipment')
+    UPSERT = """
+        INSERT INTO players (name, level, xp, gold, pvp_wins, inventory, equipment, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET
+            level = excluded.level, xp = excluded.xp, gold = excluded.gold,
+            pvp_wins = excluded.pvp_wins, inventory = excluded.inventory,
+            equipment = excluded.equipment, data = excluded.data
+    """
+
+    def __init__(self, path, schema_version, legacy_paths=()):
+        self.path = path
+        self.schema_version = schema_version
+        self.legacy_paths = legacy_paths  # [(путь, двоичный ли снимок)]
+        # Соединением пользуется только поток ввода-вывода, по одной операции за раз
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS players (
+                name TEXT PRIMARY KEY,
+                level INTEGER NOT NULL,
+                xp INTEGER NOT NULL,
+                gold INTEGER NOT NULL,
+                pvp_wins INTEGER NOT NULL,
+                inventory TEXT NOT NULL,
+                equipment TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS players_rank ON players (level DESC, xp DESC);
+            CREATE INDEX IF NOT EXISTS players_gold ON players (gold);
+            CREATE INDEX IF NOT EXISTS players_pvp_wins ON players (pvp_wins);
+        """)
+
+    def to_row(self, name, player):
+        """Разложить игрока по колонкам таблицы."""
+        rest = {k: v for k, v in player.items() if k not in self.COLUMNS and k not in self.JSON_COLUMNS}
+        return (
+            name,
+            *(player.get(column, 0) for column in self.COLUMNS),
+            *(json.dumps(player.get(column), ensure_ascii=False) for column in self.JSON_COLUMNS),
+            json.dumps(rest, ensure_ascii=False),
+        )
+
+    def from_row(self, row):
+        """Собрать игрока из строки таблицы."""
+        name, level, xp, gold, pvp_wins, inventory, equipment, data = row
+        player = json.loads(data)
+        player.update(level=level, xp=xp, gold=gold, pvp_wins=pvp_wins,
+                      inventory=json.loads(inventory), equipment=json.loads(equipment))
+        return name, player
+
+    def load(self):
+        """Загрузить всех игроков: (игроки, версия схемы)."""
+        try:
+            rows = self.db.execute('SELECT name, level, xp, gold, pvp_wins, inventory, equipment, data FROM players')
+            players, version = dict(self.from_row(row) for row in rows), self.stored_version()
+        except sqlite3.Error as e:
+            raise IOError(e) from e
+        if not players:
+            players, version = self.import_legacy(version)
+        return players, version
+
+    def legacy_save(self):
+        """(путь, двоичный ли) сохранения для переноса, если база пуста и оно есть; иначе None."""
+        try:
+            if self.db.execute('SELECT 1 FROM players LIMIT 1').fetchone() is not None:
+                return None
+        except sqlite3.Error as e:
+            raise IOError(e) from e
+        return next(((path, binary) for path, binary in self.legacy_paths if os.path.exists(path)), None)
+
+    def import_legacy(self, version):
+        """Перенести в пустую базу сохранение прежнего хранилища: (игроки, версия схемы).
+
+        Сохранение той же версии схемы записывается сразу одной транзакцией; более старое
+        возвращается как есть — PlayerStore.load проведёт его через migrate и запишет так же.
+        """
+        legacy = self.legacy_save()
+        if legacy is None:
+            logging.info("База %s пуста, сохранения для переноса нет", self.path)
+            return {}, version
+        path, binary = legacy
+        players, version = JournalStorage(path, self.schema_version, 0, binary).load()
+        if version == self.schema_version:
+            self.rewrite(players)
+        logging.info("Перенесено в базу %s из %s игроков: %s (схема %s)", self.path, path, len(players), version)
+        print(f"📦 Перенесено в {self.path} из {path} игроков: {len(players)}")
+        return players, version
+
+    def stored_version(self):
+        """Версия схемы игроков в базе. Пока в пустую базу не перенесено сохранение рядом с ней — 0,
+        чтобы PlayerStore загрузил её целиком и перенос состоялся и в режиме вытеснения."""
+        if self.legacy_save() is not None:
+            return 0
+        return self.db.execute('PRAGMA user_version').fetchone()[0]
+
+    def rewrite(self, players):
+        """Переписать всех игроков и версию схемы одной транзакцией."""
+        try:
+            with self.db:
+                self.db.executemany(self.UPSERT, [self.to_row(name, player) for name, player in players.items()])
+                self.db.execute(f'PRAGMA user_version = {int(self.schema_version)}')
+        except sqlite3.Error as e:
+            raise IOError(e) from e
+
+    def load_some(self, names):
+        """Прочитать указанных игроков, которые есть в базе. Выполняется в потоке ввода-вывода."""
+        names = list(names)
+        try:
+            rows = self.db.execute(
+                'SELECT name, level, xp, gold, pvp_wins, inventory, equipment, data FROM players '
+                f'WHERE name IN ({", ".join("?" * len(names))})', names
+            )
+            return dict(self.from_row(row) for row in rows)
+        except sqlite3.Error as e:
+            raise IOError(e) from e
+
+    def snapshot(self, players, dirty):
+        """Разложить по строкам только изменённых игроков."""
+        return [self.to_row(user, players[user].to_dict()) for user in dirty if user in players]
+
+    def write(self, payload):
+        """Записать строки одной транзакцией. Выполняется в потоке ввода-вывода."""
+        if not payload:
+            return
+        try:
+            self.save_rows(payload)
+        except sqlite3.Error as e:
+            raise IOError(e) from e
+        logging.info("Сохранено игроков в %s: %s", self.path, len(payload))
+
+    def save_rows(self, rows):
+        """Вставить или обновить строки игроков одной транзакцией."""
+        with self.db:
+            self.db.executemany(self.UPSERT, rows)
+
+    def rank_entries(self):
+        """(ник, уровень, XP) всех игроков для рейтинга без чтения остальных полей."""
+        try:
+            return self.db.execute('SELECT name, level, xp FROM players').fetchall()
+        except sqlite3.Error as e:
+            raise IOError(e) from e
+
+    def close(self):
+        """Закрыть базу данных."""
+        self.db.close()
+
+
+def open_storage(backend, path, schema_version, journal_max_bytes=4 * 1024 * 1024, snapshot_format='json'):
+    """Создать хранилище игроков по имени из настроек. Записывать игроков оно будет в версии schema_version."""
+    if snapshot_format not in ('json', 'binary'):
+        raise ValueError(f"Неизвестный формат снимка: {snapshot_format}")
+    binary = snapshot_format == 'binary'
+    if backend == 'json':
+        return JsonStorage(path, schema_version, binary)
+    if backend == 'journal':
+        return JournalStorage(path, schema_version, journal_max_bytes, binary)
+    if backend == 'sqlite':
+        # Сохранение, которое при переходе на SQLite лежит рядом: players.db <- players.json или players.snap
+        stem = os.path.splitext(path)[0]
+        legacy = [(stem + suffix, binary) for suffix, binary in (('.json', False), ('.snap', True)) if stem + suffix != path]
+        return SqliteStorage(path, schema_version, legacy)
+    raise ValueError(f"Неизвестное хранилище игроков: {backend}")
+
+
+class PlayerStore:
+    """Игроки в памяти (объекты Player) и отложенная запись изменённых в хранилище.
+
+    Данные для записи снимаются в потоке событий, а на диск уходят через единственный
+    поток ввода-вывода. Записи выполняются строго по очереди, поэтому более ранний
+    снимок никогда не перезапишет более поздний.
+
+    Если задан capacity и хранилище умеет читать игроков по одному, в памяти живут только
+    недавно активные игроки: остальные подгружаются при первом обращении, а самые давно
+    не использованные вытесняются. Порядок ключей players — порядок давности обращений.
+    Изменённый игрок вытесняется только после того, как его запись удалась: иначе
+    следующая запись уже не нашла бы его в памяти, а чтение вернуло бы старую копию с диска.
+
+    Если игроки сохранены в старой версии схемы, при загрузке они один раз проходят через
+    migrate(players, version) и сразу переписываются в хранилище в версии storage.schema_version.
+    """
+
+    def __init__(self, storage, save_interval, max_unsaved_seconds, capacity=0, migrate=None):
+        self.storage = storage
+        self.save_interval = save_interval
+        self.max_unsaved_seconds = max_unsaved_seconds
+        self.capacity = capacity
+        self.paged = bool(capacity) and storage.pageable
+        if capacity and not storage.pageable:
+            logging.warning("Хранилище не умеет читать игроков по одному, все игроки остаются в памяти")
+        self.migrate = migrate
+        self.loaded = False  # пока игроки не загружены, запись затёрла бы сохранение
+        self.players = OrderedDict()
+        self.pins = Counter()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dirty = set()
+        self.dirty_since = None
+        self.failed = set()
+        self.failed_lock = threading.Lock()
+        self.io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage-io')
+        self.pending = None
+        self.writes = deque()  # (future, ники) поставленных записей в порядке очереди
+        self.writing = Counter()  # ник -> сколько поставленных записей ещё не завершились
+
+    def load(self):
+        """Загрузить всех игроков из хранилища. В режиме вытеснения игроки подгружаются по мере обращений."""
+        if self.paged and self.storage.stored_version() == self.storage.schema_version:
+            self.loaded = True
+            return self.players
+        players, version = self.storage.load()
+        if version > self.storage.schema_version:
+            raise ValueError(f"данные записаны более новой версией бота (схема {version}, "
+                             f"поддерживается {self.storage.schema_version})")
+        if version < self.storage.schema_version:
+            started = time.perf_counter()
+            if self.migrate is not None:
+                self.migrate(players, version)
+            self.storage.rewrite(players)
+            logging.info("Игроки переведены со схемы %s на %s за %.2f с: %s", version, self.storage.schema_version,
+                         time.perf_counter() - started, len(players))
+        if not self.paged:
+            self.players = OrderedDict((name, Player.from_dict(player)) for name, player in players.items())
+        self.loaded = True
+        return self.players
+
+    def rank_entries(self):
+        """(ник, уровень, XP) всех игроков, в том числе тех, кого нет в памяти."""
+        if self.paged:
+            return self.storage.rank_entries()
+        return [(name, player.level, player.xp) for name, player in self.players.items()]
+
+    def pin(self, names):
+        """Запретить вытеснять игроков, пока с ними работает команда."""
+        self.pins.update(names)
+
+    def unpin(self, names):
+        """Снять запрет на вытеснение."""
+        self.pins.subtract(names)
+        for name in names:
+            if self.pins[name] <= 0:
+                del self.pins[name]
+
+    async def prefetch(self, names):
+        """Подгрузить с диска игроков, которых нет в памяти, и отметить обращение к остальным."""
+        missing = []
+        for name in names:
+            if name in self.players:
+                self.players.move_to_end(name)
+                self.hits += 1
+            else:
+                missing.append(name)
+        if missing and self.paged:
+            loaded = await self.run(self.storage.load_some, missing)
+            for name, player in loaded.items():
+                # Пока шло чтение, игрок мог появиться в памяти — тогда верна именно эта копия
+                if name not in self.players:
+                    self.players[name] = Player.from_dict(player)
+                    self.misses += 1
+            self.evict()
+
+    def evict(self):
+        """Вытеснить давно не использованных игроков сверх capacity.
+
+        Изменённые игроки остаются в памяти, пока их запись не завершится успешно: для них
+        ставится запись, а вытеснит их одна из следующих подгрузок.
+        """
+        overflow = len(self.players) - self.capacity
+        if not self.paged or overflow <= 0:
+            return
+        self.forget_writes()
+        with self.failed_lock:
+            failed = set(self.failed)
+        victims = []
+        unsaved = False
+        for name in self.players:
+            if len(victims) >= overflow:
+                break
+            if self.pins[name]:
+                continue
+            if name in self.dirty:
+                unsaved = True
+            elif name not in self.writing and name not in failed:
+                victims.append(name)
+        if unsaved:
+            self.schedule_write()
+        for name in victims:
+            del self.players[name]
+        self.evictions += len(victims)
+
+    def forget_writes(self):
+        """Снять завершившиеся записи с учёта. Записи идут по очереди, поэтому проверяются с начала.
+        Чья запись не удалась, тот остаётся в failed до повторной записи."""
+        while self.writes and self.writes[0][0].done():
+            _, names = self.writes.popleft()
+            self.writing.subtract(names)
+            for name in names:
+                if self.writing[name] <= 0:
+                    del self.writing[name]
+
+    def cache_stats(self):
+        """Счётчики кэша игроков для подбора его размера."""
+        lookups = self.hits + self.misses
+        return {
+            'resident': len(self.players),
+            'capacity': self.capacity if self.paged else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 1.0,
+        }
+
+    def mark_dirty(self, *users):
+        """Пометить игроков изменёнными. На диск их запишет фоновый флашер."""
+        self.dirty.update(users)
+        now = time.monotonic()
+        if self.dirty_since is None:
+            self.dirty_since = now
+        # Гарантия: изменения не живут несохранёнными дольше max_unsaved_seconds,
+        # даже если флашер по какой-то причине не успел отработать
+        if self.save_interval <= 0 or now - self.dirty_since >= self.max_unsaved_seconds:
+            self.schedule_write()
+
+    def unsaved_seconds(self):
+        """Сколько секунд самое старое несохранённое изменение ждёт записи."""
+        if self.dirty_since is None:
+            return 0.0
+        return time.monotonic() - self.dirty_since
+
+    def schedule_write(self):
+        """Снять данные изменённых игроков и поставить их запись в очередь потока ввода-вывода."""
+        with self.failed_lock:
+            self.dirty |= self.failed
+            self.failed.clear()
+        if not self.dirty:
+            return self.pending
+        if not self.loaded:
+            logging.error("Игроки не загружены из %s, изменения не записываются: %s", self.storage.path, len(self.dirty))
+            return self.pending
+        dirty, self.dirty, self.dirty_since = self.dirty, set(), None
+        payload = self.storage.snapshot(self.players, dirty)
+        self.pending = self.io.submit(self.write, payload, dirty)
+        if self.paged:
+            self.writes.append((self.pending, dirty))
+            self.writing.update(dirty)
+        return self.pending
+
+    def write(self, payload, dirty):
+        """Записать данные в хранилище. Выполняется в потоке ввода-вывода."""
+        try:
+            self.storage.write(payload)
+        except IOError as e:
+            logging.error("Ошибка сохранения %s: %s", self.storage.path, e)
+            print(f"⚠️ Ошибка сохранения {self.storage.path}: {e}")
+            # Неудачно записанные игроки попадут в следующую запись
+            with self.failed_lock:
+                self.failed |= dirty
+
+    async def run(self, func, *args):
+        """Выполнить операцию с хранилищем в потоке ввода-вывода после уже поставленных записей."""
+        return await asyncio.wrap_future(self.io.submit(func, *args))
+
+    async def flush(self):
+        """Записать все изменения и дождаться, пока они окажутся на диске."""
+        pending = self.schedule_write()
+        if pending is not None:
+            await asyncio.wrap_future(pending)
+
+    async def flush_loop(self):
+        """Фоновая запись изменённых игроков не чаще раза в save_interval секунд."""
+        while True:
+            await asyncio.sleep(self.save_interval)
+            if self.dirty or self.failed:
+                self.schedule_write()
+
+    def close(self):
+        """Дописать оставшиеся изменения, остановить поток ввода-вывода и закрыть хранилище."""
+        logging.info("Кэш игроков: %s", self.cache_stats())
+        self.schedule_write()
+        self.io.shutdown(wait=True)
+        self.storage.close()
@@ -0,0 +1,111 @@
+"""Атомарные изменения нескольких игроков.
+
+Обработчики команд меняют игроков между await: проверили золото, подождали кулдаун или
+отправку сообщения, списали. Если в это время другая команда трогает того же игрока,
+золото теряется или удваивается. Transaction берёт замки игроков — каждый игрок свой
+asyncio.Lock, общего замка нет, поэтому команды с разными игроками идут параллельно.
+Замки берутся в порядке ников, поэтому две транзакции над одними и теми же игроками не
+могут ждать друг друга по кругу.
+
+    async with self.transaction(user, target):
+        ...  # проверки и изменения обоих игроков
+
+Если блок завершился исключением, игроки возвращаются в состояние на входе в транзакцию.
+Rollback откатывает изменения без ошибки, например когда условие перестало выполняться.
+Изменённые игроки помечаются для сохранения только при успешном завершении.
+
+Откат возвращает игрока целиком, поэтому менять игрока вне его замка нельзя: иначе откат
+чужой транзакции сотрёт это изменение. Команды одного игрока dispatch.command сам выполняет
+в транзакции автора, таймеры эффектов берут её явно.
+"""
+import asyncio
+
+from player import Player
+
+
+class Rollback(Exception):
+    """Отменить транзакцию: игроки вернутся в исходное состояние, исключение дальше не пойдёт."""
+
+
+class PlayerLocks:
+    """Замки игроков. Замок живёт, пока его держат или ждут, потом удаляется."""
+
+    def __init__(self):
+        self.locks = {}  # ник -> [asyncio.Lock, сколько транзакций держат или ждут]
+
+    def __len__(self):
+        return len(self.locks)
+
+    async def acquire(self, names):
+        """Взять замки names по порядку. names должны быть отсортированы и без повторов."""
+        taken = []
+        try:
+            for name in names:
+                entry = self.locks.get(name)
+                if entry is None:
+                    entry = self.locks[name] = [asyncio.Lock(), 0]
+                entry[1] += 1
+                try:
+                    await entry[0].acquire()
+                except BaseException:
+                    self.forget(name)
+                    raise
+                taken.append(name)
+        except BaseException:
+            self.release(taken)
+            raise
+
+    def release(self, names):
+        for name in names:
+            self.locks[name][0].release()
+            self.forget(name)
+
+    def forget(self, name):
+        entry = self.locks[name]
+        entry[1] -= 1
+        if not entry[1]:
+            del self.locks[name]
+
+
+class Transaction:
+    """Изменение игроков names под их замками: целиком применяется или целиком откатывается."""
+
+    def __init__(self, locks, players, names, commit):
+        self.locks = locks
+        self.players = players
+        self.names = sorted(set(names))
+        self.commit = commit  # commit(*ники) — пометить изменённых игроков для сохранения
+        self.before = None
+
+    async def __aenter__(self):
+        await self.locks.acquire(self.names)
+        # Снимок берётся уже под замками: до этого игроков могла менять другая транзакция
+        self.before = {name: self.players[name].to_dict() if name in self.players else None
+                       for name in self.names}
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                changed = [name for name, data in self.before.items() if self.state(name) != data]
+                if changed:
+                    self.commit(*changed)
+            else:
+                self.rollback()
+        finally:
+            self.locks.release(self.names)
+        return exc_type is not None and issubclass(exc_type, Rollback)
+
+    def state(self, name):
+        player = self.players.get(name)
+        return None if player is None else player.to_dict()
+
+    def rollback(self):
+        """Вернуть игроков к снимку. Объекты Player остаются теми же, меняются только поля."""
+        for name, data in self.before.items():
+            if data is None:
+                self.players.pop(name, None)
+            elif name in self.players:
+                self.players[name].restore(data)
+            else:
+                self.players[name] = Player.from_dict(data)